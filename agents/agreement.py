@@ -0,0 +1,132 @@
+"""
+Inter-annotator agreement for label-style tasks.
+
+All annotations of a task are encoded into NumPy arrays once, then per-item
+majority labels, per-item agreement, Fleiss' kappa, pairwise Cohen's kappa and
+per-annotator agreement rates are computed with vectorized operations. Items
+whose agreement falls below a threshold are the only ones that need an LLM
+quality review.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+@dataclass
+class AgreementReport:
+    item_ids: List[str]
+    annotator_ids: List[str]
+    labels: List[str]
+    majority_labels: List[str]
+    item_agreement: np.ndarray      # share of an item's annotations that match its majority label
+    item_counts: np.ndarray         # annotations per item
+    annotator_agreement: np.ndarray  # mean share of co-annotators agreeing with each annotator (nan if none)
+    annotator_counts: np.ndarray    # annotations per annotator
+    fleiss_kappa: Optional[float]
+    cohen_kappa: np.ndarray         # annotators x annotators, nan where two annotators share no item
+    cohen_overlap: np.ndarray       # items labeled by both annotators
+
+    def low_agreement_items(self, min_agreement: float) -> List[str]:
+        """Items that need review: below min_agreement, or with fewer than two annotations"""
+        mask = (self.item_agreement < min_agreement) | (self.item_counts < 2)
+        return [self.item_ids[i] for i in np.flatnonzero(mask)]
+
+
+def _encode(values: Sequence[str]) -> Tuple[List[str], np.ndarray]:
+    index: Dict[str, int] = {}
+    codes = np.fromiter((index.setdefault(v, len(index)) for v in values), dtype=np.int64, count=len(values))
+    return list(index), codes
+
+
+def compute_agreement(annotations: Sequence[Tuple[str, str, str]]) -> AgreementReport:
+    """
+    Compute agreement statistics for (item_id, annotator_id, label) triples.
+    If an annotator labeled the same item more than once, only their last label counts.
+    """
+    if not annotations:
+        raise ValueError("No annotations to compute agreement for.")
+    item_ids, items = _encode([a[0] for a in annotations])
+    annotator_ids, annotators = _encode([a[1] for a in annotations])
+    labels, label_codes = _encode([a[2] for a in annotations])
+    num_items, num_annotators, num_labels = len(item_ids), len(annotator_ids), len(labels)
+
+    # Items x annotators label matrix (-1 = not labeled)
+    matrix = np.full((num_items, num_annotators), -1, dtype=np.int64)
+    matrix[items, annotators] = label_codes
+    present = matrix >= 0
+    rows, cols = np.nonzero(present)
+    row_labels = matrix[rows, cols]
+
+    # Items x labels count matrix
+    counts = np.zeros((num_items, num_labels), dtype=np.int64)
+    np.add.at(counts, (rows, row_labels), 1)
+    n_i = counts.sum(axis=1)
+
+    majority = counts.argmax(axis=1)
+    item_agreement = counts.max(axis=1) / n_i
+
+    # Fleiss' kappa, generalized to a varying number of raters per item
+    rated = n_i >= 2
+    fleiss = None
+    if rated.any():
+        c, n = counts[rated], n_i[rated]
+        p_items = ((c * c).sum(axis=1) - n) / (n * (n - 1))
+        p_bar = p_items.mean()
+        p_labels = c.sum(axis=0) / n.sum()
+        p_e = float((p_labels ** 2).sum())
+        if p_e < 1.0:
+            fleiss = float((p_bar - p_e) / (1.0 - p_e))
+        elif p_bar == 1.0:
+            fleiss = 1.0
+
+    # Per-annotator agreement: share of the other annotators on each item who chose the same label
+    same = counts[rows, row_labels] - 1
+    others = n_i[rows] - 1
+    has_others = others > 0
+    shares = np.where(has_others, same / np.maximum(others, 1), 0.0)
+    agree_sum = np.bincount(cols, weights=shares, minlength=num_annotators)
+    agree_n = np.bincount(cols, weights=has_others.astype(np.float64), minlength=num_annotators)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        annotator_agreement = agree_sum / agree_n
+    annotator_counts = np.bincount(cols, minlength=num_annotators)
+
+    cohen, overlap = _pairwise_cohen(matrix, present, num_labels)
+
+    return AgreementReport(
+        item_ids=item_ids,
+        annotator_ids=annotator_ids,
+        labels=labels,
+        majority_labels=[labels[m] for m in majority],
+        item_agreement=item_agreement,
+        item_counts=n_i,
+        annotator_agreement=annotator_agreement,
+        annotator_counts=annotator_counts,
+        fleiss_kappa=fleiss,
+        cohen_kappa=cohen,
+        cohen_overlap=overlap,
+    )
+
+
+def _pairwise_cohen(matrix: np.ndarray, present: np.ndarray, num_labels: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Cohen's kappa for every annotator pair, over the items both annotators labeled"""
+    one_hot = np.zeros(matrix.shape + (num_labels,), dtype=np.float64)
+    rows, cols = np.nonzero(present)
+    one_hot[rows, cols, matrix[rows, cols]] = 1.0
+    p = present.astype(np.float64)
+
+    overlap = p.T @ p                                           # items labeled by both a and b
+    observed = np.einsum("ial,ibl->ab", one_hot, one_hot)       # items where a and b agree
+    # marginals[a, b, l]: how often a used label l on items b also labeled
+    marginals = np.einsum("ial,ib->abl", one_hot, p)
+    expected = np.einsum("abl,bal->ab", marginals, marginals)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        p_o = observed / overlap
+        p_e = expected / (overlap * overlap)
+        kappa = (p_o - p_e) / (1.0 - p_e)
+    # Perfect agreement on a single label has p_e == 1; count it as full agreement
+    kappa = np.where((p_e >= 1.0) & (p_o >= 1.0), 1.0, kappa)
+    kappa[overlap == 0] = np.nan
+    return kappa, overlap.astype(np.int64)
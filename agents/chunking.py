@@ -0,0 +1,113 @@
+"""
+Map-reduce helpers for assessing very large completed outputs.
+
+An output is split on structural boundaries (records of a JSON array, JSON
+Lines, plain lines) into chunks of at most max_chars. When there are more
+chunks than the assessment budget allows, a stratified sample is taken: one
+chunk per equal-sized stratum, picked with a seed derived from the content so
+the same output is always sampled the same way. The per-chunk assessments are
+reduced into one score, weighted by chunk size, with feedback that names the
+weakest chunks.
+"""
+
+import hashlib
+import json
+import random
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+
+@dataclass
+class Chunk:
+    index: int   # position among all chunks
+    text: str
+    records: int  # JSON records or lines in the chunk
+
+
+@dataclass
+class ChunkAssessment:
+    chunk: Chunk
+    quality_score: Optional[int] = None
+    quality_feedback: Optional[str] = None
+    model: Optional[str] = None
+    error: Optional[str] = None
+
+
+def _units(output: str) -> List[str]:
+    """Structural units of the output: JSON array records, JSON Lines or plain lines"""
+    stripped = output.strip()
+    if stripped.startswith("["):
+        try:
+            records = json.loads(stripped)
+        except ValueError:
+            records = None
+        if isinstance(records, list):
+            return [json.dumps(record, ensure_ascii=False) for record in records]
+    return [line for line in output.splitlines() if line.strip()]
+
+
+def _hard_split(unit: str, max_chars: int) -> List[str]:
+    """Split a unit longer than max_chars, preferring whitespace boundaries"""
+    pieces = []
+    while len(unit) > max_chars:
+        cut = unit.rfind(" ", max_chars // 2, max_chars)
+        cut = cut if cut > 0 else max_chars
+        pieces.append(unit[:cut])
+        unit = unit[cut:].lstrip()
+    if unit:
+        pieces.append(unit)
+    return pieces
+
+
+def split_output(output: str, max_chars: int) -> List[Chunk]:
+    """Group structural units into chunks of at most max_chars characters"""
+    chunks: List[Chunk] = []
+    current: List[str] = []
+    size = 0
+
+    def flush():
+        nonlocal current, size
+        if current:
+            chunks.append(Chunk(len(chunks), "\n".join(current), len(current)))
+            current, size = [], 0
+
+    for unit in _units(output):
+        for piece in _hard_split(unit, max_chars):
+            if size + len(piece) + 1 > max_chars:
+                flush()
+            current.append(piece)
+            size += len(piece) + 1
+    flush()
+    return chunks
+
+
+def sample_chunks(chunks: Sequence[Chunk], max_chunks: int, output: str) -> List[Chunk]:
+    """Stratified, content-seeded sample of at most max_chunks chunks (all of them if fewer)"""
+    if max_chunks <= 0 or len(chunks) <= max_chunks:
+        return list(chunks)
+    rng = random.Random(hashlib.sha256(output.encode("utf-8")).hexdigest())
+    bounds = [round(i * len(chunks) / max_chunks) for i in range(max_chunks + 1)]
+    return [chunks[rng.randrange(lo, hi)] for lo, hi in zip(bounds, bounds[1:])]
+
+
+def reduce_assessments(assessments: Sequence[ChunkAssessment], total_chunks: int, worst: int = 3) -> dict:
+    """
+    Combine chunk assessments into {"quality_score", "quality_feedback"}. The score is
+    the mean of chunk scores weighted by chunk length; failed chunks are left out.
+    """
+    scored = [a for a in assessments if a.error is None and a.quality_score is not None]
+    if not scored:
+        raise ValueError("No chunk could be assessed")
+    weights = [len(a.chunk.text) for a in scored]
+    score = round(sum(a.quality_score * w for a, w in zip(scored, weights)) / sum(weights))
+
+    coverage = f"Assessed {len(scored)} of {total_chunks} chunks"
+    if len(assessments) < total_chunks:
+        coverage += " (sampled)"
+    failed = len(assessments) - len(scored)
+    if failed:
+        coverage += f"; {failed} could not be assessed"
+    lines = [f"{coverage}. Size-weighted score: {score}."]
+    for a in sorted(scored, key=lambda a: a.quality_score)[:worst]:
+        lines.append(f"Chunk {a.chunk.index + 1}/{total_chunks} (score {a.quality_score}): {a.quality_feedback}")
+    return {"quality_score": score, "quality_feedback": "\n".join(lines)}
@@ -0,0 +1,335 @@
+"""
+Gold-standard ("honeypot") scoring for image annotation tasks.
+
+Submitted objects are compared against gold objects without an LLM. Each
+object has a class label plus a bounding box ([x_min, y_min, x_max, y_max]),
+a polygon ([[x, y], ...]) or neither (image-level label).
+
+Candidate pairs (intersecting bounding boxes) are found by bucketing boxes
+into a grid instead of comparing all submitted x gold pairs, and their IoU is
+computed with NumPy: exactly for boxes, for polygons by sampling a grid over
+each pair's bounding box. Objects are then matched one-to-one with the
+Hungarian algorithm, run per connected component of the pairs above the IoU
+threshold so that unambiguous pairs (the common case) need no assignment
+solve. A matched pair with the same label is a true positive; precision,
+recall and F1 follow.
+"""
+
+from dataclasses import dataclass
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+# (label, box or None, polygon or None)
+Annotation = Tuple[str, Optional[Sequence[float]], Optional[Sequence[Sequence[float]]]]
+
+
+@dataclass
+class GoldReport:
+    num_submitted: int
+    num_gold: int
+    true_positives: int   # matched with the same label
+    mislabeled: int       # matched by geometry, different label
+    precision: float
+    recall: float
+    f1: float
+    mean_iou: Optional[float]  # over geometric matches, None without geometry
+
+    @property
+    def score(self) -> int:
+        return int(round(self.f1 * 100))
+
+    def feedback(self, iou_threshold: float) -> str:
+        parts = [
+            f"Matched {self.true_positives} of {self.num_gold} gold annotations with {self.num_submitted} submitted "
+            f"(IoU >= {iou_threshold:g}): precision {self.precision:.2f}, recall {self.recall:.2f}, F1 {self.f1:.2f}."
+        ]
+        if self.mean_iou is not None:
+            parts.append(f"Mean IoU of matched objects {self.mean_iou:.2f}.")
+        if self.mislabeled:
+            parts.append(f"{self.mislabeled} object(s) were located correctly but labeled wrong.")
+        missed = self.num_gold - self.true_positives - self.mislabeled
+        if missed > 0:
+            parts.append(f"{missed} gold object(s) were missed.")
+        return " ".join(parts)
+
+
+# --- IoU ---
+
+def overlapping_pairs(a: np.ndarray, b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (rows, cols) of every pair of intersecting boxes between (n, 4) and (m, 4) arrays, without
+    looking at all n x m pairs. The boxes of b are bucketed by the grid cell of their min
+    corner (cells as large as the largest box of b); a box of a can only intersect boxes whose
+    corner lies in the cells from one cell size before its own min corner to its max corner.
+    """
+    empty = np.zeros(0, dtype=np.int64)
+    if not len(a) or not len(b):
+        return empty, empty
+    origin = b[:, :2].min(axis=0)
+    span = float((b[:, :2].max(axis=0) - origin).max())
+    size = max(float((b[:, 2:] - b[:, :2]).max()), span * 1e-6, 1e-9)
+    cells = np.floor((b[:, :2] - origin) / size).astype(np.int64)
+    num_y = int(cells[:, 1].max()) + 1
+    keys = cells[:, 0] * num_y + cells[:, 1]
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+
+    last = cells.max(axis=0)
+    low = np.clip(np.floor((a[:, :2] - size - origin) / size), 0, last).astype(np.int64)
+    high = np.clip(np.floor((a[:, 2:] - origin) / size), -1, last).astype(np.int64)
+    # One key range per (box of a, x column of cells)
+    columns = np.maximum(high[:, 0] - low[:, 0] + 1, 0)
+    a_index = np.repeat(np.arange(len(a)), columns)
+    x = low[a_index, 0] + np.arange(columns.sum()) - np.repeat(np.cumsum(columns) - columns, columns)
+    first = np.searchsorted(sorted_keys, x * num_y + low[a_index, 1], side="left")
+    stop = np.searchsorted(sorted_keys, x * num_y + high[a_index, 1], side="right")
+    counts = np.maximum(stop - first, 0)
+    rows = np.repeat(a_index, counts)
+    cols = order[np.repeat(first, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)]
+    a, b = a[rows], b[cols]
+    overlap = (a[:, 0] <= b[:, 2]) & (b[:, 0] <= a[:, 2]) & (a[:, 1] <= b[:, 3]) & (b[:, 1] <= a[:, 3])
+    return rows[overlap], cols[overlap]
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """IoU of paired (k, 4) boxes in [x_min, y_min, x_max, y_max] form (row i of a with row i of b)"""
+    width = np.clip(np.minimum(a[:, 2], b[:, 2]) - np.maximum(a[:, 0], b[:, 0]), 0, None)
+    height = np.clip(np.minimum(a[:, 3], b[:, 3]) - np.maximum(a[:, 1], b[:, 1]), 0, None)
+    intersection = width * height
+    union = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1]) + (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1]) - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+def polygon_boxes(polygons: Sequence[np.ndarray]) -> np.ndarray:
+    return np.array([np.concatenate([p.min(axis=0), p.max(axis=0)]) for p in polygons], dtype=np.float64).reshape(-1, 4)
+
+
+def _closed_vertices(polygons: Sequence[np.ndarray]) -> np.ndarray:
+    """(k, max_vertices + 1, 2), each polygon closed and padded with its first vertex (zero-length edges)"""
+    size = max(len(p) for p in polygons) + 1
+    out = np.empty((len(polygons), size, 2), dtype=np.float64)
+    for i, p in enumerate(polygons):
+        out[i, :len(p)] = p
+        out[i, len(p):] = p[0]
+    return out
+
+
+def _inside(vertices: np.ndarray, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Even-odd point-in-polygon for (k, v, 2) polygons and (k, points) coordinates"""
+    inside = np.zeros(x.shape, dtype=bool)
+    for e in range(vertices.shape[1] - 1):
+        x1, y1 = vertices[:, e, 0:1], vertices[:, e, 1:2]
+        x2, y2 = vertices[:, e + 1, 0:1], vertices[:, e + 1, 1:2]
+        crosses = (y1 > y) != (y2 > y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_cross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+        inside ^= crosses & (x < x_cross)
+    return inside
+
+
+def polygon_iou(a: Sequence[np.ndarray], b: Sequence[np.ndarray], grid: int = 64, batch: int = 256) -> np.ndarray:
+    """
+    IoU of paired polygons (a[i] with b[i]), estimated on a grid x grid sample of each
+    pair's joint bounding box.
+    """
+    iou = np.zeros(len(a))
+    if not len(a):
+        return iou
+    boxes_a, boxes_b = polygon_boxes(a), polygon_boxes(b)
+    steps = (np.arange(grid) + 0.5) / grid
+    for start in range(0, len(a), batch):
+        pairs = slice(start, start + batch)
+        low = np.minimum(boxes_a[pairs, :2], boxes_b[pairs, :2])
+        high = np.maximum(boxes_a[pairs, 2:], boxes_b[pairs, 2:])
+        xs = low[:, 0:1] + steps[None, :] * (high[:, 0:1] - low[:, 0:1])
+        ys = low[:, 1:2] + steps[None, :] * (high[:, 1:2] - low[:, 1:2])
+        x = np.repeat(xs, grid, axis=1)  # (pairs, grid * grid)
+        y = np.tile(ys, (1, grid))
+        in_a = _inside(_closed_vertices(a[pairs]), x, y)
+        in_b = _inside(_closed_vertices(b[pairs]), x, y)
+        union = (in_a | in_b).sum(axis=1)
+        iou[pairs] = np.divide((in_a & in_b).sum(axis=1), union, out=np.zeros(len(union)), where=union > 0)
+    return iou
+
+
+# --- Matching ---
+
+def linear_sum_assignment(cost: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Minimum-cost one-to-one assignment (Hungarian algorithm, shortest augmenting paths).
+    Returns (rows, cols) sorted by row; every row of the smaller side is assigned.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+    # 1-based potentials and assignment as in the classic formulation; column 0 is a sentinel
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    owner = np.zeros(m + 1, dtype=np.int64)  # row assigned to each column, 0 = none
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        owner[0] = i
+        j0 = 0
+        min_slack = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = owner[j0]
+            free = ~used[1:]
+            slack = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (slack < min_slack[1:])
+            min_slack[1:][better] = slack[better]
+            way[1:][better] = j0
+            candidates = np.where(free, min_slack[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+            u[owner[used]] += delta
+            v[used] -= delta
+            min_slack[1:][free] -= delta
+            j0 = j1
+            if owner[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            owner[j0] = owner[j1]
+            j0 = j1
+    cols = np.flatnonzero(owner[1:])
+    rows = owner[1:][cols] - 1
+    if transposed:
+        rows, cols = cols, rows
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+def match(rows: np.ndarray, cols: np.ndarray, weight: np.ndarray) -> np.ndarray:
+    """
+    Indices of a maximum-weight one-to-one subset of the candidate pairs (rows[i], cols[i]).
+    Pairs that are each other's only candidate are taken directly; the Hungarian algorithm
+    only runs on the connected components of the remaining (ambiguous) pairs.
+    """
+    if not len(rows):
+        return np.zeros(0, dtype=np.int64)
+    unique = (np.bincount(rows)[rows] == 1) & (np.bincount(cols)[cols] == 1)
+    chosen = [np.flatnonzero(unique)]
+    rest = np.flatnonzero(~unique)
+    if len(rest):
+        sub_rows, row_index = np.unique(rows[rest], return_inverse=True)
+        sub_cols, col_index = np.unique(cols[rest], return_inverse=True)
+        pair = np.full((len(sub_rows), len(sub_cols)), -1, dtype=np.int64)
+        pair[row_index, col_index] = rest
+        candidates = pair >= 0
+        pending = np.ones(len(sub_rows), dtype=bool)
+        while pending.any():
+            # Grow the connected component of the first pending row
+            component_rows = np.zeros(len(sub_rows), dtype=bool)
+            component_rows[np.argmax(pending)] = True
+            while True:
+                component_cols = candidates[component_rows].any(axis=0)
+                grown = candidates[:, component_cols].any(axis=1)
+                if (grown == component_rows).all():
+                    break
+                component_rows = grown
+            pending &= ~component_rows
+            component = pair[np.ix_(component_rows, component_cols)]
+            r, c = linear_sum_assignment(-np.where(component >= 0, weight[component], 0.0))
+            picked = component[r, c]
+            chosen.append(picked[picked >= 0])
+    return np.sort(np.concatenate(chosen))
+
+
+# --- Scoring ---
+
+def _boxes(annotations: Sequence[Annotation]) -> np.ndarray:
+    """(k, 4) array of the annotations' boxes, validated in one pass"""
+    try:
+        boxes = np.array([a[1] for a in annotations], dtype=np.float64).reshape(len(annotations), 4)
+    except ValueError:
+        raise ValueError("Boxes must be [x_min, y_min, x_max, y_max]") from None
+    invalid = (boxes[:, 2] < boxes[:, 0]) | (boxes[:, 3] < boxes[:, 1])
+    if invalid.any():
+        i = int(np.argmax(invalid))
+        raise ValueError(f"Box of '{annotations[i][0]}' must be [x_min, y_min, x_max, y_max], got {boxes[i].tolist()}")
+    return boxes
+
+
+def _polygon(annotation: Annotation) -> np.ndarray:
+    label, box, polygon = annotation
+    if polygon is None:
+        x0, y0, x1, y1 = _boxes([annotation])[0]
+        return np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]])
+    try:
+        polygon = np.asarray(polygon, dtype=np.float64)
+    except ValueError:
+        polygon = np.zeros((0, 0))
+    if polygon.ndim != 2 or polygon.shape[1] != 2 or len(polygon) < 3:
+        raise ValueError(f"Polygon of '{label}' must be at least three [x, y] points")
+    return polygon
+
+
+def _geometry_pairs(submitted: list, gold: list, grid: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (rows, cols, iou) for every submitted/gold pair whose bounding boxes intersect. Boxes are
+    compared exactly; as soon as either side has a polygon, everything is compared as polygons.
+    """
+    if all(a[2] is None for a in submitted) and all(a[2] is None for a in gold):
+        sub_boxes, gold_boxes = _boxes(submitted), _boxes(gold)
+        rows, cols = overlapping_pairs(sub_boxes, gold_boxes)
+        return rows, cols, box_iou(sub_boxes[rows], gold_boxes[cols])
+    sub_polygons, gold_polygons = [_polygon(a) for a in submitted], [_polygon(a) for a in gold]
+    rows, cols = overlapping_pairs(polygon_boxes(sub_polygons), polygon_boxes(gold_polygons))
+    iou = polygon_iou([sub_polygons[r] for r in rows], [gold_polygons[c] for c in cols], grid=grid)
+    return rows, cols, iou
+
+
+def compare_to_gold(
+    submitted: Sequence[Annotation], gold: Sequence[Annotation], iou_threshold: float = 0.5, grid: int = 64
+) -> GoldReport:
+    """
+    Score submitted annotations against gold ones. Objects with a box or polygon are matched by
+    geometry; image-level labels (no geometry) are compared as label counts.
+    """
+    if not gold:
+        raise ValueError("No gold annotations to compare against.")
+    sub_geo = [a for a in submitted if a[1] is not None or a[2] is not None]
+    gold_geo = [a for a in gold if a[1] is not None or a[2] is not None]
+    true_positives = mislabeled = 0
+    mean_iou = None
+    if sub_geo and gold_geo:
+        rows, cols, iou = _geometry_pairs(sub_geo, gold_geo, grid)
+        above = iou >= iou_threshold
+        rows, cols, iou = rows[above], cols[above], iou[above]
+        labels, codes = np.unique([a[0] for a in sub_geo + gold_geo], return_inverse=True)
+        same_label = codes[:len(sub_geo)][rows] == codes[len(sub_geo):][cols]
+        # IoU plus 1 for a matching label, so a correctly labeled object wins an ambiguous overlap
+        matched = match(rows, cols, iou + same_label)
+        correct = same_label[matched]
+        true_positives += int(correct.sum())
+        mislabeled += int((~correct).sum())
+        if len(matched):
+            mean_iou = float(iou[matched].mean())
+
+    # Image-level labels: the overlap of the two label multisets counts as matched
+    sub_tags = [a[0] for a in submitted if a[1] is None and a[2] is None]
+    gold_tags = [a[0] for a in gold if a[1] is None and a[2] is None]
+    if sub_tags and gold_tags:
+        tags, codes = np.unique(sub_tags + gold_tags, return_inverse=True)
+        sub_counts = np.bincount(codes[:len(sub_tags)], minlength=len(tags))
+        gold_counts = np.bincount(codes[len(sub_tags):], minlength=len(tags))
+        true_positives += int(np.minimum(sub_counts, gold_counts).sum())
+
+    precision = true_positives / len(submitted) if submitted else 0.0
+    recall = true_positives / len(gold)
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0
+    return GoldReport(
+        num_submitted=len(submitted),
+        num_gold=len(gold),
+        true_positives=true_positives,
+        mislabeled=mislabeled,
+        precision=precision,
+        recall=recall,
+        f1=f1,
+        mean_iou=mean_iou,
+    )
@@ -1,12 +1,27 @@
 import json
 import os
+import sys
 import asyncio
 import logging
-from typing import List, Optional, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional, Dict
 from dotenv import load_dotenv
-from openai import OpenAI
 from uagents import Agent, Context, Model
 
+# Make the repo-level ``shared`` package importable when running from this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.result_cache import ResultCache, content_key
+from shared.agent_rest import RestRoutes
+from chunking import Chunk, ChunkAssessment, reduce_assessments, sample_chunks, split_output
+from shared.jsonstream import SchemaStreamParser
+from shared.metrics import observe_handler, queued, span, start_metrics_server
+from shared.prompts import PromptBuilder
+from shared.jobqueue import JobFailed, JobQueue, QueueFullError, WorkerPool
+from shared.llm_gateway import LLMGateway
+from shared.routing import HealthProber, Router
+from shared.singleflight import SingleFlight, prompt_key
+from shared.startup import LAZY_STARTUP, READINESS, LazyClient, probe_step, start_warm_up_thread
+
 load_dotenv()
 
 # --- Basic Configuration ---
@@ -16,13 +31,27 @@ logger = logging.getLogger("QualityAssessmentAPI")
 
 
 
+class ImageAnnotation(Model):
+    """
+    One annotated object: a class label with a bounding box, a polygon or neither (image-level label).
+    """
+    label: str
+    box: Optional[List[float]] = None             # [x_min, y_min, x_max, y_max]
+    polygon: Optional[List[List[float]]] = None   # [[x, y], ...]
+
 class TaskAssessmentRequest(Model):
     """
     Model for a request to assess a task's quality.
+    With gold_annotations (a gold/honeypot task), completed_output must be the submitted
+    annotations as JSON (a list of ImageAnnotation objects, or {"annotations": [...]}) and
+    is scored against the gold ones locally instead of by the LLM.
     """
     task_instructions: str
     completed_output: str
     evaluation_rubric: Optional[str] = None 
+    bypass_cache: bool = False
+    gold_annotations: Optional[List[ImageAnnotation]] = None
+    iou_threshold: float = 0.5
 
 class TaskAssessmentResponse(Model):
     """
@@ -33,15 +62,180 @@ class TaskAssessmentResponse(Model):
     quality_score: Optional[int] = None
     error_message: Optional[str] = None
 
+class AssessmentCompletion(Model):
+    """
+    Shape the LLM is asked to produce; streamed output is validated against it.
+    """
+    quality_feedback: str
+    quality_score: int
+
+class TaskAssessmentBatchRequest(Model):
+    """
+    Model for a request to assess many tasks (e.g. every annotation of a task) in one call.
+    """
+    assessments: List[TaskAssessmentRequest]
+
+class TaskAssessmentBatchResponse(Model):
+    """
+    Model for the batch response; results are in the same order as the request's assessments.
+    """
+    status: str
+    results: List[TaskAssessmentResponse]
+
+class LabelAnnotation(Model):
+    """
+    One annotator's label for one item of a label-style task.
+    """
+    item_id: str
+    annotator_id: str
+    label: str
+    completed_output: Optional[str] = None  # sent to the LLM on review; defaults to the label
+
+class AgreementAssessmentRequest(Model):
+    """
+    Model for a request to gate LLM quality review on inter-annotator agreement.
+    """
+    task_instructions: str
+    annotations: List[LabelAnnotation]
+    evaluation_rubric: Optional[str] = None
+    min_agreement: float = 0.7
+
+class ItemAgreement(Model):
+    item_id: str
+    majority_label: str
+    agreement: float
+    num_annotations: int
+    reviewed: bool
+    annotator_ids: List[str] = []
+    assessments: List[TaskAssessmentResponse] = []  # aligned with annotator_ids when reviewed
+
+class AnnotatorAgreement(Model):
+    annotator_id: str
+    num_annotations: int
+    agreement_rate: Optional[float] = None
+
+class PairwiseKappa(Model):
+    annotator_a: str
+    annotator_b: str
+    kappa: Optional[float] = None
+    shared_items: int
+
+class AgreementAssessmentResponse(Model):
+    """
+    Model for the agreement report; only low-agreement items carry LLM assessments.
+    """
+    status: str
+    fleiss_kappa: Optional[float] = None
+    items: List[ItemAgreement] = []
+    annotators: List[AnnotatorAgreement] = []
+    cohen_kappa: List[PairwiseKappa] = []
+    reviewed_items: int = 0
+    error_message: Optional[str] = None
+
+class TaskAssessmentJobRequest(TaskAssessmentRequest):
+    """
+    Model for queueing an assessment; the result is polled or POSTed to callback_url.
+    """
+    callback_url: Optional[str] = None
+
+class JobStatusRequest(Model):
+    job_id: str
+
+class JobResponse(Model):
+    """
+    Model for a queued job. job_status is queued, running, succeeded or failed;
+    result holds the TaskAssessmentResponse fields once it succeeded.
+    """
+    status: str
+    job_id: Optional[str] = None
+    job_status: Optional[str] = None
+    deduplicated: bool = False
+    attempts: int = 0
+    result: Optional[Dict[str, Any]] = None
+    error_message: Optional[str] = None
+
+class JobStatsResponse(Model):
+    enabled: bool
+    workers: int = 0
+    alive: int = 0
+    jobs: Dict[str, Dict[str, int]] = {}
+
+class CacheStatsResponse(Model):
+    """
+    Model for the assessment result cache statistics.
+    """
+    enabled: bool
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    hit_ratio: float = 0.0
+
+class GatewayStatsResponse(Model):
+    """
+    Model for upstream LLM gateway statistics (queue depth, in-flight calls, per-model counters
+    and rolling latency), the current model per call type and the last background upstream probe.
+    """
+    queue_depth: int
+    in_flight: int
+    models: Dict[str, Dict[str, Any]]
+    routes: Dict[str, Dict[str, Any]] = {}
+    upstream: Dict[str, Any] = {}
+
+class ReadinessResponse(Model):
+    """
+    Model for startup readiness: whether the upstream client is built and a first
+    connection opened (warm-up steps with their status), and seconds since process start.
+    """
+    ready: bool
+    uptime_seconds: float
+    ready_after_seconds: Optional[float] = None
+    steps: Dict[str, Dict[str, Any]] = {}
+
 # --- Agent and OpenAI Client Setup ---
 
 DEFAULT_API_KEY = "INSERT_YOUR_ASI_ONE_API_KEY_HERE"
 ASI_API_KEY = os.getenv("ASI_API_KEY", DEFAULT_API_KEY)
 
-client = OpenAI(
-    base_url='https://api.asi1.ai/v1',
-    api_key=ASI_API_KEY,
-)
+ROUTES = {
+    "assess-quality": ["asi1-mini"],
+}
+
+def build_client():
+    from openai import OpenAI
+
+    return OpenAI(
+        base_url=os.getenv("ASI_BASE_URL", 'https://api.asi1.ai/v1'),
+        api_key=ASI_API_KEY,
+        max_retries=0,  # retries, rate limiting and circuit breaking live in the gateway
+    )
+
+# With LAZY_STARTUP=1 the client (and `openai`) is built by the startup warm-up or on first use
+client = LazyClient(build_client)
+if not LAZY_STARTUP:
+    client.resolve()
+
+# Durable job queue for /jobs/assess-task-quality, drained by QUALITY_JOB_WORKERS processes (0 disables job mode)
+QUALITY_JOB_DB_PATH = os.getenv("QUALITY_JOB_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "quality_jobs.sqlite3"))
+QUALITY_JOB_WORKERS = int(os.getenv("QUALITY_JOB_WORKERS", "2"))
+
+# The job workers draw on the same LLM_RATE_LIMITS quota as the agent
+gateway = LLMGateway.from_env(client, processes=QUALITY_JOB_WORKERS + 1)
+
+# Model per call type, overridable with LLM_ROUTES (see shared/routing.py)
+router = Router.from_env(gateway, ROUTES)
+
+def refresh_model_latency(model: str) -> None:
+    gateway.complete(model=model, messages=[{"role": "user", "content": "ping"}], max_tokens=1)
+
+# Background upstream probe on a daemon thread (LLM_PROBE_INTERVAL); reported in /gateway/stats
+prober = HealthProber.from_env(lambda: client.models.list(), router=router, refresh=refresh_model_latency)
+
+def start_warm_up() -> None:
+    """Build the client and open a first upstream connection on a thread, then start the prober"""
+    READINESS.add("asi-client")
+    READINESS.add("asi-upstream", best_effort=True)
+    start_warm_up_thread([("asi-client", client.resolve), ("asi-upstream", probe_step(prober))], then=prober.start_thread)
 
 quality_agent = Agent(
     name="ai_quality_agent_api",
@@ -50,44 +244,157 @@ quality_agent = Agent(
     endpoint=["http://127.0.0.1:8001/submit"]
 )
 
+# REST handlers, also served from the multi-worker ASGI deployment (deploy/app.py)
+rest = RestRoutes(quality_agent)
+
+# Concurrent identical assessments (e.g. replayed requests) share one in-flight LLM call
+assessment_flight = SingleFlight()
+
+# Bump when the assessment prompt changes so cached results from the old prompt are not reused.
+# Only results produced by the route's primary model are cached; fallback answers are not.
+ASSESSMENT_MODEL = router.routes["assess-quality"].models[0]
+ASSESSMENT_PROMPT_VERSION = "2"
+
+# Persistent result cache; set QUALITY_CACHE_PATH="" to disable, QUALITY_CACHE_TTL=0 for no expiry
+QUALITY_CACHE_PATH = os.getenv("QUALITY_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "quality_cache.sqlite3"))
+
+def open_result_cache() -> Optional[ResultCache]:
+    if not QUALITY_CACHE_PATH:
+        return None
+    return ResultCache(
+        QUALITY_CACHE_PATH,
+        max_entries=int(os.getenv("QUALITY_CACHE_MAX_ENTRIES", "100000")),
+        ttl_seconds=float(os.getenv("QUALITY_CACHE_TTL", "0")),
+    )
+
+result_cache = open_result_cache()
+
+# Bounded worker pool for LLM calls; size it to the upstream concurrency budget
+QUALITY_MAX_WORKERS = int(os.getenv("QUALITY_MAX_WORKERS", "8"))
+assessment_executor = ThreadPoolExecutor(max_workers=QUALITY_MAX_WORKERS, thread_name_prefix="quality-llm")
+
+# Outputs longer than QUALITY_CHUNK_CHARS are assessed in chunks of that size (0 disables chunking);
+# at most QUALITY_CHUNK_SAMPLE chunks (0 = all) are assessed, QUALITY_CHUNK_CONCURRENCY calls at a time
+QUALITY_CHUNK_CHARS = int(os.getenv("QUALITY_CHUNK_CHARS", "12000"))
+QUALITY_CHUNK_SAMPLE = int(os.getenv("QUALITY_CHUNK_SAMPLE", "16"))
+QUALITY_CHUNK_CONCURRENCY = int(os.getenv("QUALITY_CHUNK_CONCURRENCY", "8"))
+chunk_executor = ThreadPoolExecutor(max_workers=QUALITY_CHUNK_CONCURRENCY, thread_name_prefix="quality-chunk")
+
+# Prometheus text format on a side port (uAgents REST endpoints only return JSON); 0 disables
+QUALITY_METRICS_PORT = int(os.getenv("QUALITY_METRICS_PORT", "9101"))
+
+# Samples per side of the grid used to estimate polygon IoU for gold tasks (error roughly 1/grid)
+QUALITY_GOLD_POLYGON_GRID = int(os.getenv("QUALITY_GOLD_POLYGON_GRID", "64"))
+
 
 
 def assess_task_quality_sync(
     instructions: str, 
     output: str, 
     rubric: Optional[str], 
-    client: OpenAI
+    gateway: LLMGateway
 ) -> Dict:
     """
-    Calls the LLM to assess the quality of a completed task.
+    Calls the LLM to assess the quality of a completed task; "model" in the result is the model
+    that answered. Outputs longer than QUALITY_CHUNK_CHARS are assessed in chunks (see assess_in_chunks).
     """
-    
+    if QUALITY_CHUNK_CHARS > 0 and len(output) > QUALITY_CHUNK_CHARS:
+        return assess_in_chunks(instructions, output, rubric, gateway)
+    return assess_output_sync(instructions, output, rubric, gateway)
 
-    rubric_content = rubric if rubric else "N/A. Please use general best practices for quality."
 
-    prompt_content = f"""
-    **Task Instructions:**
-    {instructions}
+def score_against_gold(req: TaskAssessmentRequest) -> Dict:
+    """
+    Compare the submitted annotations in completed_output with req.gold_annotations
+    (IoU matching, precision/recall/F1; see gold.py). Raises ValueError for malformed output.
+    """
+    # numpy is only needed here, so it stays off the startup path
+    from gold import compare_to_gold
 
-    **Evaluation Rubric:**
-    {rubric_content}
+    try:
+        submitted = json.loads(req.completed_output)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"completed_output must be the submitted annotations as JSON: {e}") from None
+    if isinstance(submitted, dict):
+        submitted = submitted.get("annotations")
+    if not isinstance(submitted, list):
+        raise ValueError('completed_output must be a list of annotations or {"annotations": [...]}')
+    submitted = [ImageAnnotation.parse_obj(a) for a in submitted]
+    report = compare_to_gold(
+        [(a.label, a.box, a.polygon) for a in submitted],
+        [(a.label, a.box, a.polygon) for a in req.gold_annotations],
+        iou_threshold=req.iou_threshold,
+        grid=QUALITY_GOLD_POLYGON_GRID,
+    )
+    return {"quality_feedback": report.feedback(req.iou_threshold), "quality_score": report.score}
 
-    **Completed Task Output to Evaluate:**
-    {output}
 
-    Please evaluate the "Completed Task Output" based on the "Task Instructions" and "Evaluation Rubric".
+def assess_in_chunks(instructions: str, output: str, rubric: Optional[str], gateway: LLMGateway) -> Dict:
     """
-    
+    Map-reduce assessment: split the output on record/line boundaries, assess (a sample of)
+    the chunks concurrently and reduce them into one size-weighted score.
+    """
+    chunks = split_output(output, QUALITY_CHUNK_CHARS)
+    selected = sample_chunks(chunks, QUALITY_CHUNK_SAMPLE, output)
+    logger.info(f"Assessing {len(selected)} of {len(chunks)} chunks of a {len(output)}-character output")
+
+    def assess_chunk(chunk: Chunk) -> ChunkAssessment:
+        part = f"part {chunk.index + 1} of {len(chunks)} ({chunk.records} records or lines)"
+        try:
+            result = assess_output_sync(instructions, chunk.text, rubric, gateway, part=part)
+        except Exception as e:
+            return ChunkAssessment(chunk, error=str(e))
+        return ChunkAssessment(chunk, result["quality_score"], result["quality_feedback"], result["model"])
+
+    futures = [chunk_executor.submit(queued("quality-chunk", assess_chunk, chunk)) for chunk in selected]
+    assessments = [future.result() for future in futures]
+    failed = [a for a in assessments if a.error is not None]
+    if len(failed) == len(assessments):
+        raise RuntimeError(f"Every chunk failed to assess: {failed[0].error}")
+    models = {a.model for a in assessments if a.error is None}
+    # Reported as no single model, so the result is not cached: a mix of models (some chunks
+    # answered by a fallback) or a partial score that leaves out chunks that failed transiently
+    model = models.pop() if len(models) == 1 and not failed else None
+    return {**reduce_assessments(assessments, len(chunks)), "model": model}
+
+
+def assess_output_sync(
+    instructions: str,
+    output: str,
+    rubric: Optional[str],
+    gateway: LLMGateway,
+    part: Optional[str] = None,
+) -> Dict:
+    """
+    One assessment call; `part` describes which chunk of a larger output is being evaluated.
+    Instructions and rubric precede the output, so the chunks of one output (and all outputs
+    of a task) share a prompt prefix.
+    """
+    rubric_content = rubric if rubric else "N/A. Please use general best practices for quality."
+    output_heading = f"Completed Task Output to Evaluate ({part}; judge only this part):" if part else "Completed Task Output to Evaluate:"
+
     system_prompt = """
     You are an expert Quality Assurance (QA) specialist. Your job is to evaluate a completed task.
     Provide concise, constructive feedback and a numerical score from 0 to 100 
     (0 = completely wrong, 100 = perfect).
     Output *only* a JSON object with two keys: "quality_feedback" (string) and "quality_score" (integer).
     """
-    
+
+    model = router.pick("assess-quality")
+    prompt_content = (
+        PromptBuilder("assess-quality", model, 1024, system=system_prompt)
+        .static('Please evaluate the "Completed Task Output" based on the "Task Instructions" and "Evaluation Rubric".')
+        .text("**Task Instructions:**", instructions, "instructions", min_tokens=256)
+        .text("**Evaluation Rubric:**", rubric_content, "rubric", min_tokens=256)
+        .text(f"**{output_heading}**", output, "output", min_tokens=1024)
+        .build()
+        .text
+    )
+
     try:
-        r = client.chat.completions.create(
-            model="asi1-mini",
+        completion = gateway.complete_validated(
+            lambda: SchemaStreamParser(AssessmentCompletion),
+            model=model,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": prompt_content},
@@ -95,55 +402,278 @@ def assess_task_quality_sync(
             max_tokens=1024,
             response_format={"type": "json_object"},
         )
-        response_text = str(r.choices[0].message.content)
+        return {**completion.dict(), "model": model}
+
+    except Exception as e:
+        logger.error(f"Error in assess_output_sync: {e}")
+    
+        raise
 
-        logger.info(f"Raw LLM response for quality assessment: {response_text}")
 
-        start_index = response_text.find('{')
-        end_index = response_text.rfind('}')
-        if start_index == -1 or end_index == -1:
-            raise ValueError("Could not find a JSON object in the LLM assessment response.")
 
-        json_str = response_text[start_index : end_index + 1]
-        data = json.loads(json_str)
+def assessment_cache_key(req: TaskAssessmentRequest) -> str:
+    return content_key(
+        req.task_instructions, req.completed_output, req.evaluation_rubric, ASSESSMENT_MODEL, ASSESSMENT_PROMPT_VERSION
+    )
 
-        if "quality_feedback" in data and "quality_score" in data:
-            return data
-        else:
-            raise ValueError(f"LLM output JSON was not in the expected format: {json_str}")
 
+async def run_assessment(req: TaskAssessmentRequest) -> TaskAssessmentResponse:
+    """
+    Assess one task on the bounded worker pool; failures are returned as an error response.
+    Results are served from the persistent cache unless the request sets bypass_cache.
+    Gold tasks are scored locally and not cached.
+    """
+    if req.gold_annotations is not None:
+        try:
+            with span("gold"):
+                return TaskAssessmentResponse(status="success", **score_against_gold(req))
+        except ValueError as e:
+            return TaskAssessmentResponse(status="error", error_message=str(e))
+    loop = asyncio.get_running_loop()
+    cache_key = assessment_cache_key(req)
+    if result_cache is not None and not req.bypass_cache:
+        with span("cache"):
+            cached = await asyncio.to_thread(result_cache.get, cache_key)
+        if cached is not None:
+            return TaskAssessmentResponse(status="success", **cached)
+    try:
+        result_data = await assessment_flight.do(
+            prompt_key("assess-task-quality", req.task_instructions, req.completed_output, req.evaluation_rubric, req.bypass_cache),
+            lambda: loop.run_in_executor(assessment_executor, queued(
+                "quality-llm",
+                assess_task_quality_sync,
+                req.task_instructions,
+                req.completed_output,
+                req.evaluation_rubric,
+                gateway
+            ))
+        )
     except Exception as e:
-        logger.error(f"Error in assess_task_quality_sync: {e}")
-    
-        raise
+        logger.error(f"Error in assess_task_quality handler: {e}")
+        return TaskAssessmentResponse(status="error", error_message=str(e))
 
+    result = {
+        "quality_feedback": result_data.get("quality_feedback"),
+        "quality_score": result_data.get("quality_score")
+    }
+    if result_cache is not None and result_data.get("model") == ASSESSMENT_MODEL:
+        await asyncio.to_thread(result_cache.put, cache_key, result)
+    return TaskAssessmentResponse(status="success", **result)
 
 
-@quality_agent.on_rest_post("/assess-task-quality", TaskAssessmentRequest, TaskAssessmentResponse)
+# --- Job Mode (durable queue, worker processes) ---
+
+def assess_job(payload: dict) -> dict:
+    """Job handler, runs in a worker process; exceptions other than JobFailed are retried by the queue"""
+    req = TaskAssessmentRequest.parse_obj(payload)
+    if req.gold_annotations is not None:
+        try:
+            return TaskAssessmentResponse(status="success", **score_against_gold(req)).dict()
+        except ValueError as e:
+            # Malformed output; retrying will not help
+            raise JobFailed(str(e))
+    cache_key = assessment_cache_key(req)
+    if result_cache is not None and not req.bypass_cache:
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            return TaskAssessmentResponse(status="success", **cached).dict()
+    result_data = assess_task_quality_sync(req.task_instructions, req.completed_output, req.evaluation_rubric, gateway)
+    result = {
+        "quality_feedback": result_data.get("quality_feedback"),
+        "quality_score": result_data.get("quality_score")
+    }
+    if result_cache is not None and result_data.get("model") == ASSESSMENT_MODEL:
+        result_cache.put(cache_key, result)
+    return TaskAssessmentResponse(status="success", **result).dict()
+
+def job_response(job: dict, deduplicated: bool = False) -> JobResponse:
+    return JobResponse(
+        status="success",
+        job_id=job["id"],
+        job_status=job["status"],
+        deduplicated=deduplicated,
+        attempts=job["attempts"],
+        result=job["result"],
+        error_message=job["error"] if job["status"] == "failed" else None,
+    )
+
+def render_job(job: dict) -> dict:
+    """Webhook body: the same document POST /jobs/status returns"""
+    return job_response(job).dict()
+
+job_queue = JobQueue.from_env(QUALITY_JOB_DB_PATH) if QUALITY_JOB_WORKERS > 0 else None
+job_pool = WorkerPool(
+    job_queue,
+    {"assess-task-quality": assess_job},
+    processes=QUALITY_JOB_WORKERS,
+    render=render_job,
+) if job_queue is not None else None
+
+
+@rest.post("/assess-task-quality", TaskAssessmentRequest, TaskAssessmentResponse)
+@observe_handler("/assess-task-quality", trace_logger=logger)
 async def handle_assess_task_quality(ctx: Context, req: TaskAssessmentRequest):
     logger.info(f"Received request to assess task quality.")
+    return await run_assessment(req)
+
+@rest.post("/assess-task-quality/batch", TaskAssessmentBatchRequest, TaskAssessmentBatchResponse)
+@observe_handler("/assess-task-quality/batch", trace_logger=logger)
+async def handle_assess_task_quality_batch(ctx: Context, req: TaskAssessmentBatchRequest):
+    logger.info(f"Received request to assess {len(req.assessments)} tasks.")
+    results = await asyncio.gather(*(run_assessment(item) for item in req.assessments))
+    status = "success" if all(r.status == "success" for r in results) else "partial"
+    if results and all(r.status == "error" for r in results):
+        status = "error"
+    return TaskAssessmentBatchResponse(status=status, results=list(results))
+
+@rest.post("/assess-task-agreement", AgreementAssessmentRequest, AgreementAssessmentResponse)
+@observe_handler("/assess-task-agreement", trace_logger=logger)
+async def handle_assess_task_agreement(ctx: Context, req: AgreementAssessmentRequest):
+    # numpy is only needed here, so it stays off the startup path
+    import numpy as np
+    from agreement import compute_agreement
+
+    logger.info(f"Received request to assess agreement over {len(req.annotations)} annotations.")
     try:
-        result_data = await asyncio.to_thread(
-            assess_task_quality_sync,
-            req.task_instructions,
-            req.completed_output,
-            req.evaluation_rubric,
-            client
-        )
-        return TaskAssessmentResponse(
-            status="success",
-            quality_feedback=result_data.get("quality_feedback"),
-            quality_score=result_data.get("quality_score")
-        )
+        with span("agreement"):
+            report = compute_agreement([(a.item_id, a.annotator_id, a.label) for a in req.annotations])
     except Exception as e:
-        logger.error(f"Error in assess_task_quality handler: {e}")
-        return TaskAssessmentResponse(status="error", error_message=str(e))
+        logger.error(f"Error in assess_task_agreement handler: {e}")
+        return AgreementAssessmentResponse(status="error", error_message=str(e))
+
+    # Only items the annotators disagree on (or with a single annotation) go to the LLM
+    review_ids = set(report.low_agreement_items(req.min_agreement))
+    to_review: Dict[str, List[LabelAnnotation]] = {}
+    for a in req.annotations:
+        if a.item_id in review_ids:
+            to_review.setdefault(a.item_id, []).append(a)
+
+    async def review(item_annotations: List[LabelAnnotation]) -> List[TaskAssessmentResponse]:
+        return await asyncio.gather(*(
+            run_assessment(TaskAssessmentRequest(
+                task_instructions=req.task_instructions,
+                completed_output=a.completed_output or a.label,
+                evaluation_rubric=req.evaluation_rubric
+            ))
+            for a in item_annotations
+        ))
+
+    reviewed = dict(zip(to_review, await asyncio.gather(*(review(v) for v in to_review.values()))))
+
+    items = []
+    for idx, item_id in enumerate(report.item_ids):
+        item_annotations = to_review.get(item_id, [])
+        items.append(ItemAgreement(
+            item_id=item_id,
+            majority_label=report.majority_labels[idx],
+            agreement=round(float(report.item_agreement[idx]), 4),
+            num_annotations=int(report.item_counts[idx]),
+            reviewed=item_id in reviewed,
+            annotator_ids=[a.annotator_id for a in item_annotations],
+            assessments=reviewed.get(item_id, [])
+        ))
+
+    annotators = [
+        AnnotatorAgreement(
+            annotator_id=annotator_id,
+            num_annotations=int(report.annotator_counts[idx]),
+            agreement_rate=None if np.isnan(report.annotator_agreement[idx]) else round(float(report.annotator_agreement[idx]), 4)
+        )
+        for idx, annotator_id in enumerate(report.annotator_ids)
+    ]
+
+    pairs = []
+    for a, b in zip(*np.triu_indices(len(report.annotator_ids), k=1)):
+        if report.cohen_overlap[a, b] == 0:
+            continue
+        kappa = report.cohen_kappa[a, b]
+        pairs.append(PairwiseKappa(
+            annotator_a=report.annotator_ids[a],
+            annotator_b=report.annotator_ids[b],
+            kappa=None if np.isnan(kappa) else round(float(kappa), 4),
+            shared_items=int(report.cohen_overlap[a, b])
+        ))
+
+    return AgreementAssessmentResponse(
+        status="success",
+        fleiss_kappa=report.fleiss_kappa,
+        items=items,
+        annotators=annotators,
+        cohen_kappa=pairs,
+        reviewed_items=len(reviewed)
+    )
+
+@rest.post("/jobs/assess-task-quality", TaskAssessmentJobRequest, JobResponse)
+@observe_handler("/jobs/assess-task-quality", trace_logger=logger)
+async def handle_submit_assessment_job(ctx: Context, req: TaskAssessmentJobRequest):
+    if job_queue is None:
+        return JobResponse(status="error", error_message="Job mode is disabled (QUALITY_JOB_WORKERS=0)")
+    payload = TaskAssessmentRequest.parse_obj(req.dict(exclude={"callback_url"})).dict()
+    try:
+        job, deduplicated = await asyncio.to_thread(job_queue.submit, "assess-task-quality", payload, req.callback_url)
+    except QueueFullError as e:
+        return JobResponse(status="error", error_message=str(e))
+    job_pool.notify()
+    return job_response(job, deduplicated)
+
+@rest.post("/jobs/status", JobStatusRequest, JobResponse)
+async def handle_job_status(ctx: Context, req: JobStatusRequest):
+    job = await asyncio.to_thread(job_queue.get, req.job_id) if job_queue is not None else None
+    if job is None:
+        return JobResponse(status="error", job_id=req.job_id, error_message="Unknown job")
+    return job_response(job)
+
+@rest.get("/jobs/stats", JobStatsResponse)
+async def handle_job_stats(ctx: Context):
+    if job_pool is None:
+        return JobStatsResponse(enabled=False)
+    return JobStatsResponse(enabled=True, **(await asyncio.to_thread(job_pool.stats)))
+
+@rest.get("/cache/stats", CacheStatsResponse)
+async def handle_cache_stats(ctx: Context):
+    if result_cache is None:
+        return CacheStatsResponse(enabled=False)
+    return CacheStatsResponse(enabled=True, **(await asyncio.to_thread(result_cache.stats)))
+
+@rest.get("/gateway/stats", GatewayStatsResponse)
+async def handle_gateway_stats(ctx: Context):
+    return GatewayStatsResponse(**gateway.stats(), routes=router.stats(), upstream=prober.snapshot())
+
+@rest.get("/readyz", ReadinessResponse)
+async def handle_readiness(ctx: Context):
+    """Readiness from the startup warm-up; the REST server answering at all is liveness"""
+    return ReadinessResponse(**READINESS.snapshot())
 
 @quality_agent.on_event("startup")
 async def startup(ctx: Context):
     logger.info(f"Task Quality Assessment API agent started. Address: {ctx.agent.address}")
     logger.info("Endpoints are available at http://127.0.0.1:8001/submit")
     logger.info("POST /submit/assess-task-quality")
+    logger.info("POST /submit/assess-task-quality/batch")
+    logger.info("POST /submit/assess-task-agreement")
+    logger.info("POST /submit/jobs/assess-task-quality")
+    logger.info("POST /submit/jobs/status")
+    logger.info("GET /submit/jobs/stats")
+    logger.info("GET /submit/cache/stats")
+    logger.info("GET /submit/gateway/stats")
+    logger.info("GET /submit/readyz")
+    start_metrics_server(QUALITY_METRICS_PORT)
+
+@quality_agent.on_event("shutdown")
+async def shutdown(ctx: Context):
+    if job_pool is not None:
+        job_pool.stop()
+
+def start_background_work() -> None:
+    """Job workers, warm-up and the upstream prober when the handlers are served from deploy/app.py"""
+    if job_pool is not None:
+        job_pool.start()
+    start_warm_up()
+
+def stop_background_work() -> None:
+    prober.stop_thread()
+    if job_pool is not None:
+        job_pool.stop()
 
 
 
@@ -153,5 +683,10 @@ if __name__ == "__main__":
         print("!!! WARNING: You are using the default API key.                           !!!")
         print("!!! Please set the 'ASI_API_KEY' environment variable to your actual key. !!!")
         print("!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!\n")
-    
+
+    # Job workers are spawned, so they re-import this module and never run the agent itself
+    if job_pool is not None:
+        job_pool.start()
+    # Not in the startup handler: uAgents runs that only after Almanac registration
+    start_warm_up()
     quality_agent.run()
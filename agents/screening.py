@@ -1,11 +1,20 @@
-import json
 import os
+import sys
 import asyncio
 import logging
-from typing import List, Optional, Dict
+from typing import Any, List, Optional, Dict
 from dotenv import load_dotenv
-from openai import OpenAI
 from uagents import Agent, Context, Model
+
+# Make the repo-level ``shared`` package importable when running from this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.jsonstream import SchemaStreamParser
+from shared.llm_gateway import LLMGateway
+from shared.routing import HealthProber, Router
+from shared.metrics import observe_handler, queued, start_metrics_server
+from shared.prompts import PromptBuilder
+from shared.singleflight import SingleFlight, prompt_key
+from shared.startup import LAZY_STARTUP, READINESS, LazyClient, probe_step, start_warm_up_thread
 load_dotenv()
 # --- Basic Configuration ---
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
@@ -32,27 +41,100 @@ class ScreeningResponse(Model):
     score: Optional[int] = None
     error_message: Optional[str] = None
 
+# Shapes the LLM is asked to produce; streamed output is validated against these
+class QuestionsCompletion(Model):
+    questions: List[str]
+
+class ScoreCompletion(Model):
+    assessment: str
+    score: int
+
+class GatewayStatsResponse(Model):
+    """
+    Model for upstream LLM gateway statistics (queue depth, in-flight calls, per-model counters
+    and rolling latency), the current model per call type and the last background upstream probe.
+    """
+    queue_depth: int
+    in_flight: int
+    models: Dict[str, Dict[str, Any]]
+    routes: Dict[str, Dict[str, Any]] = {}
+    upstream: Dict[str, Any] = {}
+
+class ReadinessResponse(Model):
+    """
+    Model for startup readiness: whether the upstream client is built and a first
+    connection opened (warm-up steps with their status), and seconds since process start.
+    """
+    ready: bool
+    uptime_seconds: float
+    ready_after_seconds: Optional[float] = None
+    steps: Dict[str, Dict[str, Any]] = {}
+
 # --- Agent and OpenAI Client Setup ---
 
 DEFAULT_API_KEY = "INSERT_YOUR_ASI_ONE_API_KEY_HERE"
 
+ROUTES = {
+    "generate-questions": ["asi1-mini"],
+    "score-screening": ["asi1-mini"],
+}
+
 ASI_API_KEY = os.getenv("ASI_API_KEY", DEFAULT_API_KEY)
 
-client = OpenAI(
-    base_url='https://api.asi1.ai/v1',
-    api_key=ASI_API_KEY,
-)
+def build_client():
+    from openai import OpenAI
+
+    return OpenAI(
+        base_url=os.getenv("ASI_BASE_URL", 'https://api.asi1.ai/v1'),
+        api_key=ASI_API_KEY,
+        max_retries=0,  # retries, rate limiting and circuit breaking live in the gateway
+    )
+
+# With LAZY_STARTUP=1 the client (and `openai`) is built by the startup warm-up or on first use
+client = LazyClient(build_client)
+if not LAZY_STARTUP:
+    client.resolve()
+
+gateway = LLMGateway.from_env(client)
+
+# Model per call type, overridable with LLM_ROUTES (see shared/routing.py)
+router = Router.from_env(gateway, ROUTES)
+
+def refresh_model_latency(model: str) -> None:
+    gateway.complete(model=model, messages=[{"role": "user", "content": "ping"}], max_tokens=1)
+
+# Background upstream probe on a daemon thread (LLM_PROBE_INTERVAL); reported in /gateway/stats
+prober = HealthProber.from_env(lambda: client.models.list(), router=router, refresh=refresh_model_latency)
+
+def start_warm_up() -> None:
+    """Build the client and open a first upstream connection on a thread, then start the prober"""
+    READINESS.add("asi-client")
+    READINESS.add("asi-upstream", best_effort=True)
+    start_warm_up_thread([("asi-client", client.resolve), ("asi-upstream", probe_step(prober))], then=prober.start_thread)
+
+# 8000 is taken by the FastAPI screening service (screening-service/main.py)
+SCREENING_AGENT_PORT = int(os.getenv("SCREENING_AGENT_PORT", "8002"))
 
 screening_agent = Agent(
     name="ai_screening_agent_api",
-    port=8000,
+    port=SCREENING_AGENT_PORT,
     seed="ai_screening_agent_api_secret_phrase",
-    endpoint=["http://127.0.0.1:8000/submit"]
+    endpoint=[f"http://127.0.0.1:{SCREENING_AGENT_PORT}/submit"]
 )
 
+# Concurrent requests for the same instruction share one in-flight LLM call
+question_flight = SingleFlight()
+
+# Prometheus text format on a side port (uAgents REST endpoints only return JSON); 0 disables
+SCREENING_METRICS_PORT = int(os.getenv("SCREENING_METRICS_PORT", "9100"))
+
+# Scoring prompt caps (tokens) per answer and for the instruction, as in the screening service
+SCREENING_PROMPT_ANSWER_TOKENS = int(os.getenv("SCREENING_PROMPT_ANSWER_TOKENS", "500"))
+SCREENING_PROMPT_INSTRUCTION_TOKENS = int(os.getenv("SCREENING_PROMPT_INSTRUCTION_TOKENS", "2000"))
+
 # --- Core LLM Functions (Synchronous) ---
 
-def generate_questions_sync(instruction: str, client: OpenAI) -> List[str]:
+def generate_questions_sync(instruction: str, gateway: LLMGateway) -> List[str]:
     system_prompt = """
     You are an expert curriculum designer tasked with screening a user's expertise on a topic.
     The user will provide an instruction or topic. Your job is to generate 5 screening questions
@@ -60,8 +142,9 @@ def generate_questions_sync(instruction: str, client: OpenAI) -> List[str]:
     Output *only* a JSON object with a single key "questions" containing a list of strings.
     """
     try:
-        r = client.chat.completions.create(
-            model="asi1-mini",
+        completion = gateway.complete_validated(
+            lambda: SchemaStreamParser(QuestionsCompletion),
+            model=router.pick("generate-questions"),
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": instruction},
@@ -69,48 +152,37 @@ def generate_questions_sync(instruction: str, client: OpenAI) -> List[str]:
             max_tokens=2048,
             response_format={"type": "json_object"},
         )
-        response_text = str(r.choices[0].message.content)
-        
-        # --- ENHANCED LOGGING ---
-        # Log the raw response so we can debug what the LLM is sending
-        logger.info(f"Raw LLM response for questions: {response_text}")
-        
-        start_index = response_text.find('{')
-        end_index = response_text.rfind('}')
-        if start_index == -1 or end_index == -1:
-            raise ValueError("Could not find a JSON object in the LLM response.")
-        
-        json_str = response_text[start_index : end_index + 1]
-        questions_data = json.loads(json_str)
-
-        if isinstance(questions_data, dict) and "questions" in questions_data and isinstance(questions_data["questions"], list):
-            return questions_data["questions"]
-        else:
-            raise ValueError(f"LLM output JSON was not in the expected format: {json_str}")
+        return completion.questions
     except Exception as e:
         logger.error(f"Error processing LLM response for questions: {e}")
         # This is the message your frontend is receiving
         raise ValueError("Failed to parse valid question list from LLM output.") from e
 
 
-def score_screening_sync(instruction: str, questions: list, answers: list, client: OpenAI) -> Dict:
-    prompt_content = f"""
-    **Screening Instruction:**
-    {instruction}
-    **Questions Asked:**
-    {json.dumps(questions, indent=2)}
-    **User's Answers:**
-    {json.dumps(answers, indent=2)}
-    Please provide a final assessment and a score from 0-100 based on the user's answers.
-    """
+def score_screening_sync(instruction: str, questions: list, answers: list, gateway: LLMGateway) -> Dict:
     system_prompt = """
     You are an expert evaluator. Based on the provided data, provide a concise assessment
     and a score from 0 to 100.
     Output *only* a JSON object with two keys: "assessment" (string) and "score" (integer).
     """
+    model = router.pick("score-screening")
+    # Static request first, then the instruction, then each question with its (capped) answer
+    prompt_content = (
+        PromptBuilder("score-screening", model, 1024, system=system_prompt)
+        .static("Please provide a final assessment and a score from 0-100 based on the user's answers to the screening questions below.")
+        .text("**Screening Instruction:**", instruction, "instruction", max_tokens=SCREENING_PROMPT_INSTRUCTION_TOKENS, min_tokens=256)
+        .json(
+            "**Questions Asked and User's Answers:**",
+            [{"question": question, "answer": answer} for question, answer in zip(questions, answers)],
+            truncate={"answer": SCREENING_PROMPT_ANSWER_TOKENS, "question": None},
+        )
+        .build()
+        .text
+    )
     try:
-        r = client.chat.completions.create(
-            model="asi1-mini",
+        completion = gateway.complete_validated(
+            lambda: SchemaStreamParser(ScoreCompletion),
+            model=model,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": prompt_content},
@@ -118,36 +190,31 @@ def score_screening_sync(instruction: str, questions: list, answers: list, clien
             max_tokens=1024,
             response_format={"type": "json_object"},
         )
-        response_text = str(r.choices[0].message.content)
-
-        # --- ENHANCED LOGGING ---
-        logger.info(f"Raw LLM response for scoring: {response_text}")
-
-        start_index = response_text.find('{')
-        end_index = response_text.rfind('}')
-        if start_index == -1 or end_index == -1:
-            raise ValueError("Could not find a JSON object in the LLM scoring response.")
-
-        json_str = response_text[start_index : end_index + 1]
-        return json.loads(json_str)
+        return completion.dict()
     except Exception as e:
         logger.error(f"Error in score_screening_sync: {e}")
-        return {"assessment": f"An error occurred during evaluation: {str(e)}", "score": 0}
+        # Surface the failure to the caller instead of reporting a score of 0
+        raise
 
 # --- REST API Endpoints ---
 # (No changes needed in the endpoint handlers themselves)
 
 @screening_agent.on_rest_post("/generate-questions", InstructionRequest, QuestionsResponse)
+@observe_handler("/generate-questions", trace_logger=logger)
 async def handle_generate_questions(ctx: Context, req: InstructionRequest):
     logger.info(f"Received request to generate questions for: {req.instruction}")
     try:
-        questions = await asyncio.to_thread(generate_questions_sync, req.instruction, client)
+        questions = await question_flight.do(
+            prompt_key("generate-questions", req.instruction),
+            lambda: asyncio.to_thread(queued("to_thread", generate_questions_sync, req.instruction, gateway))
+        )
         return QuestionsResponse(status="success", questions=questions)
     except Exception as e:
         logger.error(f"Error in generate_questions handler: {e}")
         return QuestionsResponse(status="error", error_message=str(e))
 
 @screening_agent.on_rest_post("/submit-screening", ScreeningRequest, ScreeningResponse)
+@observe_handler("/submit-screening", trace_logger=logger)
 async def handle_submit_screening(ctx: Context, req: ScreeningRequest):
     logger.info(f"Received request to score screening for: {req.instruction}")
     try:
@@ -156,13 +223,14 @@ async def handle_submit_screening(ctx: Context, req: ScreeningRequest):
                 status="error",
                 error_message=f"Mismatch: Received {len(req.questions)} questions but {len(req.answers)} answers."
             )
-        result_data = await asyncio.to_thread(
+        result_data = await asyncio.to_thread(queued(
+            "to_thread",
             score_screening_sync,
             req.instruction,
             req.questions,
             req.answers,
-            client
-        )
+            gateway
+        ))
         return ScreeningResponse(
             status="success",
             assessment=result_data.get("assessment"),
@@ -172,12 +240,24 @@ async def handle_submit_screening(ctx: Context, req: ScreeningRequest):
         logger.error(f"Error in submit_screening handler: {e}")
         return ScreeningResponse(status="error", error_message=str(e))
 
+@screening_agent.on_rest_get("/gateway/stats", GatewayStatsResponse)
+async def handle_gateway_stats(ctx: Context):
+    return GatewayStatsResponse(**gateway.stats(), routes=router.stats(), upstream=prober.snapshot())
+
+@screening_agent.on_rest_get("/readyz", ReadinessResponse)
+async def handle_readiness(ctx: Context):
+    """Readiness from the startup warm-up; the REST server answering at all is liveness"""
+    return ReadinessResponse(**READINESS.snapshot())
+
 @screening_agent.on_event("startup")
 async def startup(ctx: Context):
     logger.info(f"Screening API agent started. Address: {ctx.agent.address}")
-    logger.info("Endpoints are available at http://12_7.0.0.1:8000/submit")
+    logger.info(f"Endpoints are available at http://127.0.0.1:{SCREENING_AGENT_PORT}/submit")
     logger.info("POST /submit/generate-questions")
     logger.info("POST /submit/submit-screening")
+    logger.info("GET /submit/gateway/stats")
+    logger.info("GET /submit/readyz")
+    start_metrics_server(SCREENING_METRICS_PORT)
 
 # --- Main Execution Block ---
 
@@ -187,5 +267,7 @@ if __name__ == "__main__":
         print("!!! WARNING: You are using the default API key.                           !!!")
         print("!!! Please set the 'ASI_API_KEY' environment variable to your actual key. !!!")
         print("!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!\n")
-    
+
+    # Not in the startup handler: uAgents runs that only after Almanac registration
+    start_warm_up()
     screening_agent.run()
\ No newline at end of file
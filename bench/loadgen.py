@@ -0,0 +1,258 @@
+# bench/loadgen.py
+
+"""
+Closed-loop load generator for the screening service and the quality agent.
+
+For every concurrency level, that many workers send requests back to back
+until --requests have completed (after --warmup requests that are not
+measured). The report has throughput, error rate, status counts and
+p50/p90/p99 latency per (scenario, concurrency), plus the git commit, so
+runs can be compared across commits with --compare.
+
+Scenarios:
+    generate-questions   POST /generate-questions         (screening-service)
+    submit-screening     POST /submit-screening           (screening-service)
+    assess-task-quality  POST /assess-task-quality        (agents/quality.py)
+
+Usage:
+    python bench/loadgen.py --scenarios generate-questions,submit-screening \\
+        --concurrency 1,8,32 --requests 200 --output bench/results/latest.json
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+SCENARIOS = ("generate-questions", "submit-screening", "assess-task-quality")
+
+# Instructions reused when --repeat-ratio > 0, so cache hits can be measured too
+HOT_INSTRUCTIONS = [
+    "Label the sentiment of product reviews as positive, negative or neutral.",
+    "Draw bounding boxes around every vehicle in street images.",
+    "Transcribe short customer support calls and tag the caller's intent.",
+]
+
+
+def build_request(scenario: str, seq: int, args) -> tuple:
+    """Return (url, JSON body) for the seq-th request of a scenario"""
+    hot = random.random() < args.repeat_ratio
+    instruction = random.choice(HOT_INSTRUCTIONS) if hot else f"Annotation task #{seq}: classify item {seq} into one of five categories."
+    if scenario == "generate-questions":
+        return f"{args.screening_url}/generate-questions", {
+            "projectId": f"bench-{seq % args.projects}",
+            "instruction": instruction,
+            "numQuestions": args.num_questions,
+        }
+    if scenario == "submit-screening":
+        questions = [
+            {"id": i + 1, "question": f"Explain how you would handle case {i + 1}.", "type": "short-answer"}
+            for i in range(args.num_questions)
+        ]
+        return f"{args.screening_url}/submit-screening", {
+            "projectId": f"bench-{seq % args.projects}",
+            "userId": f"annotator-{seq}",
+            "instruction": instruction,
+            "questions": questions,
+            "answers": [{"questionId": q["id"], "answer": f"Answer {seq} for question {q['id']}."} for q in questions],
+            "gradingMode": args.grading_mode,
+        }
+    if scenario == "assess-task-quality":
+        return f"{args.quality_url}/assess-task-quality", {
+            "task_instructions": instruction,
+            "completed_output": f"Output {seq}: the item belongs to category {seq % 5}.",
+            "evaluation_rubric": "Correct category, concise justification.",
+            "bypass_cache": not hot,
+        }
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+
+def is_success(response: httpx.Response) -> bool:
+    if response.status_code != 200:
+        return False
+    try:
+        body = response.json()
+    except ValueError:
+        return False
+    # FastAPI responses carry "success", uAgents responses carry "status"
+    return body.get("success") is True or body.get("status") == "success"
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    # Nearest-rank percentile
+    index = max(0, math.ceil(q / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+async def run_level(client: httpx.AsyncClient, scenario: str, concurrency: int, sequence, args) -> dict:
+    """Run one (scenario, concurrency) level; sequence numbers are unique across levels"""
+    latencies: List[float] = []
+    status_counts: Dict[str, int] = {}
+    errors = 0
+
+    async def drive(count: int, measured: bool):
+        remaining = count
+
+        async def worker():
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                url, body = build_request(scenario, next(sequence), args)
+                started = time.perf_counter()
+                try:
+                    response = await client.post(url, json=body)
+                    ok = is_success(response)
+                    status = str(response.status_code)
+                except httpx.HTTPError as e:
+                    ok, status = False, type(e).__name__
+                if measured:
+                    latencies.append(time.perf_counter() - started)
+                    status_counts[status] = status_counts.get(status, 0) + 1
+                    errors += 0 if ok else 1
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    await drive(args.warmup, measured=False)
+    started = time.perf_counter()
+    await drive(args.requests, measured=True)
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    ms = [v * 1000 for v in latencies]
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "error_rate": round(errors / len(latencies), 4) if latencies else 0.0,
+        "status_counts": status_counts,
+        "duration_s": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "latency_ms": {
+            "p50": _round(percentile(ms, 50)),
+            "p90": _round(percentile(ms, 90)),
+            "p99": _round(percentile(ms, 99)),
+            "mean": _round(sum(ms) / len(ms)) if ms else None,
+            "max": _round(ms[-1]) if ms else None,
+        },
+    }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 1) if value is not None else None
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> dict:
+    random.seed(args.seed)
+    levels = [int(c) for c in str(args.concurrency).split(",")]
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    sequence = itertools.count(1)
+    results = []
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        for scenario in args.scenarios.split(","):
+            for concurrency in levels:
+                result = await run_level(client, scenario, concurrency, sequence, args)
+                results.append(result)
+                print_row(result)
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        },
+        "results": results,
+    }
+
+
+def print_row(r: dict) -> None:
+    lat = r["latency_ms"]
+    print(
+        f"{r['scenario']:<22} c={r['concurrency']:<4} n={r['requests']:<5} "
+        f"rps={r['throughput_rps']:<8} p50={lat['p50']}ms p90={lat['p90']}ms p99={lat['p99']}ms "
+        f"errors={r['error_rate']:.2%}"
+    )
+
+
+def compare(report: dict, baseline: dict) -> None:
+    """Print throughput and latency changes against a previous report"""
+    base = {(r["scenario"], r["concurrency"]): r for r in baseline["results"]}
+    print(f"\nComparison against {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')}):")
+    for r in report["results"]:
+        old = base.get((r["scenario"], r["concurrency"]))
+        if old is None:
+            continue
+        cells = []
+        for label, new_value, old_value in (
+            ("rps", r["throughput_rps"], old["throughput_rps"]),
+            ("p50", r["latency_ms"]["p50"], old["latency_ms"]["p50"]),
+            ("p99", r["latency_ms"]["p99"], old["latency_ms"]["p99"]),
+        ):
+            if new_value is None or not old_value:
+                continue
+            cells.append(f"{label} {old_value} -> {new_value} ({(new_value - old_value) / old_value:+.1%})")
+        print(f"{r['scenario']:<22} c={r['concurrency']:<4} " + "  ".join(cells))
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS[:2]), help=f"comma-separated: {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per level")
+    parser.add_argument("--warmup", type=int, default=10, help="unmeasured requests per level")
+    parser.add_argument("--screening-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--quality-url", default="http://127.0.0.1:8001")
+    parser.add_argument("--num-questions", type=int, default=5)
+    parser.add_argument("--projects", type=int, default=10, help="distinct projectIds")
+    parser.add_argument("--repeat-ratio", type=float, default=0.0, help="share of requests reusing a hot instruction (cache hits)")
+    parser.add_argument("--grading-mode", default="single", choices=("single", "per-question"))
+    parser.add_argument("--timeout", type=float, default=180.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="previous JSON report to compare against")
+
+
+def finish(report: dict, args, compare: Callable[[dict, dict], None] = compare) -> None:
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for the screening service and quality agent")
+    add_arguments(parser)
+    args = parser.parse_args()
+    unknown = set(args.scenarios.split(",")) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    finish(asyncio.run(run(args)), args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+# bench/mock_openai.py
+
+"""
+Local OpenAI-compatible stand-in for benchmarking without API credits.
+
+Serves POST /v1/chat/completions (plain and streamed) and GET /v1/models.
+The reply is a canned JSON payload chosen by recognizing the prompt of the
+calling service (screening-service question generation and grading, the
+screening agent and the quality agent), so every response parses.
+
+Latency, streaming speed and failures are configurable:
+    --latency lognormal:0.8,0.5   time to first byte (median seconds, sigma)
+    --latency uniform:0.2,1.5 | fixed:0.5
+    --token-delay 0.005           seconds between streamed chunks
+    --error-rate 0.01             share of calls answered with a 500
+    --rate-limit-rate 0.02        share of calls answered with a 429 + Retry-After
+
+GET /stats reports calls per payload kind and injected failures.
+
+Usage:
+    python bench/mock_openai.py --port 9999 --latency lognormal:0.8,0.5
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from typing import List, Optional, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Mock OpenAI")
+
+
+class MockConfig:
+    def __init__(self, latency: str = "fixed:0", token_delay: float = 0.0, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, retry_after: float = 1.0, chunk_chars: int = 16, seed: Optional[int] = None):
+        self.latency_kind, self.latency_params = parse_latency(latency)
+        self.token_delay = token_delay
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.chunk_chars = chunk_chars
+        self.rng = random.Random(seed)
+
+    def sample_latency(self) -> float:
+        if self.latency_kind == "fixed":
+            return self.latency_params[0]
+        if self.latency_kind == "uniform":
+            return self.rng.uniform(*self.latency_params)
+        median, sigma = self.latency_params
+        return self.rng.lognormvariate(0, sigma) * median
+
+
+def parse_latency(spec: str) -> Tuple[str, List[float]]:
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",") if v]
+    expected = {"fixed": 1, "uniform": 2, "lognormal": 2}
+    if kind not in expected or len(values) != expected[kind]:
+        raise ValueError(f"Invalid latency spec '{spec}'; use fixed:S, uniform:LO,HI or lognormal:MEDIAN,SIGMA")
+    return kind, values
+
+
+config = MockConfig()
+stats = {"calls": {}, "errors": 0, "rate_limited": 0, "streamed": 0}
+
+
+# --- Canned payloads ---
+
+def _prompt_text(messages: List[dict]) -> Tuple[str, str]:
+    system = " ".join(str(m.get("content", "")) for m in messages if m.get("role") == "system")
+    user = " ".join(str(m.get("content", "")) for m in messages if m.get("role") != "system")
+    return system, user
+
+
+def _score(rng: random.Random) -> int:
+    return rng.randint(40, 100)
+
+
+def canned_payload(messages: List[dict], rng: random.Random) -> Tuple[str, str]:
+    """Return (payload kind, completion text) matching the prompt that was sent"""
+    system, user = _prompt_text(messages)
+
+    if "creating a screening test" in user:
+        count = int((re.search(r"Generate (\d+) screening questions", user) or [0, 5])[1])
+        questions = []
+        for idx in range(count):
+            # Distinct case numbers so question pools can fill up without duplicates
+            case = rng.randint(1, 10 ** 6)
+            if idx % 2:
+                options = [f"Option {c}" for c in "ABCD"]
+                questions.append({"id": idx + 1, "question": f"Which option best fits case {case}?",
+                                  "type": "multiple-choice", "options": options, "correctAnswer": rng.choice(options)})
+            else:
+                questions.append({"id": idx + 1, "question": f"Explain how you would handle case {case}.",
+                                  "type": "short-answer"})
+        return "generate-questions", json.dumps(questions, indent=2)
+
+    if "grading several independent" in user:
+        # The submissions are embedded as one compact JSON line after "Submissions:"
+        submissions = json.loads(user.split("Submissions:\n", 1)[1].split("\n", 1)[0])
+        results = []
+        for submission in submissions:
+            details = [{"questionId": qa.get("questionId"), "score": _score(rng), "feedback": "Mock feedback."}
+                       for qa in submission.get("qaPairs", [])]
+            overall = round(sum(d["score"] for d in details) / len(details), 2) if details else 0
+            results.append({"submissionId": submission["submissionId"], "detailedResults": details, "overallScore": overall,
+                            "status": "passed" if overall >= 70 else "failed", "feedback": "Mock batch grading."})
+        return "grade-batch", json.dumps({"results": results})
+
+    if "grading one answer" in user:
+        question_id = int((re.search(r'"questionId":\s*(\d+)', user) or [0, 1])[1])
+        return "grade-question", json.dumps({"questionId": question_id, "score": _score(rng), "feedback": "Mock feedback."})
+
+    if "grading a screening test" in user:
+        # The example in the prompt template uses questionId 1; only count the Q&A pairs
+        qa_section = user.split("Questions and Answers:", 1)[-1].split("Evaluate each answer", 1)[0]
+        ids = sorted({int(q) for q in re.findall(r'"questionId":\s*(\d+)', qa_section)}) or [1]
+        details = [{"questionId": q, "score": _score(rng), "feedback": "Mock feedback."} for q in ids]
+        overall = round(sum(d["score"] for d in details) / len(details), 2)
+        return "grade", json.dumps({"detailedResults": details, "overallScore": overall,
+                                    "status": "passed" if overall >= 70 else "failed", "feedback": "Mock grading."}, indent=2)
+
+    if "quality_feedback" in system:
+        return "assess-task-quality", json.dumps({"quality_feedback": "Mock assessment.", "quality_score": _score(rng)})
+
+    if '"questions"' in system:
+        return "agent-questions", json.dumps({"questions": [f"Mock question {i + 1}?" for i in range(5)]})
+
+    if '"assessment"' in system:
+        return "agent-score", json.dumps({"assessment": "Mock assessment.", "score": _score(rng)})
+
+    return "unknown", json.dumps({"ok": True})
+
+
+# --- OpenAI-compatible endpoints ---
+
+def _usage(messages: List[dict], text: str) -> dict:
+    prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4 + 1
+    completion_tokens = len(text) // 4 + 1
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+
+def _error(status: int, message: str, error_type: str, headers: Optional[dict] = None) -> JSONResponse:
+    return JSONResponse(status_code=status, headers=headers, content={"error": {"message": message, "type": error_type, "code": None}})
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages", [])
+    model = body.get("model", "mock")
+
+    await asyncio.sleep(config.sample_latency())
+    roll = config.rng.random()
+    if roll < config.rate_limit_rate:
+        stats["rate_limited"] += 1
+        return _error(429, "Rate limit reached (injected)", "rate_limit_exceeded", {"retry-after": str(config.retry_after)})
+    if roll < config.rate_limit_rate + config.error_rate:
+        stats["errors"] += 1
+        return _error(500, "Internal error (injected)", "server_error")
+
+    kind, text = canned_payload(messages, config.rng)
+    stats["calls"][kind] = stats["calls"].get(kind, 0) + 1
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+
+    if not body.get("stream"):
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": _usage(messages, text),
+        }
+
+    stats["streamed"] += 1
+
+    async def events():
+        def chunk(delta: dict, finish_reason=None) -> str:
+            payload = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                       "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            return f"data: {json.dumps(payload)}\n\n"
+
+        yield chunk({"role": "assistant", "content": ""})
+        for start in range(0, len(text), config.chunk_chars):
+            if config.token_delay:
+                await asyncio.sleep(config.token_delay)
+            yield chunk({"content": text[start:start + config.chunk_chars]})
+        yield chunk({}, "stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/v1/models")
+async def list_models():
+    return {"object": "list", "data": [{"id": m, "object": "model", "owned_by": "mock"} for m in ("gpt-4", "gpt-4o-mini", "asi1-mini")]}
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible mock server for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--latency", default="lognormal:0.8,0.5", help="fixed:S | uniform:LO,HI | lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="seconds between streamed chunks")
+    parser.add_argument("--chunk-chars", type=int, default=16, help="characters per streamed chunk")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    global config
+    config = MockConfig(args.latency, args.token_delay, args.error_rate, args.rate_limit_rate,
+                        args.retry_after, args.chunk_chars, args.seed)
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
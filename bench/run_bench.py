@@ -0,0 +1,125 @@
+# bench/run_bench.py
+
+"""
+One-command offline benchmark.
+
+Starts the mock OpenAI server, screening-service/main.py (uvicorn) and
+agents/quality.py pointed at the mock, waits until they answer, runs the
+load generator and shuts everything down. No API credits are used.
+
+Gateway rate limits are lifted by default (--llm-rate-limits) so the numbers
+reflect the services rather than the configured upstream quota.
+
+Usage:
+    python bench/run_bench.py --concurrency 1,8,32 --requests 200 \\
+        --latency lognormal:0.8,0.5 --output bench/results/$(git rev-parse --short HEAD).json
+    python bench/run_bench.py ... --compare bench/results/<baseline>.json
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from loadgen import SCENARIOS, add_arguments, finish, run
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start(name: str, args, cwd: str, env: dict, log_dir: str) -> subprocess.Popen:
+    log = open(os.path.join(log_dir, f"{name}.log"), "w", encoding="utf-8")
+    return subprocess.Popen(args, cwd=cwd, env={**os.environ, **env}, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_ready(name: str, url: str, process: subprocess.Popen, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{name} exited with code {process.returncode}; see its log")
+        try:
+            if httpx.get(url, timeout=2).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"{name} did not become ready at {url} within {timeout}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the offline benchmark against a local mock OpenAI server")
+    add_arguments(parser)
+    parser.set_defaults(scenarios=",".join(SCENARIOS))
+    parser.add_argument("--mock-port", type=int, default=9999)
+    parser.add_argument("--latency", default="lognormal:0.8,0.5", help="mock time to first byte, see mock_openai.py")
+    parser.add_argument("--token-delay", type=float, default=0.005)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--llm-rate-limits", default="gpt-4=1000000:1000000000,gpt-4o-mini=1000000:1000000000,asi1-mini=1000000:1000000000")
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--log-dir", default=os.path.join(REPO_ROOT, "bench", "logs"))
+    args = parser.parse_args()
+
+    os.makedirs(args.log_dir, exist_ok=True)
+    scenarios = set(args.scenarios.split(","))
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    upstream_env = {
+        "LLM_RATE_LIMITS": args.llm_rate_limits,
+        "SCREENING_METRICS_PORT": "0",
+        "QUALITY_METRICS_PORT": "0",
+    }
+
+    processes = []
+    try:
+        mock = start("mock_openai", [
+            sys.executable, os.path.join(REPO_ROOT, "bench", "mock_openai.py"),
+            "--port", str(args.mock_port),
+            "--latency", args.latency,
+            "--token-delay", str(args.token_delay),
+            "--error-rate", str(args.error_rate),
+            "--rate-limit-rate", str(args.rate_limit_rate),
+            "--seed", str(args.seed),
+        ], REPO_ROOT, {}, args.log_dir)
+        processes.append(mock)
+        wait_ready("mock_openai", f"{mock_url}/v1/models", mock, args.startup_timeout)
+
+        if scenarios & {"generate-questions", "submit-screening"}:
+            port = args.screening_url.rsplit(":", 1)[-1]
+            screening = start("screening-service", [
+                sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", port, "--log-level", "warning",
+            ], os.path.join(REPO_ROOT, "screening-service"), {
+                **upstream_env,
+                "OPENAI_API_KEY": "bench",
+                "OPENAI_BASE_URL": f"{mock_url}/v1",
+            }, args.log_dir)
+            processes.append(screening)
+            wait_ready("screening-service", f"{args.screening_url}/", screening, args.startup_timeout)
+
+        if "assess-task-quality" in scenarios:
+            quality = start("quality-agent", [sys.executable, "quality.py"], os.path.join(REPO_ROOT, "agents"), {
+                **upstream_env,
+                "ASI_API_KEY": "bench",
+                "ASI_BASE_URL": f"{mock_url}/v1",
+                "QUALITY_CACHE_PATH": "",
+            }, args.log_dir)
+            processes.append(quality)
+            wait_ready("quality-agent", f"{args.quality_url}/gateway/stats", quality, args.startup_timeout)
+
+        report = asyncio.run(run(args))
+        report["meta"]["mock"] = httpx.get(f"{mock_url}/stats", timeout=5).json()
+        finish(report, args)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+# bench/startup_bench.py
+
+"""
+Startup-time benchmark for the screening service and the quality agent, eager
+(default) vs LAZY_STARTUP=1.
+
+Two measurements per service and mode:
+
+  import   `python -X importtime -c "import <module>"`: total import time of
+           the service module and the slowest top-level packages (self time
+           summed per package), median of --runs.
+  launch   the service started against the local mock (bench/mock_openai.py):
+           seconds from launch until it answers at all (live), until the
+           first real request completes, and until /readyz reports ready
+           (ready_after_seconds, from process start), median of --runs.
+
+Usage:
+    python bench/startup_bench.py --output bench/results/startup-$(git rev-parse --short HEAD).json
+    python bench/startup_bench.py --compare bench/results/startup-<baseline>.json
+"""
+
+import argparse
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+from loadgen import build_request, finish, git_commit, is_success
+from run_bench import REPO_ROOT, start, wait_ready
+
+# name -> (directory, module, uvicorn app or None, readiness path, scenario for the first request)
+SERVICES = {
+    "screening-service": ("screening-service", "main", "main:app", "/readyz", "submit-screening"),
+    "quality-agent": ("agents", "quality", None, "/readyz", "assess-task-quality"),
+}
+
+MODES = {"eager": "0", "lazy": "1"}
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def service_env(mock_url: str, lazy: str) -> dict:
+    return {
+        "LAZY_STARTUP": lazy,
+        "SCREENING_METRICS_PORT": "0",
+        "QUALITY_METRICS_PORT": "0",
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"{mock_url}/v1",
+        "ASI_API_KEY": "bench",
+        "ASI_BASE_URL": f"{mock_url}/v1",
+        "QUALITY_CACHE_PATH": "",
+    }
+
+
+def import_profile(directory: str, module: str, env: dict) -> dict:
+    """Total import time of `module` (ms) and self time (ms) per top-level package"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.join(REPO_ROOT, directory), env={**os.environ, **env},
+        capture_output=True, text=True, check=True,
+    )
+    total = None
+    packages: Dict[str, float] = defaultdict(float)
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        packages[name.split(".")[0]] += int(self_us) / 1000
+        if name == module and not indent:
+            total = int(cumulative_us) / 1000
+    return {"total_ms": total, "packages_ms": dict(packages)}
+
+
+def launch(name: str, args, env: dict, log_dir: str) -> dict:
+    """Start a service, then time liveness, the first real request and readiness"""
+    directory, module, asgi_app, readiness_path, scenario = SERVICES[name]
+    url = args.screening_url if name == "screening-service" else args.quality_url
+    if asgi_app is not None:
+        command = [sys.executable, "-m", "uvicorn", asgi_app, "--host", "127.0.0.1", "--port", url.rsplit(":", 1)[-1], "--log-level", "warning"]
+    else:
+        command = [sys.executable, f"{module}.py"]
+    launched = time.perf_counter()
+    process = start(name, command, os.path.join(REPO_ROOT, directory), env, log_dir)
+    try:
+        deadline = launched + args.startup_timeout
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"{name} exited with code {process.returncode}; see its log")
+            if time.perf_counter() > deadline:
+                raise RuntimeError(f"{name} did not answer within {args.startup_timeout}s")
+            try:
+                httpx.get(f"{url}{readiness_path}", timeout=2)
+                break
+            except httpx.HTTPError:
+                time.sleep(0.01)
+        live = time.perf_counter() - launched
+
+        # Sent as soon as the port answers, i.e. possibly before the warm-up finished
+        request_url, body = build_request(scenario, 1, args)
+        response = httpx.post(request_url, json=body, timeout=args.timeout)
+        first_response = time.perf_counter() - launched
+        if not is_success(response):
+            raise RuntimeError(f"{name} first request failed: {response.status_code} {response.text[:200]}")
+
+        while True:
+            readiness = httpx.get(f"{url}{readiness_path}", timeout=2).json()
+            readiness = readiness.get("detail", readiness)
+            if readiness["ready"]:
+                break
+            if time.perf_counter() > deadline:
+                raise RuntimeError(f"{name} did not become ready within {args.startup_timeout}s")
+            time.sleep(0.01)
+        return {
+            "live_s": live,
+            "first_response_s": first_response,
+            "first_request_ms": (first_response - live) * 1000,
+            "ready_s": readiness["ready_after_seconds"],
+        }
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def median_of(samples: List[dict], key: str, digits: int) -> Optional[float]:
+    values = [s[key] for s in samples if s.get(key) is not None]
+    return round(statistics.median(values), digits) if values else None
+
+
+def print_row(r: dict) -> None:
+    top = ", ".join(f"{package} {ms}" for package, ms in r["import"]["top_packages_ms"].items())
+    launch_ = r["launch"]
+    print(
+        f"{r['service']:<18} {r['mode']:<6} import={r['import']['total_ms']}ms "
+        f"live={launch_['live_s']}s first_response={launch_['first_response_s']}s "
+        f"(request {launch_['first_request_ms']}ms) ready={launch_['ready_s']}s"
+    )
+    print(f"{'':<25} slowest imports (ms): {top}")
+
+
+def compare(report: dict, baseline: dict) -> None:
+    """Print startup time changes against a previous report"""
+    base = {(r["service"], r["mode"]): r for r in baseline["results"]}
+    print(f"\nComparison against {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')}):")
+    for r in report["results"]:
+        old = base.get((r["service"], r["mode"]))
+        if old is None:
+            continue
+        cells = []
+        for label, new_value, old_value in (
+            ("import", r["import"]["total_ms"], old["import"]["total_ms"]),
+            ("live", r["launch"]["live_s"], old["launch"]["live_s"]),
+            ("first_response", r["launch"]["first_response_s"], old["launch"]["first_response_s"]),
+            ("ready", r["launch"]["ready_s"], old["launch"]["ready_s"]),
+        ):
+            if new_value is None or not old_value:
+                continue
+            cells.append(f"{label} {old_value} -> {new_value} ({(new_value - old_value) / old_value:+.1%})")
+        print(f"{r['service']:<18} {r['mode']:<6} " + "  ".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time and time to first request, eager vs LAZY_STARTUP=1")
+    parser.add_argument("--services", default=",".join(SERVICES), help=f"comma-separated: {', '.join(SERVICES)}")
+    parser.add_argument("--modes", default=",".join(MODES), help="comma-separated: eager, lazy")
+    parser.add_argument("--runs", type=int, default=3, help="runs per service and mode (medians are reported)")
+    parser.add_argument("--top", type=int, default=5, help="slowest top-level packages to list")
+    parser.add_argument("--screening-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--quality-url", default="http://127.0.0.1:8001")
+    parser.add_argument("--mock-port", type=int, default=9999)
+    parser.add_argument("--latency", default="fixed:0.05", help="mock time to first byte, see mock_openai.py")
+    parser.add_argument("--num-questions", type=int, default=5)
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--log-dir", default=os.path.join(REPO_ROOT, "bench", "logs"))
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="previous JSON report to compare against")
+    args = parser.parse_args()
+    # Fields build_request() reads
+    args.repeat_ratio, args.projects, args.grading_mode = 0.0, 1, "single"
+
+    os.makedirs(args.log_dir, exist_ok=True)
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    mock = start("mock_openai", [
+        sys.executable, os.path.join(REPO_ROOT, "bench", "mock_openai.py"),
+        "--port", str(args.mock_port), "--latency", args.latency,
+    ], REPO_ROOT, {}, args.log_dir)
+    results = []
+    try:
+        wait_ready("mock_openai", f"{mock_url}/v1/models", mock, args.startup_timeout)
+        for name in args.services.split(","):
+            directory, module = SERVICES[name][:2]
+            for mode in args.modes.split(","):
+                env = service_env(mock_url, MODES[mode])
+                imports = [import_profile(directory, module, env) for _ in range(args.runs)]
+                launches = [launch(name, args, env, args.log_dir) for _ in range(args.runs)]
+                packages = {
+                    package: round(statistics.median(i["packages_ms"].get(package, 0.0) for i in imports), 1)
+                    for package in imports[0]["packages_ms"]
+                }
+                result = {
+                    "service": name,
+                    "mode": mode,
+                    "import": {
+                        "total_ms": median_of(imports, "total_ms", 1),
+                        "top_packages_ms": dict(sorted(packages.items(), key=lambda p: -p[1])[:args.top]),
+                    },
+                    "launch": {
+                        "live_s": median_of(launches, "live_s", 3),
+                        "first_response_s": median_of(launches, "first_response_s", 3),
+                        "first_request_ms": median_of(launches, "first_request_ms", 1),
+                        "ready_s": median_of(launches, "ready_s", 3),
+                    },
+                }
+                results.append(result)
+                print_row(result)
+    finally:
+        mock.terminate()
+        mock.wait(timeout=10)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        },
+        "results": results,
+    }
+    finish(report, args, compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+# deploy/app.py
+
+"""
+One ASGI app for the multi-worker deployment: the screening service
+(screening-service/main.py) at / and the quality assessment endpoints of
+agents/quality.py under /quality (e.g. POST /quality/assess-task-quality).
+
+Started by deploy/serve.py; `uvicorn app:app` from this directory also works.
+"""
+
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (os.path.join(REPO_ROOT, "agents"), os.path.join(REPO_ROOT, "screening-service"), REPO_ROOT):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import main as screening
+import quality
+from shared.agent_rest import asgi_app
+
+app = screening.app
+app.mount("/quality", asgi_app(quality.rest, "DataChain Quality Assessment"))
+
+# Mounted apps get no lifespan events, so the quality background work hangs off the outer app
+app.add_event_handler("startup", quality.start_background_work)
+app.add_event_handler("shutdown", quality.stop_background_work)
@@ -0,0 +1,58 @@
+# deploy/serve.py
+
+"""
+Production launcher: deploy/app.py (screening service plus quality
+assessment endpoints) in several uvicorn worker processes sharing one port.
+
+State that must agree across workers lives in SQLite files in WAL mode:
+LLM rate-limit buckets, answer keys, adaptive screening sessions and
+pool-fill leases (SHARED_STATE_PATH), plus the question pools, annotator
+qualifications, job queues and the quality result cache, which are file-backed
+on their own. Each worker runs
+its own job worker processes (SCREENING_JOB_WORKERS / QUALITY_JOB_WORKERS,
+default 1 per worker here); they all drain the same queues.
+
+On SIGTERM or Ctrl-C uvicorn stops accepting connections, waits up to
+--graceful-timeout seconds for in-flight requests, then runs the shutdown
+handlers (job workers and probes stop, upstream connections close).
+Workers that die are restarted.
+
+Usage:
+    python deploy/serve.py --workers 4 --port 8000
+"""
+
+import argparse
+import os
+
+import uvicorn
+
+DEPLOY_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1))))
+    parser.add_argument("--graceful-timeout", type=float, default=float(os.getenv("GRACEFUL_TIMEOUT", "30")))
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info"))
+    args = parser.parse_args()
+
+    # Inherited by the worker processes
+    os.environ.setdefault("SHARED_STATE_PATH", os.path.join(DEPLOY_DIR, "shared_state.sqlite3"))
+    os.environ.setdefault("SCREENING_JOB_WORKERS", "1")
+    os.environ.setdefault("QUALITY_JOB_WORKERS", "1")
+
+    uvicorn.run(
+        "app:app",
+        app_dir=DEPLOY_DIR,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level=args.log_level,
+    )
+
+
+if __name__ == "__main__":
+    main()
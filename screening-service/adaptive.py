@@ -0,0 +1,148 @@
+# screening-service/adaptive.py
+
+"""
+Adaptive screening sessions: answers are graded one at a time and the test
+ends as soon as its pass/fail outcome is settled.
+
+The outcome is the pass/fail of the full test's mean score. After each answer
+two bounds on that mean are combined:
+1. Exact bounds: the remaining questions all scoring 0 or all scoring 100.
+2. A one-sided confidence bound on the mean of the questions answered so far.
+   It uses the sample standard deviation (never below min_std, so a few
+   identical scores do not look certain) and the finite-population correction,
+   because questions are drawn without replacement from a fixed test. The
+   bound tightens to the exact mean once every question is answered.
+
+The session is decided once the lower bound reaches the pass score (passed)
+or the upper bound falls below it (failed).
+"""
+
+import math
+import statistics
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence
+
+PASS_SCORE = 70
+MAX_SCORE = 100
+
+
+@dataclass
+class Settlement:
+    passed: Optional[bool]  # None while undecided
+    mean: Optional[float]
+    lower: float
+    upper: float
+
+
+def settle(
+    scores: Sequence[float],
+    total: int,
+    pass_score: float = PASS_SCORE,
+    confidence: float = 0.95,
+    min_answers: int = 3,
+    min_std: float = 10.0,
+) -> Settlement:
+    """Bound the full-test mean score after len(scores) of total answers and decide if possible"""
+    if total <= 0:
+        raise ValueError("A screening test needs at least one question")
+    n = len(scores)
+    answered_total = sum(scores)
+    lower = answered_total / total
+    upper = (answered_total + MAX_SCORE * (total - n)) / total
+    mean = answered_total / n if n else None
+
+    if n >= total:
+        return Settlement(mean >= pass_score, mean, mean, mean)
+    if n >= min_answers:
+        std = max(statistics.stdev(scores) if n > 1 else 0.0, min_std)
+        fpc = math.sqrt((total - n) / (total - 1))
+        half_width = statistics.NormalDist().inv_cdf(confidence) * std / math.sqrt(n) * fpc
+        lower = max(lower, mean - half_width)
+        upper = min(upper, mean + half_width)
+
+    passed = True if lower >= pass_score else False if upper < pass_score else None
+    return Settlement(passed, mean, lower, upper)
+
+
+class SessionConflict(Exception):
+    """The answer cannot be recorded: the session is finished or the question was already answered"""
+
+
+@dataclass
+class ScreeningSession:
+    id: str
+    project_id: str
+    user_id: str
+    instruction: str
+    questions: List[dict]  # in the order they are asked
+    grades: Dict[str, dict] = field(default_factory=dict)  # str(questionId) -> {"questionId", "score", "feedback"}
+    status: str = "in-progress"  # "in-progress", "passed" or "failed"
+    created_at: float = field(default_factory=time.time)
+
+    @property
+    def finished(self) -> bool:
+        return self.status != "in-progress"
+
+    @property
+    def unanswered(self) -> int:
+        return len(self.questions) - len(self.grades)
+
+    def question(self, question_id: int) -> Optional[dict]:
+        return next((q for q in self.questions if q["id"] == question_id), None)
+
+    def next_question(self) -> Optional[dict]:
+        if self.finished:
+            return None
+        return next((q for q in self.questions if str(q["id"]) not in self.grades), None)
+
+    def results(self) -> List[dict]:
+        """Grades in question order"""
+        return [self.grades[str(q["id"])] for q in self.questions if str(q["id"]) in self.grades]
+
+
+class SessionStore:
+    """
+    Sessions as documents in a StateStore (in memory, or shared by every worker
+    process with SHARED_STATE_PATH); a session expires ttl_seconds after it started.
+    """
+
+    def __init__(self, state, ttl_seconds: float = 3600):
+        self.state = state
+        self.ttl_seconds = ttl_seconds
+
+    def create(self, project_id: str, user_id: str, instruction: str, questions: List[dict]) -> ScreeningSession:
+        session = ScreeningSession(uuid.uuid4().hex, project_id, user_id, instruction, questions)
+        self.state.put("screening-sessions", session.id, asdict(session), self.ttl_seconds)
+        return session
+
+    def get(self, session_id: str) -> Optional[ScreeningSession]:
+        document = self.state.get("screening-sessions", session_id)
+        return ScreeningSession(**document) if document is not None else None
+
+    def record(self, session_id: str, grade: dict, decide: Callable[[ScreeningSession], Optional[bool]]) -> ScreeningSession:
+        """
+        Atomically add a grade and apply decide(session) (True passed, False failed,
+        None undecided). Raises SessionConflict if the session is finished or the
+        question was already answered, e.g. by a concurrent request.
+        """
+        updated: List[ScreeningSession] = []
+
+        def apply(document: Optional[dict]) -> dict:
+            if document is None:
+                raise KeyError(session_id)
+            session = ScreeningSession(**document)
+            if session.finished:
+                raise SessionConflict(f"Session already {session.status}")
+            if str(grade["questionId"]) in session.grades:
+                raise SessionConflict(f"Question {grade['questionId']} was already answered")
+            session.grades[str(grade["questionId"])] = grade
+            passed = decide(session)
+            if passed is not None:
+                session.status = "passed" if passed else "failed"
+            updated.append(session)
+            return asdict(session)
+
+        self.state.update("screening-sessions", session_id, apply, ttl=None)
+        return updated[0]
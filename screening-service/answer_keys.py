@@ -0,0 +1,227 @@
+# screening-service/answer_keys.py
+
+"""
+Server-side answer keys for generated multiple-choice questions.
+
+/generate-questions asks GPT-4 for the correct option of every multiple-choice
+question; the key is stored here per projectId (never returned to the
+annotator) so /submit-screening can grade those answers locally and only send
+short-answer items to the LLM.
+
+Every other question the service serves is stored with the UNKEYED marker,
+so served() can tell questions the service handed out from client-supplied
+ones (only the former may earn an annotator a qualification).
+
+With a shared StateStore, keys are also written there, so every worker
+process of a multi-worker deployment can grade questions another worker
+generated.
+
+Keys of at most max_projects projects are kept in memory; the least recently
+used project is dropped beyond that (with a shared StateStore its keys are
+still found there). The optional JSON file is written like the question
+cache's: record() only marks the keys dirty and a background thread writes
+them at most once per flush_interval.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger("AnswerKeys")
+
+# Stored for a served question that has no locally gradable key
+UNKEYED = -1
+
+_LETTER_RE = re.compile(r"^(?:option\s+)?\(?([a-z])(?:[).:]|$)")
+
+
+def _normalize(text: str) -> str:
+    return " ".join(str(text).lower().split()).strip(" .")
+
+
+def match_option(answer: str, options: List[str]) -> Optional[int]:
+    """
+    Resolve a free-text answer to an option index.
+    Accepts the option text itself, a letter ("B", "b)", "Option B") or a 1-based number.
+    """
+    if not options or answer is None:
+        return None
+    normalized = _normalize(answer)
+    normalized_options = [_normalize(o) for o in options]
+    if normalized in normalized_options:
+        return normalized_options.index(normalized)
+    if normalized.isdigit():
+        idx = int(normalized) - 1
+        return idx if 0 <= idx < len(options) else None
+    letter = _LETTER_RE.match(normalized)
+    if letter:
+        idx = ord(letter.group(1)) - ord("a")
+        if 0 <= idx < len(options):
+            return idx
+    return None
+
+
+class AnswerKeyStore:
+    def __init__(
+        self,
+        persist_path: Optional[str] = None,
+        state=None,
+        max_projects: int = 10_000,
+        flush_interval: float = 1.0,
+    ):
+        self.persist_path = persist_path
+        self.state = state
+        self.max_projects = max_projects
+        self.flush_interval = flush_interval
+        # projectId -> normalized question text -> correct option index (or UNKEYED), least recently used project first
+        self._keys: "OrderedDict[str, Dict[str, int]]" = OrderedDict()
+        # Guards _keys against the writer thread's snapshot
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        if persist_path:
+            self._load()
+
+    def record(self, project_id: str, questions: List[dict]) -> None:
+        """
+        Store the questions served for a project: the correct option of every multiple-choice
+        question that has a resolvable correctAnswer, UNKEYED for the rest.
+        """
+        changed = {}
+        for q in questions:
+            idx = UNKEYED
+            if q.get("type") == "multiple-choice" and q.get("correctAnswer") is not None:
+                idx = match_option(q["correctAnswer"], q.get("options") or [])
+                if idx is None:
+                    logger.warning(f"Unresolvable correctAnswer for question: {q.get('question')}")
+                    idx = UNKEYED
+            changed[_normalize(q["question"])] = idx
+        with self._lock:
+            project_keys = self._project(project_id)
+            changed = {k: idx for k, idx in changed.items() if project_keys.get(k) != idx}
+            project_keys.update(changed)
+        if self.state is not None:
+            for question_key, idx in changed.items():
+                self.state.put(f"answer-keys:{project_id}", question_key, idx)
+        if changed and self.persist_path:
+            self._schedule_save()
+
+    def flush(self) -> None:
+        """Write pending changes now (e.g. on shutdown) instead of waiting for the writer thread"""
+        if self.persist_path and self._dirty.is_set():
+            self._dirty.clear()
+            self._save()
+
+    def keys_for(self, project_id: str, questions) -> Dict[str, int]:
+        """Stored keys (UNKEYED included) of the given questions, e.g. to hand them to a job worker process"""
+        keys = {}
+        for q in questions:
+            question_key = _normalize(q.question)
+            idx = self._stored(project_id, question_key)
+            if idx is not None:
+                keys[question_key] = idx
+        return keys
+
+    def served(self, project_id: str, questions: List[str]) -> bool:
+        """Whether the service handed out every one of these question texts for the project"""
+        return bool(questions) and all(self._stored(project_id, _normalize(q)) is not None for q in questions)
+
+    def restore(self, project_id: str, keys: Dict[str, int]) -> None:
+        """Add keys exported with keys_for (in memory only)"""
+        with self._lock:
+            self._project(project_id).update(keys)
+
+    def lookup(self, project_id: str, question: str) -> Optional[int]:
+        idx = self._stored(project_id, _normalize(question))
+        return None if idx == UNKEYED else idx
+
+    def grade_locally(self, project_id: str, questions, answers) -> Tuple[Dict[int, dict], list]:
+        """
+        Grade every multiple-choice question that has a stored key.
+        Returns (results by questionId, questions that still need LLM grading).
+        """
+        answers_by_id = {}
+        for a in answers:
+            answers_by_id.setdefault(a.questionId, a.answer)
+
+        local_results: Dict[int, dict] = {}
+        remaining = []
+        for q in questions:
+            correct_idx = self.lookup(project_id, q.question) if q.type == "multiple-choice" else None
+            if correct_idx is None:
+                remaining.append(q)
+                continue
+            answer = answers_by_id.get(q.id)
+            is_correct = answer is not None and match_option(answer, q.options or []) == correct_idx
+            local_results[q.id] = {
+                "questionId": q.id,
+                "score": 100 if is_correct else 0,
+                "feedback": "Correct." if is_correct else ("No answer provided." if answer is None else "Incorrect answer."),
+            }
+        return local_results, remaining
+
+    def _stored(self, project_id: str, question_key: str) -> Optional[int]:
+        with self._lock:
+            project_keys = self._keys.get(project_id)
+            if project_keys is not None:
+                self._keys.move_to_end(project_id)
+            idx = project_keys.get(question_key) if project_keys is not None else None
+        if idx is None and self.state is not None:
+            idx = self.state.get(f"answer-keys:{project_id}", question_key)
+        return idx
+
+    def _project(self, project_id: str) -> Dict[str, int]:
+        """Keys of a project (created if missing), marked most recently used; call with _lock held"""
+        project_keys = self._keys.get(project_id)
+        if project_keys is None:
+            project_keys = self._keys[project_id] = {}
+            while len(self._keys) > self.max_projects:
+                self._keys.popitem(last=False)
+        self._keys.move_to_end(project_id)
+        return project_keys
+
+    def _load(self) -> None:
+        if not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                keys = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable answer key file {self.persist_path}: {e}")
+            return
+        # The file lists projects least recently used first
+        self._keys = OrderedDict(list(keys.items())[-self.max_projects:])
+
+    def _schedule_save(self) -> None:
+        self._dirty.set()
+        # Threads do not survive fork; a forked process starts its own writer
+        if self._writer is None or not self._writer.is_alive():
+            self._writer = threading.Thread(target=self._write_loop, name="answer-key-writer", daemon=True)
+            self._writer.start()
+
+    def _write_loop(self) -> None:
+        while True:
+            self._dirty.wait()
+            # Let a burst of records accumulate into one write
+            time.sleep(self.flush_interval)
+            self._dirty.clear()
+            self._save()
+
+    def _save(self) -> None:
+        with self._lock:
+            snapshot = {project_id: dict(keys) for project_id, keys in self._keys.items()}
+        # Per-process temporary file, so processes sharing the path never write to the same one
+        tmp_path = f"{self.persist_path}.{os.getpid()}.tmp"
+        with self._save_lock:
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(snapshot, f)
+                os.replace(tmp_path, self.persist_path)
+            except OSError as e:
+                logger.warning(f"Failed to persist answer keys to {self.persist_path}: {e}")
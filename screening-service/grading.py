@@ -0,0 +1,92 @@
+# screening-service/grading.py
+
+"""
+Helpers for grading screening submissions: pairing questions with answers,
+merging local and LLM grades, and packing several submissions of one project
+into a single GPT-4 prompt for /submit-screening/batch. The prompts themselves
+are built with shared.prompts.PromptBuilder in main.py.
+"""
+
+from typing import Dict, List, Optional, Sequence
+
+
+def build_qa_pairs(questions, answers, include_ids: bool = False) -> List[dict]:
+    """Pair each question with the annotator's answer (or a placeholder when missing)"""
+    answers_by_id = {}
+    for a in answers:
+        answers_by_id.setdefault(a.questionId, a.answer)
+    return [
+        {
+            **({"questionId": q.id} if include_ids else {}),
+            "question": q.question,
+            "type": q.type,
+            "options": q.options,
+            "answer": answers_by_id.get(q.id, "No answer provided")
+        }
+        for q in questions
+    ]
+
+
+def merge_grading(questions, local_results: Dict[int, dict], llm_result: Optional[dict]) -> dict:
+    """
+    Combine locally graded multiple-choice results with the LLM grading of the remaining questions.
+    Returns {"detailedResults", "overallScore", "feedback"} with detailedResults in question order.
+    """
+    llm_result = llm_result or {}
+    if not local_results:
+        return {
+            "detailedResults": llm_result.get("detailedResults", []),
+            "overallScore": llm_result.get("overallScore", 0),
+            "feedback": llm_result.get("feedback", "Screening evaluation completed."),
+        }
+
+    llm_details = {
+        r.get("questionId"): r for r in llm_result.get("detailedResults", []) if isinstance(r, dict)
+    }
+    detailed = [local_results.get(q.id) or llm_details.get(q.id) for q in questions]
+    detailed = [r for r in detailed if r is not None]
+
+    # The LLM's overallScore is the average over the questions it graded
+    num_llm = len(questions) - len(local_results)
+    local_total = sum(r["score"] for r in local_results.values())
+    llm_total = llm_result.get("overallScore", 0) * num_llm
+    overall = round((local_total + llm_total) / len(questions), 2) if questions else 0
+
+    correct = sum(1 for r in local_results.values() if r["score"] == 100)
+    mc_summary = f"Answered {correct} of {len(local_results)} multiple-choice questions correctly."
+    feedback = f"{llm_result['feedback']} {mc_summary}" if llm_result.get("feedback") else mc_summary
+    return {"detailedResults": detailed, "overallScore": overall, "feedback": feedback}
+
+
+def aggregate_question_grades(results: List[dict]) -> dict:
+    """Aggregate per-question grades into {"detailedResults", "overallScore", "feedback"}"""
+    if not results:
+        return {"detailedResults": [], "overallScore": 0, "feedback": "No answers to grade."}
+    overall = round(sum(r["score"] for r in results) / len(results), 2)
+    weak = [str(r["questionId"]) for r in results if r["score"] < 70]
+    feedback = f"Average score {overall} across {len(results)} graded questions."
+    if weak:
+        feedback += f" Answers to question(s) {', '.join(weak)} need improvement."
+    else:
+        feedback += " All answers met the passing bar."
+    return {"detailedResults": results, "overallScore": overall, "feedback": feedback}
+
+
+def pack_by_token_budget(sizes: Sequence[int], budget: int, max_items: int) -> List[List[int]]:
+    """
+    Greedily group item indices, in order, so each group's total size stays within budget.
+    An item larger than the budget gets a group of its own.
+    """
+    packs: List[List[int]] = []
+    current: List[int] = []
+    used = 0
+    for idx, size in enumerate(sizes):
+        if current and (used + size > budget or len(current) >= max_items):
+            packs.append(current)
+            current, used = [], 0
+        current.append(idx)
+        used += size
+    if current:
+        packs.append(current)
+    return packs
+
@@ -1,16 +1,63 @@
 # screening-service/main.py
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from starlette.routing import Mount
+from typing import Dict, List, Literal, Optional, Sequence, Union
+import asyncio
+import functools
+import json
+import logging
 import os
+import sys
+import time
+from contextlib import aclosing
 from dotenv import load_dotenv
-from openai import OpenAI
+from adaptive import SessionConflict, SessionStore, settle
+from answer_keys import AnswerKeyStore
+from grading import (
+    aggregate_question_grades,
+    build_qa_pairs,
+    merge_grading,
+    pack_by_token_budget,
+)
+from question_cache import QuestionCache
+from question_pool import QuestionPool, pool_key
+from qualifications import QualificationStore
+
+# Make the repo-level ``shared`` package importable when running from this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.jobqueue import JobFailed, JobQueue, QueueFullError, WorkerPool, worker_id
+from shared.jsonstream import SchemaStreamParser, StreamValidationError, parse_completion
+from shared.llm_gateway import LLMGateway, LLMUnavailableError
+from shared.metrics import (
+    CONTENT_TYPE,
+    EXECUTOR_QUEUE_SECONDS,
+    QUALIFICATION_LOOKUPS,
+    QUALIFICATION_RECORDS,
+    REGISTRY,
+    REQUEST_SECONDS,
+    REQUESTS_IN_FLIGHT,
+    SCREENING_SESSION_QUESTIONS_SKIPPED,
+    SCREENING_SESSIONS,
+    TRACE_REQUESTS,
+    end_trace,
+    record_span,
+    start_trace,
+)
+from shared.prompts import PromptBuilder, PromptTooLargeError, compact_json, count_tokens
+from shared.routing import HealthProber, Router
+from shared.singleflight import SingleFlight, prompt_key
+from shared.startup import LAZY_STARTUP, READINESS, LazyClient, probe_step, warm_up
+from shared.state import StateStore
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger("ScreeningService")
+
 app = FastAPI(title="DataChain Screening Service")
 
 # Configure CORS to allow requests from Next.js frontend
@@ -22,18 +69,247 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize OpenAI client
+# Required, but checked when the client is built: without it /livez still answers and
+# /readyz reports the failed "openai-client" warm-up step
 openai_api_key = os.getenv("OPENAI_API_KEY")
-if not openai_api_key:
-    raise ValueError("OPENAI_API_KEY environment variable is required")
 
-client = OpenAI(api_key=openai_api_key)
+# Upstream pool configuration. OPENAI_MAX_CONCURRENCY bounds the number of
+# in-flight GPT-4 calls of the service and its job workers together; requests
+# beyond it wait up to OPENAI_QUEUE_TIMEOUT seconds for a slot before being
+# rejected with 503.
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "16"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "32"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "16"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+OPENAI_QUEUE_TIMEOUT = float(os.getenv("OPENAI_QUEUE_TIMEOUT", "30"))
+
+# Durable job queue for /jobs/submit-screening, drained by SCREENING_JOB_WORKERS processes (0 disables job mode)
+SCREENING_JOB_DB_PATH = os.getenv("SCREENING_JOB_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "screening_jobs.sqlite3"))
+SCREENING_JOB_WORKERS = int(os.getenv("SCREENING_JOB_WORKERS", "2"))
+
+# Each job worker gets an equal share of OPENAI_MAX_CONCURRENCY (at least one slot); the service keeps the rest
+JOB_WORKER_CONCURRENCY = max(1, OPENAI_MAX_CONCURRENCY // (SCREENING_JOB_WORKERS + 1))
+SERVICE_CONCURRENCY = max(1, OPENAI_MAX_CONCURRENCY - SCREENING_JOB_WORKERS * JOB_WORKER_CONCURRENCY)
+
+def build_openai_client():
+    """Pooled async OpenAI client; retries are handled by the gateway, so the client itself does not retry"""
+    if not openai_api_key:
+        raise ValueError("OPENAI_API_KEY environment variable is required")
+    import httpx
+    from openai import AsyncOpenAI
+
+    return AsyncOpenAI(
+        api_key=openai_api_key,
+        max_retries=0,
+        timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+        http_client=httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            ),
+            timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+        ),
+    )
+
+# With LAZY_STARTUP=1 the client (and `openai`) is built by the startup warm-up or on first use
+client = LazyClient(build_openai_client)
+if not LAZY_STARTUP and openai_api_key:
+    client.resolve()
+
+upstream_slots = asyncio.Semaphore(SERVICE_CONCURRENCY)
+
+# Rate limiting (LLM_RATE_LIMITS), retries with backoff and circuit breaking for every GPT-4 call;
+# the job workers draw on the same quota
+gateway = LLMGateway.from_env(client, processes=SCREENING_JOB_WORKERS + 1, attempt_timeout=OPENAI_TIMEOUT)
+
+# Model per call type; question generation falls back to a faster model when gpt-4's p95
+# exceeds the route budget (LLM_ROUTES / LLM_ROUTE_MAX_P95, see shared/routing.py)
+router = Router.from_env(gateway, {
+    "generate-questions": ["gpt-4", "gpt-4o-mini"],
+    "grading": ["gpt-4"],
+})
+
+async def refresh_model_latency(model: str) -> None:
+    """1-token completion so a model that gets no traffic keeps a fresh latency estimate"""
+    await gateway.acomplete(model=model, messages=[{"role": "user", "content": "ping"}], max_tokens=1)
+
+# Background upstream probe; /health answers from its cached result (LLM_PROBE_INTERVAL)
+prober = HealthProber.from_env(lambda: client.models.list(), router=router, refresh=refresh_model_latency)
+
+# Question-set cache in front of /generate-questions (exact key + near-duplicate instructions)
+question_cache = QuestionCache(
+    max_entries=int(os.getenv("QUESTION_CACHE_MAX_ENTRIES", "1024")),
+    ttl_seconds=float(os.getenv("QUESTION_CACHE_TTL", "86400")),
+    similarity_threshold=float(os.getenv("QUESTION_CACHE_SIMILARITY", "0.8")),
+    persist_path=os.getenv("QUESTION_CACHE_PATH") or None,
+    flush_interval=float(os.getenv("QUESTION_CACHE_FLUSH_INTERVAL", "1")),
+)
+
+# Pre-generated question pools; /generate-questions samples from them per annotator (QUESTION_POOL_FACTOR=0 disables)
+QUESTION_POOL_FACTOR = int(os.getenv("QUESTION_POOL_FACTOR", "4"))
+QUESTION_POOL_BATCH = int(os.getenv("QUESTION_POOL_BATCH", "10"))
+question_pool = QuestionPool(
+    os.getenv("QUESTION_POOL_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "question_pool.sqlite3")),
+    factor=QUESTION_POOL_FACTOR,
+    low_water=float(os.getenv("QUESTION_POOL_LOW_WATER", "0.5")),
+    max_exposures=int(os.getenv("QUESTION_POOL_MAX_EXPOSURES", "25")),
+) if QUESTION_POOL_FACTOR > 0 else None
+
+# Screening outcomes and reputation per annotator; a recent pass for a near-identical
+# instruction lets a returning annotator skip the test (QUALIFICATION_VALIDITY=0 disables that)
+qualifications = QualificationStore(
+    os.getenv("QUALIFICATION_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "qualifications.sqlite3")),
+    validity_seconds=float(os.getenv("QUALIFICATION_VALIDITY", "2592000")),
+    similarity_threshold=float(os.getenv("QUALIFICATION_SIMILARITY", "0.9")),
+    half_life_seconds=float(os.getenv("QUALIFICATION_HALF_LIFE", "7776000")),
+    min_reputation=float(os.getenv("QUALIFICATION_MIN_REPUTATION", "0")),
+)
+
+# Background pool fills in progress, by pool key
+pool_fills: Dict[str, asyncio.Task] = {}
+
+# Other background tasks (startup warm-up), by name
+background_tasks: Dict[str, asyncio.Task] = {}
+
+# State every worker process must agree on (SHARED_STATE_PATH; in-process memory without it)
+shared_state = StateStore.from_env()
+
+async def state_io(fn, *args):
+    """Call fn in a thread when shared_state is a SQLite file, so its locking never blocks the event loop"""
+    if shared_state.shared:
+        return await asyncio.to_thread(fn, *args)
+    return fn(*args)
+
+# Background pool fills in other worker processes are skipped while one holds the lease
+POOL_FILL_LEASE_SECONDS = 120
+
+# Correct options of generated multiple-choice questions, keyed by projectId
+answer_keys = AnswerKeyStore(
+    persist_path=os.getenv("ANSWER_KEY_PATH") or None,
+    state=shared_state if shared_state.shared else None,
+    max_projects=int(os.getenv("ANSWER_KEY_MAX_PROJECTS", "10000")),
+    flush_interval=float(os.getenv("QUESTION_CACHE_FLUSH_INTERVAL", "1")),
+)
+
+# Concurrent requests with the same prompt share one in-flight GPT-4 call
+question_flight = SingleFlight()
+
+# /submit-screening/batch packing limits
+SCREENING_BATCH_INPUT_TOKENS = int(os.getenv("SCREENING_BATCH_INPUT_TOKENS", "3000"))
+SCREENING_BATCH_MAX_SUBMISSIONS = int(os.getenv("SCREENING_BATCH_MAX_SUBMISSIONS", "8"))
+SCREENING_BATCH_OUTPUT_TOKENS_PER_SUBMISSION = int(os.getenv("SCREENING_BATCH_OUTPUT_TOKENS_PER_SUBMISSION", "500"))
+SCREENING_BATCH_MAX_OUTPUT_TOKENS = int(os.getenv("SCREENING_BATCH_MAX_OUTPUT_TOKENS", "4000"))
+
+# gradingMode="per-question" limits: concurrent calls per request and retries per question
+SCREENING_FANOUT_CONCURRENCY = int(os.getenv("SCREENING_FANOUT_CONCURRENCY", "4"))
+SCREENING_FANOUT_RETRIES = int(os.getenv("SCREENING_FANOUT_RETRIES", "2"))
+
+# Grading prompt caps (tokens): each annotator answer and the project instruction; beyond these
+# (and the model's input budget, see shared/prompts.py) the middle of the text is cut
+SCREENING_PROMPT_ANSWER_TOKENS = int(os.getenv("SCREENING_PROMPT_ANSWER_TOKENS", "500"))
+SCREENING_PROMPT_INSTRUCTION_TOKENS = int(os.getenv("SCREENING_PROMPT_INSTRUCTION_TOKENS", "2000"))
+
+# Re-requests of the unfinished part after a completion fails schema validation mid-stream
+SCREENING_PARSE_RETRIES = int(os.getenv("SCREENING_PARSE_RETRIES", "1"))
+
+# Adaptive screening sessions: one-sided confidence of the early pass/fail decision,
+# answers graded before it may be made, and the smallest score spread assumed
+SCREENING_SESSION_CONFIDENCE = float(os.getenv("SCREENING_SESSION_CONFIDENCE", "0.95"))
+SCREENING_SESSION_MIN_ANSWERS = int(os.getenv("SCREENING_SESSION_MIN_ANSWERS", "3"))
+SCREENING_SESSION_MIN_STD = float(os.getenv("SCREENING_SESSION_MIN_STD", "10"))
+screening_sessions = SessionStore(shared_state, ttl_seconds=float(os.getenv("SCREENING_SESSION_TTL", "3600")))
+
+async def acquire_upstream_slot():
+    """Wait up to OPENAI_QUEUE_TIMEOUT for one of this process's upstream slots"""
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(upstream_slots.acquire(), timeout=OPENAI_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Upstream capacity exhausted, please retry")
+    finally:
+        wait = time.perf_counter() - started
+        EXECUTOR_QUEUE_SECONDS.observe(wait, "upstream-slots")
+        record_span("queue", wait)
+
+async def create_chat_completion(**kwargs):
+    """
+    Run a chat completion through the gateway without blocking the event loop.
+    At most OPENAI_MAX_CONCURRENCY calls are in flight at once; each attempt is bounded by OPENAI_TIMEOUT.
+    """
+    await acquire_upstream_slot()
+    try:
+        return await gateway.acomplete(**kwargs)
+    except LLMUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    finally:
+        upstream_slots.release()
+
+async def stream_chat_completion(**kwargs):
+    """
+    Stream a chat completion, yielding content deltas as they arrive.
+    The upstream slot is held until the stream is exhausted or closed.
+    """
+    await acquire_upstream_slot()
+    try:
+        try:
+            stream = await gateway.acomplete(stream=True, **kwargs)
+        except LLMUnavailableError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        # Time spent waiting on upstream chunks, excluding time the consumer holds each delta
+        streamed = 0.0
+        try:
+            started = time.perf_counter()
+            async for chunk in stream:
+                streamed += time.perf_counter() - started
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                started = time.perf_counter()
+        finally:
+            record_span("stream", streamed)
+            await stream.close()
+    finally:
+        upstream_slots.release()
+
+async def stream_validated(parser: SchemaStreamParser, **kwargs):
+    """
+    Stream a chat completion through a schema parser, yielding validated items as they complete.
+    The upstream stream is closed as soon as the parser rejects the output.
+    """
+    parse_seconds = 0.0
+    try:
+        async with aclosing(stream_chat_completion(**kwargs)) as deltas:
+            async for delta in deltas:
+                started = time.perf_counter()
+                items = parser.feed(delta)
+                parse_seconds += time.perf_counter() - started
+                for item in items:
+                    yield item
+                if parser.done:
+                    return
+    except StreamValidationError:
+        gateway.record_invalid_output(kwargs["model"])
+        raise
+    finally:
+        record_span("parse", parse_seconds)
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 # Request/Response Models
 class GenerateQuestionsRequest(BaseModel):
     projectId: str
     instruction: str
     numQuestions: Optional[int] = 5
+    # Annotator the test is for; with a question pool, each annotator gets their own (stable) sample
+    userId: Optional[str] = None
+    # With userId: return no questions, only `qualification`, if the annotator already qualifies
+    reuseQualification: bool = False
+
+class QuestionPoolResponse(BaseModel):
+    success: bool
+    projectId: str
+    generating: int  # questions being generated in the background
 
 class Question(BaseModel):
     id: int
@@ -41,10 +317,44 @@ class Question(BaseModel):
     type: str  # "multiple-choice", "short-answer", etc.
     options: Optional[List[str]] = None
 
+class Qualification(BaseModel):
+    projectId: str  # project of the screening that qualifies
+    sameProject: bool
+    score: float
+    screenedAt: float  # unix time
+    expiresAt: float
+    similarity: float  # of that screening's instruction to this one
+
+class Reputation(BaseModel):
+    screenings: int
+    passes: int
+    meanScore: float
+    decayedScore: float  # mean with older scores weighted down (QUALIFICATION_HALF_LIFE)
+    weight: float  # decayed number of screenings behind decayedScore
+    lastScreenedAt: float
+
 class GenerateQuestionsResponse(BaseModel):
     success: bool
     questions: List[Question]
     projectId: str
+    qualification: Optional[Qualification] = None  # set (and questions empty) when the test was skipped
+
+class QualificationCheckRequest(BaseModel):
+    projectId: str
+    userId: str
+    instruction: str
+
+class QualificationResponse(BaseModel):
+    success: bool
+    userId: str
+    qualified: bool
+    qualification: Optional[Qualification] = None
+    reputation: Optional[Reputation] = None
+
+class ReputationResponse(BaseModel):
+    success: bool
+    userId: str
+    reputation: Reputation
 
 class Answer(BaseModel):
     questionId: int
@@ -56,6 +366,8 @@ class SubmitScreeningRequest(BaseModel):
     instruction: str
     questions: List[Question]
     answers: List[Answer]
+    # "single": one GPT-4 call grades every answer; "per-question": one short call per answer
+    gradingMode: Literal["single", "per-question"] = "single"
 
 class SubmitScreeningResponse(BaseModel):
     success: bool
@@ -64,38 +376,95 @@ class SubmitScreeningResponse(BaseModel):
     feedback: str
     detailedResults: List[dict]
 
-@app.get("/")
-async def root():
-    return {
-        "service": "DataChain Screening Service",
-        "version": "1.0.0",
-        "status": "running"
-    }
+class BatchSubmitScreeningRequest(BaseModel):
+    projectId: str
+    submissions: List[SubmitScreeningRequest]
 
-@app.get("/health")
-async def health_check():
-    """Health check endpoint"""
-    try:
-        # Test OpenAI connection
-        client.models.list()
-        return {
-            "status": "healthy",
-            "openai": "connected"
-        }
-    except Exception as e:
-        raise HTTPException(status_code=503, detail=f"Service unhealthy: {str(e)}")
+class BatchScreeningResult(BaseModel):
+    userId: str
+    success: bool
+    score: Optional[float] = None
+    status: Optional[str] = None  # "passed" or "failed"
+    feedback: Optional[str] = None
+    detailedResults: List[dict] = []
+    error: Optional[str] = None
 
-@app.post("/generate-questions", response_model=GenerateQuestionsResponse)
-async def generate_questions(request: GenerateQuestionsRequest):
-    """
-    Generate screening test questions based on project instruction using OpenAI GPT-4
-    """
-    try:
-        prompt = f"""You are creating a screening test for annotators who want to work on a data annotation project.
+class BatchSubmitScreeningResponse(BaseModel):
+    success: bool
+    projectId: str
+    results: List[BatchScreeningResult]
+
+class SubmitScreeningJobRequest(SubmitScreeningRequest):
+    # Receives the job document (same as GET /jobs/{jobId}) when the job finishes
+    callbackUrl: Optional[str] = None
+
+class JobResponse(BaseModel):
+    success: bool
+    jobId: str
+    status: str  # "queued", "running", "succeeded" or "failed"
+    deduplicated: bool = False
+    attempts: int = 0
+    result: Optional[SubmitScreeningResponse] = None
+    error: Optional[str] = None
+
+class StartScreeningSessionRequest(BaseModel):
+    projectId: str
+    userId: str
+    instruction: str
+    # Omitted: the test is drawn from the project's question pool (or generated), as for /generate-questions
+    questions: Optional[List[Question]] = None
+    numQuestions: Optional[int] = 5
+
+class ScreeningSessionResponse(BaseModel):
+    success: bool
+    sessionId: str
+    status: str  # "in-progress", "passed" or "failed"
+    answered: int
+    totalQuestions: int
+    score: Optional[float] = None  # mean score of the answers graded so far
+    lowerBound: float  # confidence bounds on the score of the full test
+    upperBound: float
+    lastGrade: Optional[dict] = None
+    nextQuestion: Optional[Question] = None
+    result: Optional[SubmitScreeningResponse] = None  # set once the outcome is settled
+
+# LLM output schemas; streamed completions are validated against these
+class GeneratedQuestion(BaseModel):
+    id: Optional[int] = None
+    question: str
+    type: str = "short-answer"
+    options: Optional[List[str]] = None
+    correctAnswer: Optional[Union[str, int]] = None
+
+class QuestionGrade(BaseModel):
+    questionId: int
+    score: Union[int, float]
+    feedback: str = ""
+
+class GradingCompletion(BaseModel):
+    detailedResults: List[QuestionGrade]
+    overallScore: Union[int, float]
+    status: Optional[str] = None
+    feedback: str = ""
+
+class SubmissionGrade(GradingCompletion):
+    submissionId: int
+
+class BatchGradingCompletion(BaseModel):
+    results: List[SubmissionGrade]
+
+# Prompts
 
-Project Instruction: {request.instruction}
+QUESTION_SYSTEM_PROMPT = "You are an expert at creating screening tests for data annotation tasks. Always respond with valid JSON."
+GRADING_SYSTEM_PROMPT = "You are an expert grader for data annotation screening tests. Always respond with valid JSON. Be fair but thorough in your evaluation."
 
-Generate {request.numQuestions} screening questions to test if an annotator understands the task requirements and has the necessary skills.
+def question_generation_prompt(instruction: str, num_questions: int, exclude: Sequence[str] = ()) -> str:
+    avoid = f"\n\nDo not repeat these existing questions:\n{json.dumps(list(exclude), indent=2)}" if exclude else ""
+    return f"""You are creating a screening test for annotators who want to work on a data annotation project.
+
+Project Instruction: {instruction}
+
+Generate {num_questions} screening questions to test if an annotator understands the task requirements and has the necessary skills.
 
 Questions should assess:
 1. Understanding of the annotation task
@@ -114,78 +483,16 @@ Format your response as a JSON array with this structure:
     "id": 2,
     "question": "Which of the following best describes...",
     "type": "multiple-choice",
-    "options": ["Option A", "Option B", "Option C", "Option D"]
+    "options": ["Option A", "Option B", "Option C", "Option D"],
+    "correctAnswer": "Option B"
   }}
 ]
 
-Generate questions that are clear, specific, and directly relevant to the task."""
-
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are an expert at creating screening tests for data annotation tasks. Always respond with valid JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=1500
-        )
-
-        # Parse the response
-        import json
-        questions_text = response.choices[0].message.content.strip()
-        
-        # Remove markdown code blocks if present
-        if questions_text.startswith("```"):
-            questions_text = questions_text.split("```")[1]
-            if questions_text.startswith("json"):
-                questions_text = questions_text[4:]
-        
-        questions_data = json.loads(questions_text)
-        
-        questions = [
-            Question(
-                id=q.get("id", idx + 1),
-                question=q["question"],
-                type=q.get("type", "short-answer"),
-                options=q.get("options")
-            )
-            for idx, q in enumerate(questions_data)
-        ]
-
-        return GenerateQuestionsResponse(
-            success=True,
-            questions=questions,
-            projectId=request.projectId
-        )
-
-    except json.JSONDecodeError as e:
-        raise HTTPException(status_code=500, detail=f"Failed to parse OpenAI response: {str(e)}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to generate questions: {str(e)}")
+Every multiple-choice question must include "correctAnswer", copied exactly from its options.
 
-@app.post("/submit-screening", response_model=SubmitScreeningResponse)
-async def submit_screening(request: SubmitScreeningRequest):
-    """
-    Grade screening test answers using OpenAI GPT-4 and return score with detailed feedback
-    """
-    try:
-        # Build the grading prompt
-        qa_pairs = []
-        for q in request.questions:
-            answer = next((a.answer for a in request.answers if a.questionId == q.id), "No answer provided")
-            qa_pairs.append({
-                "question": q.question,
-                "type": q.type,
-                "options": q.options,
-                "answer": answer
-            })
-
-        prompt = f"""You are grading a screening test for a data annotation project.
+Generate questions that are clear, specific, and directly relevant to the task.{avoid}"""
 
-Project Instruction: {request.instruction}
-
-Questions and Answers:
-{json.dumps(qa_pairs, indent=2)}
+GRADING_RUBRIC = """You are grading a screening test for a data annotation project.
 
 Evaluate each answer based on:
 1. Correctness and accuracy
@@ -203,57 +510,986 @@ Then calculate:
 - Overall feedback summary
 
 Respond with this JSON structure:
-{{
+{
   "detailedResults": [
-    {{
+    {
       "questionId": 1,
       "score": 85,
       "feedback": "Good understanding but could be more specific..."
-    }}
+    }
   ],
   "overallScore": 82,
   "status": "passed",
   "feedback": "Overall feedback summary..."
-}}"""
-
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are an expert grader for data annotation screening tests. Always respond with valid JSON. Be fair but thorough in your evaluation."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,  # Lower temperature for more consistent grading
-            max_tokens=2000
+}"""
+
+QUESTION_GRADING_RUBRIC = """You are grading one answer from a screening test for a data annotation project.
+
+Score the answer from 0-100 for correctness, understanding of the task, clarity and attention to detail.
+
+Respond with this JSON structure, using the questionId of the answer, and keep the feedback to one sentence:
+{"questionId": 1, "score": 85, "feedback": "..."}"""
+
+BATCH_GRADING_RUBRIC = """You are grading several independent screening tests for the same data annotation project.
+
+Grade each submission independently. Evaluate each answer based on:
+1. Correctness and accuracy
+2. Understanding of the task
+3. Completeness and clarity
+4. Attention to detail
+
+For each question, provide a score from 0-100 and brief feedback explaining the score.
+For each submission, calculate the overall average score (0-100), pass/fail status (pass >= 70)
+and an overall feedback summary.
+
+Respond with this JSON structure, with one entry per submission:
+{
+  "results": [
+    {
+      "submissionId": 0,
+      "detailedResults": [
+        {
+          "questionId": 1,
+          "score": 85,
+          "feedback": "Good understanding but could be more specific..."
+        }
+      ],
+      "overallScore": 82,
+      "status": "passed",
+      "feedback": "Overall feedback summary..."
+    }
+  ]
+}"""
+
+def grading_prompt(instruction: str, qa_pairs: List[dict], model: str, max_tokens: int) -> str:
+    """Static rubric first (shared prefix), then the project instruction, then the capped answers"""
+    return (
+        PromptBuilder("grading", model, max_tokens, system=GRADING_SYSTEM_PROMPT)
+        .static(GRADING_RUBRIC)
+        .text("Project Instruction:", instruction, "instruction", max_tokens=SCREENING_PROMPT_INSTRUCTION_TOKENS, min_tokens=256)
+        .json("Questions and Answers:", qa_pairs, truncate={"answer": SCREENING_PROMPT_ANSWER_TOKENS, "question": None})
+        .build()
+        .text
+    )
+
+def question_grading_prompt(instruction: str, qa_pair: dict, model: str, max_tokens: int) -> str:
+    return (
+        PromptBuilder("grading-question", model, max_tokens, system=GRADING_SYSTEM_PROMPT)
+        .static(QUESTION_GRADING_RUBRIC)
+        .text("Project Instruction:", instruction, "instruction", max_tokens=SCREENING_PROMPT_INSTRUCTION_TOKENS, min_tokens=256)
+        .json("Question and Answer:", qa_pair, truncate={"answer": SCREENING_PROMPT_ANSWER_TOKENS, "question": None})
+        .build()
+        .text
+    )
+
+def batch_grading_prompt(instruction: str, submissions: List[dict], model: str, max_tokens: int) -> str:
+    """
+    One prompt for several submissions, each {"submissionId": int, "qaPairs": [...]} with ids.
+    Same layout as grading_prompt, so the rubric prefix is shared by every pack of a batch.
+    """
+    return (
+        PromptBuilder("grading-batch", model, max_tokens, system=GRADING_SYSTEM_PROMPT)
+        .static(BATCH_GRADING_RUBRIC)
+        .text("Project Instruction:", instruction, "instruction", max_tokens=SCREENING_PROMPT_INSTRUCTION_TOKENS, min_tokens=256)
+        .json("Submissions:", submissions, truncate={"answer": SCREENING_PROMPT_ANSWER_TOKENS, "question": None})
+        .build()
+        .text
+    )
+
+def batch_submission_budget(instruction: str) -> int:
+    """
+    Tokens available for the submissions of one batch prompt: SCREENING_BATCH_INPUT_TOKENS, but never
+    more than the input budget of any grading model, minus the rubric and the (capped) instruction.
+    """
+    models = router.routes["grading"].models
+    budget = min(
+        PromptBuilder("grading-batch", model, SCREENING_BATCH_MAX_OUTPUT_TOKENS, system=GRADING_SYSTEM_PROMPT).budget
+        for model in models
+    )
+    fixed = (
+        count_tokens(BATCH_GRADING_RUBRIC, models[0])
+        + min(count_tokens(instruction, models[0]), SCREENING_PROMPT_INSTRUCTION_TOKENS)
+        + 16  # headings and separators
+    )
+    return min(SCREENING_BATCH_INPUT_TOKENS, budget) - fixed
+
+def submission_tokens(qa_pairs: List[dict], model: str) -> int:
+    """Tokens one submission adds to a batch prompt, with each answer at most SCREENING_PROMPT_ANSWER_TOKENS"""
+    tokens = count_tokens(compact_json({"submissionId": 0, "qaPairs": qa_pairs}), model)
+    for pair in qa_pairs:
+        tokens -= max(count_tokens(pair["answer"], model) - SCREENING_PROMPT_ANSWER_TOKENS, 0)
+    return tokens
+
+def normalize_generated_question(q: dict, idx: int) -> dict:
+    return {
+        "id": q.get("id", idx + 1),
+        "question": q["question"],
+        "type": q.get("type", "short-answer"),
+        "options": q.get("options"),
+        "correctAnswer": q.get("correctAnswer")
+    }
+
+def public_question(q: dict) -> Question:
+    """Strip the server-side answer key from a generated question"""
+    return Question(id=q["id"], question=q["question"], type=q["type"], options=q.get("options"))
+
+@app.on_event("startup")
+async def start_background_work():
+    # Job workers are spawned (not forked), so they never inherit this loop or its upstream connections
+    if job_pool is not None:
+        job_pool.start()
+    # Runs once the startup handlers are done, while the server starts listening
+    READINESS.add("openai-client")
+    READINESS.add("upstream-connection", best_effort=True)
+    background_tasks["warm-up"] = asyncio.create_task(warm_up_upstream())
+
+async def warm_up_upstream():
+    """Build the client off the event loop and open a first upstream connection, then start the prober"""
+    if await warm_up([("openai-client", client.resolve), ("upstream-connection", probe_step(prober))]):
+        prober.start()
+
+@app.on_event("shutdown")
+async def close_openai_client():
+    """Stop background work (prober, pool fills, job workers), flush the question cache and answer keys and close pooled upstream connections on shutdown"""
+    await prober.stop()
+    for task in [*background_tasks.values(), *pool_fills.values()]:
+        task.cancel()
+    if job_pool is not None:
+        await asyncio.to_thread(job_pool.stop)
+    await asyncio.to_thread(question_cache.flush)
+    await asyncio.to_thread(answer_keys.flush)
+    if client.built:
+        await client.close()
+
+@functools.lru_cache(maxsize=1)
+def known_endpoints() -> frozenset:
+    paths = set()
+    for route in app.routes:
+        if isinstance(route, Mount):
+            # Sub-apps mounted by deploy/app.py
+            paths.update(route.path + sub.path for sub in route.routes)
+        else:
+            paths.add(route.path)
+    return frozenset(paths)
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    """
+    Per-endpoint latency histogram and in-flight gauge. Requests with an X-Trace header
+    (or every request with TRACE_REQUESTS=1) get a Server-Timing breakdown of their phases.
+    """
+    endpoint = request.url.path if request.url.path in known_endpoints() else "unmatched"
+    trace, token = start_trace() if TRACE_REQUESTS or "x-trace" in request.headers else (None, None)
+    REQUESTS_IN_FLIGHT.inc(1, endpoint)
+    started = time.perf_counter()
+    status = "500"
+    try:
+        response = await call_next(request)
+        status = str(response.status_code)
+        if trace is not None and trace.spans:
+            response.headers["Server-Timing"] = trace.server_timing()
+        return response
+    finally:
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint, request.method, status)
+        REQUESTS_IN_FLIGHT.dec(1, endpoint)
+        if token is not None:
+            end_trace(token)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: endpoint latency, upstream latency and tokens per model, parse failures, queue waits"""
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get("/")
+async def root():
+    return {
+        "service": "DataChain Screening Service",
+        "version": "1.0.0",
+        "status": "running"
+    }
+
+@app.get("/livez")
+async def liveness():
+    """Liveness: the process answers; says nothing about the upstream or warm-up"""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readiness():
+    """Readiness: 200 once the startup warm-up finished, 503 with its progress before"""
+    snapshot = READINESS.snapshot()
+    if not snapshot["ready"]:
+        raise HTTPException(status_code=503, detail=snapshot)
+    return snapshot
+
+@app.get("/health")
+async def health_check():
+    """Health check from the background probe's cached state (no upstream round-trip)"""
+    upstream = prober.snapshot()
+    if not prober.healthy:
+        raise HTTPException(status_code=503, detail=f"Service unhealthy: {upstream['error']}")
+    return {
+        "status": "healthy",
+        "openai": "connected" if upstream["status"] == "healthy" else upstream["status"],
+        "upstream": upstream,
+    }
+
+@app.get("/gateway/stats")
+async def gateway_stats():
+    """Upstream queue depth, in-flight calls, per-model counters and latency, and current routes"""
+    return {**gateway.stats(), "routes": router.stats()}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Question cache hit/miss counters, question pool sizes, qualification lookups and request coalescing stats"""
+    return {
+        **question_cache.stats(),
+        "singleflight": question_flight.stats(),
+        "questionPool": await asyncio.to_thread(question_pool.stats) if question_pool is not None else None,
+        "qualifications": await asyncio.to_thread(qualifications.stats),
+    }
+
+async def find_qualification(user_id: str, project_id: str, instruction: str) -> Optional[Qualification]:
+    found = await asyncio.to_thread(qualifications.lookup, user_id, project_id, instruction)
+    QUALIFICATION_LOOKUPS.inc(1, "hit" if found is not None else "miss")
+    if found is None:
+        return None
+    return Qualification(
+        projectId=found["project_id"],
+        sameProject=found["same_project"],
+        score=found["score"],
+        screenedAt=found["screened_at"],
+        expiresAt=found["expires_at"],
+        similarity=found["similarity"]
+    )
+
+async def record_screening(project_id: str, user_id: str, instruction: str, questions: List[str], score: float, status: str) -> None:
+    """
+    Keep a graded screening for the qualification fast path; a store failure never fails the grading.
+    Only a test made of questions this service served for the project counts: a score on
+    client-supplied questions says nothing about the annotator.
+    """
+    try:
+        if not await state_io(answer_keys.served, project_id, questions):
+            QUALIFICATION_RECORDS.inc(1, "unserved")
+            return
+        await asyncio.to_thread(qualifications.record, user_id, project_id, instruction, score, status)
+        QUALIFICATION_RECORDS.inc(1, "recorded")
+    except Exception as e:
+        logger.error(f"Failed to record screening of {user_id} for {project_id}: {e}")
+
+async def annotator_reputation(user_id: str) -> Optional[Reputation]:
+    found = await asyncio.to_thread(qualifications.reputation, user_id)
+    if found is None:
+        return None
+    return Reputation(
+        screenings=found["screenings"],
+        passes=found["passes"],
+        meanScore=found["mean_score"],
+        decayedScore=found["decayed_score"],
+        weight=found["weight"],
+        lastScreenedAt=found["last_screened_at"]
+    )
+
+@app.post("/qualifications/check", response_model=QualificationResponse)
+async def check_qualification(request: QualificationCheckRequest):
+    """Whether the annotator may skip the screening for this instruction, and their reputation"""
+    qualification = await find_qualification(request.userId, request.projectId, request.instruction)
+    return QualificationResponse(
+        success=True,
+        userId=request.userId,
+        qualified=qualification is not None,
+        qualification=qualification,
+        reputation=await annotator_reputation(request.userId)
+    )
+
+@app.get("/qualifications/{user_id}", response_model=ReputationResponse)
+async def get_reputation(user_id: str):
+    """Reputation aggregates of an annotator over all recorded screenings"""
+    reputation = await annotator_reputation(user_id)
+    if reputation is None:
+        raise HTTPException(status_code=404, detail="No screenings recorded for this annotator")
+    return ReputationResponse(success=True, userId=user_id, reputation=reputation)
+
+async def request_questions(instruction: str, num_questions: int, exclude: Sequence[str] = ()) -> List[dict]:
+    """
+    Stream a question set from GPT-4, validating each question as it completes; shared by coalesced callers.
+    If the output turns invalid part-way, the questions validated so far are kept and only the missing
+    ones are requested again. Multiple-choice questions keep their correctAnswer for the answer key store.
+    """
+    questions: List[dict] = []
+    for attempt in range(SCREENING_PARSE_RETRIES + 1):
+        parser = SchemaStreamParser(item_schema=GeneratedQuestion, root="array")
+        prompt = question_generation_prompt(
+            instruction,
+            num_questions - len(questions),
+            exclude=[*exclude, *(q["question"] for q in questions)]
+        )
+        try:
+            async for item in stream_validated(
+                parser,
+                model=router.pick("generate-questions"),
+                messages=[
+                    {"role": "system", "content": QUESTION_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.7,
+                max_tokens=1500
+            ):
+                question = item.model_dump(exclude_none=True)
+                if attempt > 0:
+                    # Continuations restart their numbering at 1
+                    question["id"] = len(questions) + 1
+                questions.append(normalize_generated_question(question, len(questions)))
+            parser.finish()
+            return questions
+        except StreamValidationError:
+            if len(questions) >= num_questions:
+                return questions
+            if attempt == SCREENING_PARSE_RETRIES:
+                raise
+    raise AssertionError("unreachable")
+
+async def fill_question_pool(project_id: str, instruction: str) -> None:
+    """Generate questions in batches until the pool reaches its target"""
+    lease = f"pool-fill:{pool_key(project_id, instruction)}"
+    try:
+        while await state_io(shared_state.acquire, lease, worker_id(), POOL_FILL_LEASE_SECONDS):
+            # Fill up to the target, not just past the low-water mark that started the refill
+            deficit = await asyncio.to_thread(question_pool.deficit, project_id, instruction)
+            if deficit <= 0:
+                return
+            exclude = await asyncio.to_thread(question_pool.existing_questions, project_id, instruction)
+            questions = await request_questions(instruction, min(deficit, QUESTION_POOL_BATCH), exclude=exclude)
+            await state_io(answer_keys.record, project_id, questions)
+            if await asyncio.to_thread(question_pool.add, project_id, instruction, questions) == 0:
+                logger.warning(f"Question pool fill for {project_id} produced only duplicates; stopping")
+                return
+    except Exception as e:
+        logger.error(f"Question pool fill for {project_id} failed: {e}")
+    finally:
+        await state_io(shared_state.release, lease, worker_id())
+        pool_fills.pop(pool_key(project_id, instruction), None)
+
+async def schedule_pool_fill(project_id: str, instruction: str) -> int:
+    """Start a background fill if the pool is below its low-water mark; returns the number of missing questions"""
+    missing = await asyncio.to_thread(question_pool.missing, project_id, instruction)
+    key = pool_key(project_id, instruction)
+    if missing > 0 and key not in pool_fills:
+        pool_fills[key] = asyncio.create_task(fill_question_pool(project_id, instruction))
+    return missing
+
+@app.post("/question-pools", response_model=QuestionPoolResponse, status_code=202)
+async def prepare_question_pool(request: GenerateQuestionsRequest):
+    """
+    Build a project's question pool in the background (call when the project is created),
+    so the first annotators already get pooled questions
+    """
+    if question_pool is None:
+        raise HTTPException(status_code=404, detail="Question pools are disabled (QUESTION_POOL_FACTOR=0)")
+    await asyncio.to_thread(question_pool.ensure, request.projectId, request.instruction, request.numQuestions)
+    return QuestionPoolResponse(
+        success=True,
+        projectId=request.projectId,
+        generating=await schedule_pool_fill(request.projectId, request.instruction),
+    )
+
+@app.post("/generate-questions", response_model=GenerateQuestionsResponse)
+async def generate_questions(request: GenerateQuestionsRequest):
+    """
+    Generate screening test questions based on project instruction using OpenAI GPT-4.
+    With a question pool, a per-annotator sample of pre-generated questions is returned instead
+    and the pool is (re)filled in the background; until it is ready, questions are generated live.
+    With reuseQualification, an annotator who recently passed a screening for the same or a
+    near-identical instruction gets their qualification and no questions.
+    """
+    if request.reuseQualification and request.userId:
+        qualification = await find_qualification(request.userId, request.projectId, request.instruction)
+        if qualification is not None:
+            return GenerateQuestionsResponse(
+                success=True,
+                questions=[],
+                projectId=request.projectId,
+                qualification=qualification
+            )
+
+    if question_pool is not None:
+        await asyncio.to_thread(question_pool.ensure, request.projectId, request.instruction, request.numQuestions)
+        sampled = await asyncio.to_thread(question_pool.sample, request.projectId, request.instruction, request.numQuestions, request.userId)
+        await schedule_pool_fill(request.projectId, request.instruction)
+        if sampled is not None:
+            await state_io(answer_keys.record, request.projectId, sampled)
+            return GenerateQuestionsResponse(
+                success=True,
+                questions=[public_question(q) for q in sampled],
+                projectId=request.projectId
+            )
+
+    cached = question_cache.get(request.projectId, request.instruction, request.numQuestions)
+    if cached is not None:
+        await state_io(answer_keys.record, request.projectId, cached)
+        return GenerateQuestionsResponse(
+            success=True,
+            questions=[public_question(q) for q in cached],
+            projectId=request.projectId
         )
 
-        # Parse the response
-        import json
-        result_text = response.choices[0].message.content.strip()
-        
-        # Remove markdown code blocks if present
-        if result_text.startswith("```"):
-            result_text = result_text.split("```")[1]
-            if result_text.startswith("json"):
-                result_text = result_text[4:]
-        
-        result_data = json.loads(result_text)
-
-        overall_score = result_data.get("overallScore", 0)
+    try:
+        prompt = question_generation_prompt(request.instruction, request.numQuestions)
+
+        questions = await question_flight.do(
+            prompt_key("generate-questions", prompt),
+            lambda: request_questions(request.instruction, request.numQuestions)
+        )
+        await state_io(answer_keys.record, request.projectId, questions)
+        question_cache.put(
+            request.projectId,
+            request.instruction,
+            request.numQuestions,
+            questions
+        )
+
+        return GenerateQuestionsResponse(
+            success=True,
+            questions=[public_question(q) for q in questions],
+            projectId=request.projectId
+        )
+
+    except HTTPException:
+        raise
+    except StreamValidationError as e:
+        raise HTTPException(status_code=500, detail=f"Failed to parse OpenAI response: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to generate questions: {str(e)}")
+
+async def grade_with_llm(instruction: str, questions: List[Question], answers: List[Answer]) -> dict:
+    """
+    Grade the given questions with GPT-4, validating each per-question result as it streams in.
+    If the output turns invalid part-way, validated results are kept and only the ungraded
+    questions are sent again.
+    """
+    graded: Dict[int, dict] = {}
+    for attempt in range(SCREENING_PARSE_RETRIES + 1):
+        carried_over = len(graded)
+        remaining = [q for q in questions if q.id not in graded]
+        parser = SchemaStreamParser(GradingCompletion, item_schema=QuestionGrade, item_path=("detailedResults",))
+        model = router.pick("grading")
+        prompt = grading_prompt(instruction, build_qa_pairs(remaining, answers, include_ids=True), model, 2000)
+        try:
+            async for item in stream_validated(
+                parser,
+                model=model,
+                messages=[
+                    {"role": "system", "content": GRADING_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.3,  # Lower temperature for more consistent grading
+                max_tokens=2000
+            ):
+                graded[item.questionId] = item.model_dump()
+            completion = parser.finish()
+        except StreamValidationError:
+            if attempt == SCREENING_PARSE_RETRIES:
+                raise
+            continue
+        if not carried_over:
+            return completion.model_dump()
+        # overallScore of a continuation only covers the retried questions
+        details = [graded[q.id] for q in questions if q.id in graded]
+        return {
+            **completion.model_dump(),
+            "detailedResults": details,
+            "overallScore": round(sum(r["score"] for r in details) / len(details), 2) if details else 0,
+        }
+    raise AssertionError("unreachable")
+
+async def grade_question_with_llm(instruction: str, qa_pair: dict, slots: asyncio.Semaphore) -> dict:
+    """Grade a single answer with a short GPT-4 call, retrying transient failures"""
+    for attempt in range(SCREENING_FANOUT_RETRIES + 1):
+        # Outside the try: a prompt over the input budget is not retried
+        model = router.pick("grading")
+        prompt = question_grading_prompt(instruction, qa_pair, model, 150)
+        try:
+            async with slots:
+                response = await create_chat_completion(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": GRADING_SYSTEM_PROMPT},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.3,
+                    max_tokens=150
+                )
+            result = parse_completion(response.choices[0].message.content, QuestionGrade)
+            return {
+                "questionId": qa_pair["questionId"],
+                "score": result.score,
+                "feedback": result.feedback
+            }
+        except HTTPException:
+            # Upstream unavailable; the gateway has already retried
+            raise
+        except Exception:
+            if attempt == SCREENING_FANOUT_RETRIES:
+                raise
+            await asyncio.sleep(0.5 * 2 ** attempt)
+
+async def grade_per_question(instruction: str, questions: List[Question], answers: List[Answer]) -> dict:
+    """Grade every answer in its own concurrent call and aggregate into the single-call result shape"""
+    slots = asyncio.Semaphore(SCREENING_FANOUT_CONCURRENCY)
+    qa_pairs = build_qa_pairs(questions, answers, include_ids=True)
+    results = await asyncio.gather(*(grade_question_with_llm(instruction, qa, slots) for qa in qa_pairs))
+    return aggregate_question_grades(results)
+
+@app.post("/submit-screening", response_model=SubmitScreeningResponse)
+async def submit_screening(request: SubmitScreeningRequest):
+    """
+    Grade screening test answers using OpenAI GPT-4 and return score with detailed feedback
+    """
+    try:
+        # Multiple-choice questions with a stored answer key are graded locally
+        local_results, llm_questions = await state_io(answer_keys.grade_locally, request.projectId, request.questions, request.answers)
+        result_data = None
+        if llm_questions and request.gradingMode == "per-question":
+            result_data = await grade_per_question(request.instruction, llm_questions, request.answers)
+        elif llm_questions:
+            result_data = await grade_with_llm(request.instruction, llm_questions, request.answers)
+
+        merged = merge_grading(request.questions, local_results, result_data)
+        overall_score = merged["overallScore"]
         status = "passed" if overall_score >= 70 else "failed"
+        await record_screening(request.projectId, request.userId, request.instruction, [q.question for q in request.questions], overall_score, status)
 
         return SubmitScreeningResponse(
             success=True,
             score=overall_score,
             status=status,
-            feedback=result_data.get("feedback", "Screening evaluation completed."),
-            detailedResults=result_data.get("detailedResults", [])
+            feedback=merged["feedback"],
+            detailedResults=merged["detailedResults"]
         )
 
-    except json.JSONDecodeError as e:
+    except HTTPException:
+        raise
+    except PromptTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except StreamValidationError as e:
         raise HTTPException(status_code=500, detail=f"Failed to parse OpenAI response: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to grade screening: {str(e)}")
 
+async def run_screening_job(payload: dict) -> dict:
+    """Job handler, runs in a worker process; 5xx errors are retried by the queue"""
+    request = SubmitScreeningRequest(**payload["request"])
+    # The worker has its own answer key store (in-memory without SHARED_STATE_PATH), so the keys come with the job
+    await state_io(answer_keys.restore, request.projectId, payload["answerKeys"])
+    try:
+        response = await submit_screening(request)
+    except HTTPException as e:
+        if e.status_code < 500:
+            raise JobFailed(str(e.detail))
+        raise RuntimeError(str(e.detail))
+    return response.model_dump()
+
+def render_job(job: dict) -> dict:
+    """Webhook body: the same document GET /jobs/{jobId} returns"""
+    return job_response(job).model_dump()
+
+def init_job_worker() -> None:
+    """Runs in each spawned job worker before its first job"""
+    global upstream_slots
+    upstream_slots = asyncio.Semaphore(JOB_WORKER_CONCURRENCY)
+
+def job_response(job: dict, deduplicated: bool = False) -> JobResponse:
+    return JobResponse(
+        success=job["status"] != "failed",
+        jobId=job["id"],
+        status=job["status"],
+        deduplicated=deduplicated,
+        attempts=job["attempts"],
+        result=job["result"],
+        error=job["error"] if job["status"] == "failed" else None,
+    )
+
+job_queue = JobQueue.from_env(SCREENING_JOB_DB_PATH) if SCREENING_JOB_WORKERS > 0 else None
+job_pool = WorkerPool(
+    job_queue,
+    {"submit-screening": run_screening_job},
+    processes=SCREENING_JOB_WORKERS,
+    initializer=init_job_worker,
+    render=render_job,
+) if job_queue is not None else None
+
+@app.post("/jobs/submit-screening", response_model=JobResponse, status_code=202)
+async def submit_screening_job(request: SubmitScreeningJobRequest):
+    """
+    Queue a screening submission and return its job ID immediately.
+    Identical submissions share one job; poll GET /jobs/{jobId} or pass callbackUrl.
+    """
+    if job_queue is None:
+        raise HTTPException(status_code=404, detail="Job mode is disabled (SCREENING_JOB_WORKERS=0)")
+    screening = SubmitScreeningRequest(**request.model_dump(exclude={"callbackUrl"}))
+    payload = {
+        "request": screening.model_dump(),
+        "answerKeys": await state_io(answer_keys.keys_for, screening.projectId, screening.questions),
+    }
+    try:
+        job, deduplicated = await asyncio.to_thread(job_queue.submit, "submit-screening", payload, request.callbackUrl)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    job_pool.notify()
+    return job_response(job, deduplicated)
+
+@app.get("/jobs/stats")
+async def job_stats():
+    """Job workers alive and jobs per status"""
+    if job_pool is None:
+        return {"enabled": False}
+    return {"enabled": True, **(await asyncio.to_thread(job_pool.stats))}
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    job = await asyncio.to_thread(job_queue.get, job_id) if job_queue is not None else None
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job_response(job)
+
+def session_settlement(session):
+    """Bounds on the session's full-test score from the answers graded so far"""
+    return settle(
+        [r["score"] for r in session.results()],
+        len(session.questions),
+        confidence=SCREENING_SESSION_CONFIDENCE,
+        min_answers=SCREENING_SESSION_MIN_ANSWERS,
+        min_std=SCREENING_SESSION_MIN_STD,
+    )
+
+def session_response(session, last_grade: Optional[dict] = None) -> ScreeningSessionResponse:
+    settlement = session_settlement(session)
+    result = None
+    if session.finished:
+        aggregated = aggregate_question_grades(session.results())
+        feedback = aggregated["feedback"]
+        if session.unanswered:
+            feedback += f" Outcome settled after {len(session.grades)} of {len(session.questions)} questions."
+        result = SubmitScreeningResponse(
+            success=True,
+            score=aggregated["overallScore"],
+            status=session.status,
+            feedback=feedback,
+            detailedResults=aggregated["detailedResults"]
+        )
+    return ScreeningSessionResponse(
+        success=True,
+        sessionId=session.id,
+        status=session.status,
+        answered=len(session.grades),
+        totalQuestions=len(session.questions),
+        score=round(settlement.mean, 2) if settlement.mean is not None else None,
+        lowerBound=round(settlement.lower, 2),
+        upperBound=round(settlement.upper, 2),
+        lastGrade=last_grade,
+        nextQuestion=session.next_question(),
+        result=result
+    )
+
+@app.post("/screening-sessions", response_model=ScreeningSessionResponse)
+async def start_screening_session(request: StartScreeningSessionRequest):
+    """
+    Start an adaptive screening test. Answers are then submitted one at a time and the
+    session ends as soon as the pass/fail outcome is settled, often before the last question.
+    """
+    questions = request.questions
+    if not questions:
+        generated = await generate_questions(GenerateQuestionsRequest(
+            projectId=request.projectId,
+            instruction=request.instruction,
+            numQuestions=request.numQuestions,
+            userId=request.userId
+        ))
+        questions = generated.questions
+    if not questions:
+        raise HTTPException(status_code=422, detail="A screening session needs at least one question")
+    if len({q.id for q in questions}) != len(questions):
+        raise HTTPException(status_code=422, detail="Question ids must be unique")
+    session = await state_io(
+        screening_sessions.create, request.projectId, request.userId, request.instruction, [q.model_dump() for q in questions]
+    )
+    return session_response(session)
+
+@app.post("/screening-sessions/{session_id}/answers", response_model=ScreeningSessionResponse)
+async def answer_screening_session(session_id: str, answer: Answer):
+    """Grade one answer, update the running score and bounds, and end the session once settled"""
+    session = await state_io(screening_sessions.get, session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired screening session")
+    found = session.question(answer.questionId)
+    if found is None:
+        raise HTTPException(status_code=422, detail=f"Question {answer.questionId} is not part of this session")
+    if session.finished:
+        raise HTTPException(status_code=409, detail=f"Session already {session.status}")
+    if str(answer.questionId) in session.grades:
+        raise HTTPException(status_code=409, detail=f"Question {answer.questionId} was already answered")
+
+    question = Question(**found)
+    try:
+        local_results, llm_questions = await state_io(answer_keys.grade_locally, session.project_id, [question], [answer])
+        if llm_questions:
+            qa_pair = build_qa_pairs([question], [answer], include_ids=True)[0]
+            grade = await grade_question_with_llm(session.instruction, qa_pair, asyncio.Semaphore(1))
+        else:
+            grade = local_results[question.id]
+    except HTTPException:
+        raise
+    except PromptTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to grade answer: {str(e)}")
+
+    # Recorded atomically: a concurrent answer (possibly in another worker) may have won meanwhile
+    try:
+        session = await state_io(screening_sessions.record, session_id, grade, lambda s: session_settlement(s).passed)
+    except SessionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown or expired screening session")
+    response = session_response(session, grade)
+    if session.finished:
+        SCREENING_SESSIONS.inc(1, session.status, "early" if session.unanswered else "complete")
+        SCREENING_SESSION_QUESTIONS_SKIPPED.inc(session.unanswered)
+        await record_screening(
+            session.project_id, session.user_id, session.instruction, [q["question"] for q in session.questions],
+            response.result.score, session.status
+        )
+    return response
+
+@app.get("/screening-sessions/{session_id}", response_model=ScreeningSessionResponse)
+async def get_screening_session(session_id: str):
+    session = await state_io(screening_sessions.get, session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired screening session")
+    return session_response(session)
+
+async def screening_result(sub: SubmitScreeningRequest, local_results: dict, llm_result: Optional[dict]) -> BatchScreeningResult:
+    merged = merge_grading(sub.questions, local_results, llm_result)
+    overall_score = merged["overallScore"]
+    status = "passed" if overall_score >= 70 else "failed"
+    await record_screening(sub.projectId, sub.userId, sub.instruction, [q.question for q in sub.questions], overall_score, status)
+    return BatchScreeningResult(
+        userId=sub.userId,
+        success=True,
+        score=overall_score,
+        status=status,
+        feedback=merged["feedback"],
+        detailedResults=merged["detailedResults"]
+    )
+
+async def grade_submission_pack(instruction: str, pack: List[SubmitScreeningRequest], local_grades: List[tuple]) -> List[BatchScreeningResult]:
+    """
+    Grade several submissions with one GPT-4 call; results are returned in pack order.
+    local_grades holds (local results, questions left for the LLM) per submission.
+    """
+    submissions = [
+        {"submissionId": idx, "qaPairs": build_qa_pairs(llm_questions, sub.answers, include_ids=True)}
+        for idx, (sub, (_, llm_questions)) in enumerate(zip(pack, local_grades))
+    ]
+    graded: Dict[int, dict] = {}
+    invalid_output = None
+    try:
+        for attempt in range(SCREENING_PARSE_RETRIES + 1):
+            pending = [entry for entry in submissions if entry["submissionId"] not in graded]
+            parser = SchemaStreamParser(BatchGradingCompletion, item_schema=SubmissionGrade, item_path=("results",))
+            model = router.pick("grading")
+            max_tokens = min(SCREENING_BATCH_MAX_OUTPUT_TOKENS, SCREENING_BATCH_OUTPUT_TOKENS_PER_SUBMISSION * len(pending))
+            try:
+                async for item in stream_validated(
+                    parser,
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": GRADING_SYSTEM_PROMPT},
+                        {"role": "user", "content": batch_grading_prompt(instruction, pending, model, max_tokens)}
+                    ],
+                    temperature=0.3,  # Lower temperature for more consistent grading
+                    max_tokens=max_tokens
+                ):
+                    graded[item.submissionId] = item.model_dump()
+                parser.finish()
+                invalid_output = None
+                break
+            except StreamValidationError as e:
+                # Submissions validated before the output went bad keep their grades; only the rest are retried
+                invalid_output = f"Failed to parse OpenAI response: {str(e)}"
+    except HTTPException as e:
+        return [BatchScreeningResult(userId=sub.userId, success=False, error=str(e.detail)) for sub in pack]
+    except Exception as e:
+        return [BatchScreeningResult(userId=sub.userId, success=False, error=f"Failed to grade screening: {str(e)}") for sub in pack]
+
+    results = []
+    for idx, (sub, (local_results, _)) in enumerate(zip(pack, local_grades)):
+        result = graded.get(idx)
+        if result is None:
+            results.append(BatchScreeningResult(userId=sub.userId, success=False, error=invalid_output or "Grader returned no result for this submission"))
+            continue
+        results.append(await screening_result(sub, local_results, result))
+    return results
+
+@app.post("/submit-screening/batch", response_model=BatchSubmitScreeningResponse)
+async def submit_screening_batch(request: BatchSubmitScreeningRequest):
+    """
+    Grade many screening submissions for one project.
+    Submissions are packed into shared GPT-4 prompts up to a token budget and the packs are graded concurrently.
+    Results are returned in input order; a failed pack only fails its own submissions.
+    """
+    results: List[Optional[BatchScreeningResult]] = [None] * len(request.submissions)
+
+    # Submissions for another project or instruction cannot share a prompt with the rest
+    groups = {}
+    for idx, sub in enumerate(request.submissions):
+        if sub.projectId != request.projectId:
+            results[idx] = BatchScreeningResult(
+                userId=sub.userId,
+                success=False,
+                error=f"Submission projectId {sub.projectId} does not match batch projectId {request.projectId}"
+            )
+            continue
+        groups.setdefault(sub.instruction, []).append(idx)
+
+    # Multiple-choice answers with a stored key are graded locally; all-MC submissions never reach the LLM
+    local_grades = {}
+    for instruction, indices in groups.items():
+        for i in indices:
+            sub = request.submissions[i]
+            local_grades[i] = await state_io(answer_keys.grade_locally, request.projectId, sub.questions, sub.answers)
+        for i in [i for i in indices if not local_grades[i][1]]:
+            results[i] = await screening_result(request.submissions[i], local_grades[i][0], None)
+        groups[instruction] = [i for i in indices if local_grades[i][1]]
+
+    jobs = []
+    for instruction, indices in groups.items():
+        model = router.routes["grading"].models[0]
+        sizes = [
+            submission_tokens(build_qa_pairs(local_grades[i][1], request.submissions[i].answers, include_ids=True), model)
+            for i in indices
+        ]
+        budget = batch_submission_budget(instruction)
+        for pack in pack_by_token_budget(sizes, budget, SCREENING_BATCH_MAX_SUBMISSIONS):
+            pack_indices = [indices[i] for i in pack]
+            jobs.append((pack_indices, grade_submission_pack(
+                instruction,
+                [request.submissions[i] for i in pack_indices],
+                [local_grades[i] for i in pack_indices]
+            )))
+
+    pack_results = await asyncio.gather(*(job for _, job in jobs))
+    for (pack_indices, _), graded in zip(jobs, pack_results):
+        for idx, result in zip(pack_indices, graded):
+            results[idx] = result
+
+    return BatchSubmitScreeningResponse(success=True, projectId=request.projectId, results=results)
+
+@app.post("/generate-questions/stream")
+async def generate_questions_stream(request: GenerateQuestionsRequest):
+    """
+    Server-Sent Events variant of /generate-questions.
+    Emits a "question" event per question as soon as GPT-4 has produced it, then a "done" event.
+    Pooled and cached questions are served the same way as by /generate-questions, all at once.
+    """
+    async def events():
+        if request.reuseQualification and request.userId:
+            qualification = await find_qualification(request.userId, request.projectId, request.instruction)
+            if qualification is not None:
+                yield sse_event("qualification", qualification.model_dump())
+                yield sse_event("done", {"success": True, "projectId": request.projectId, "count": 0})
+                return
+
+        ready = None
+        if question_pool is not None:
+            await asyncio.to_thread(question_pool.ensure, request.projectId, request.instruction, request.numQuestions)
+            ready = await asyncio.to_thread(question_pool.sample, request.projectId, request.instruction, request.numQuestions, request.userId)
+            await schedule_pool_fill(request.projectId, request.instruction)
+        if ready is None:
+            ready = question_cache.get(request.projectId, request.instruction, request.numQuestions)
+        if ready is not None:
+            await state_io(answer_keys.record, request.projectId, ready)
+            for q in ready:
+                yield sse_event("question", public_question(q).model_dump())
+            yield sse_event("done", {"success": True, "projectId": request.projectId, "count": len(ready)})
+            return
+
+        try:
+            parser = SchemaStreamParser(item_schema=GeneratedQuestion, root="array")
+            questions = []
+            async for item in stream_validated(
+                parser,
+                model=router.pick("generate-questions"),
+                messages=[
+                    {"role": "system", "content": QUESTION_SYSTEM_PROMPT},
+                    {"role": "user", "content": question_generation_prompt(request.instruction, request.numQuestions)}
+                ],
+                temperature=0.7,
+                max_tokens=1500
+            ):
+                question = normalize_generated_question(item.model_dump(exclude_none=True), len(questions))
+                questions.append(question)
+                yield sse_event("question", public_question(question).model_dump())
+            parser.finish()
+
+            await state_io(answer_keys.record, request.projectId, questions)
+            question_cache.put(request.projectId, request.instruction, request.numQuestions, questions)
+            yield sse_event("done", {"success": True, "projectId": request.projectId, "count": len(questions)})
+        except HTTPException as e:
+            yield sse_event("error", {"detail": e.detail})
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Failed to generate questions: {str(e)}"})
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.post("/submit-screening/stream")
+async def submit_screening_stream(request: SubmitScreeningRequest):
+    """
+    Server-Sent Events variant of /submit-screening.
+    Emits a "result" event per graded question (locally graded multiple-choice answers first),
+    then a "summary" event carrying overallScore, status and feedback.
+    """
+    async def events():
+        try:
+            local_results, llm_questions = await state_io(answer_keys.grade_locally, request.projectId, request.questions, request.answers)
+            for result in local_results.values():
+                yield sse_event("result", result)
+
+            llm_result = None
+            if llm_questions:
+                parser = SchemaStreamParser(GradingCompletion, item_schema=QuestionGrade, item_path=("detailedResults",))
+                qa_pairs = build_qa_pairs(llm_questions, request.answers, include_ids=True)
+                model = router.pick("grading")
+                async for item in stream_validated(
+                    parser,
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": GRADING_SYSTEM_PROMPT},
+                        {"role": "user", "content": grading_prompt(request.instruction, qa_pairs, model, 2000)}
+                    ],
+                    temperature=0.3,  # Lower temperature for more consistent grading
+                    max_tokens=2000
+                ):
+                    yield sse_event("result", item.model_dump())
+                llm_result = parser.finish().model_dump()
+
+            merged = merge_grading(request.questions, local_results, llm_result)
+            overall_score = merged["overallScore"]
+            status = "passed" if overall_score >= 70 else "failed"
+            await record_screening(request.projectId, request.userId, request.instruction, [q.question for q in request.questions], overall_score, status)
+            yield sse_event("summary", {
+                "success": True,
+                "overallScore": overall_score,
+                "status": status,
+                "feedback": merged["feedback"]
+            })
+        except HTTPException as e:
+            yield sse_event("error", {"detail": e.detail})
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Failed to grade screening: {str(e)}"})
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="127.0.0.1", port=8000)
@@ -0,0 +1,223 @@
+# screening-service/qualifications.py
+
+"""
+Annotator qualifications: screening outcomes per annotator, so a returning
+annotator does not take (and GPT-4 does not generate and grade) a new test.
+
+Every graded screening is recorded with its userId, projectId and a
+fingerprint of the normalized instruction (plus its MinHash signature, see
+question_cache.py). lookup() returns a qualification when the annotator's
+most recent screening for the same or a near-identical instruction, in any
+project, passed within the validity window. A later failed screening for that
+instruction takes precedence over an earlier pass.
+
+Each annotator also has reputation aggregates that are updated incrementally
+as screenings are recorded: the number of screenings and passes, the running
+mean score and an exponentially decayed mean in which a score's weight halves
+every half_life_seconds. Outcomes live in a SQLite file (WAL mode), so they
+survive restarts and several service processes (and their job workers) can
+share one file.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from question_cache import MinHasher, normalize_instruction
+
+
+def instruction_fingerprint(normalized: str) -> str:
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:32]
+
+
+class QualificationStore:
+    def __init__(
+        self,
+        path: str,
+        validity_seconds: float = 30 * 86400,
+        similarity_threshold: float = 0.9,
+        half_life_seconds: float = 90 * 86400,
+        min_reputation: float = 0.0,
+        max_candidates: int = 200,
+    ):
+        self.path = path
+        self.validity_seconds = validity_seconds
+        self.similarity_threshold = similarity_threshold
+        self.half_life_seconds = half_life_seconds
+        self.min_reputation = min_reputation
+        self.max_candidates = max_candidates
+        self.counters = {"recorded": 0, "hits": 0, "misses": 0}
+        self._hasher = MinHasher(num_perm=64, seed=1)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._connection()
+
+    # --- Public API ---
+
+    def record(self, user_id: str, project_id: str, instruction: str, score: float, status: str, now: Optional[float] = None) -> None:
+        """Store one graded screening and fold its score into the annotator's reputation"""
+        now = time.time() if now is None else now
+        normalized = normalize_instruction(instruction)
+        with self._transaction() as conn:
+            conn.execute(
+                """
+                INSERT INTO screenings (user_id, project_id, fingerprint, signature, score, status, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    user_id, project_id, instruction_fingerprint(normalized),
+                    json.dumps(self._hasher.signature(normalized)), score, status, now,
+                ),
+            )
+            row = conn.execute(
+                "SELECT screenings, passes, mean_score, decayed_sum, decayed_weight, updated_at FROM reputation WHERE user_id = ?",
+                (user_id,),
+            ).fetchone()
+            screenings, passes, mean_score, decayed_sum, decayed_weight, updated_at = row or (0, 0, 0.0, 0.0, 0.0, now)
+            decay = self._decay(now - updated_at)
+            screenings += 1
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO reputation (user_id, screenings, passes, mean_score, decayed_sum, decayed_weight, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    user_id, screenings, passes + (status == "passed"),
+                    mean_score + (score - mean_score) / screenings,
+                    decayed_sum * decay + score, decayed_weight * decay + 1.0, max(now, updated_at),
+                ),
+            )
+        self.counters["recorded"] += 1
+
+    def lookup(self, user_id: str, project_id: str, instruction: str, now: Optional[float] = None) -> Optional[dict]:
+        """
+        The annotator's qualifying screening for this instruction, or None: their most recent
+        screening within the validity window whose instruction is identical or at least
+        similarity_threshold similar, if it passed and their decayed reputation is high enough.
+        """
+        if self.validity_seconds <= 0:
+            return None
+        now = time.time() if now is None else now
+        normalized = normalize_instruction(instruction)
+        fingerprint = instruction_fingerprint(normalized)
+        with self._lock:
+            rows = self._connection().execute(
+                """
+                SELECT project_id, fingerprint, signature, score, status, created_at FROM screenings
+                WHERE user_id = ? AND created_at >= ? ORDER BY created_at DESC, id DESC LIMIT ?
+                """,
+                (user_id, now - self.validity_seconds, self.max_candidates),
+            ).fetchall()
+
+        found = None
+        signature = None
+        for source_project, source_fingerprint, source_signature, score, status, created_at in rows:
+            if source_fingerprint == fingerprint:
+                similarity = 1.0
+            else:
+                signature = signature or self._hasher.signature(normalized)
+                similarity = MinHasher.similarity(signature, json.loads(source_signature))
+                if similarity < self.similarity_threshold:
+                    continue
+            if status == "passed":
+                found = {
+                    "project_id": source_project,
+                    "score": score,
+                    "screened_at": created_at,
+                    "expires_at": created_at + self.validity_seconds,
+                    "similarity": round(similarity, 3),
+                    "same_project": source_project == project_id,
+                }
+            break
+
+        if found is not None and self.min_reputation > 0:
+            reputation = self.reputation(user_id, now)
+            if reputation is None or reputation["decayed_score"] < self.min_reputation:
+                found = None
+        self.counters["hits" if found is not None else "misses"] += 1
+        return found
+
+    def reputation(self, user_id: str, now: Optional[float] = None) -> Optional[dict]:
+        """Reputation aggregates of an annotator; weight is the decayed number of screenings behind decayed_score"""
+        now = time.time() if now is None else now
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT screenings, passes, mean_score, decayed_sum, decayed_weight, updated_at FROM reputation WHERE user_id = ?",
+                (user_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        screenings, passes, mean_score, decayed_sum, decayed_weight, updated_at = row
+        return {
+            "screenings": screenings,
+            "passes": passes,
+            "mean_score": round(mean_score, 2),
+            "decayed_score": round(decayed_sum / decayed_weight, 2),
+            "weight": round(decayed_weight * self._decay(now - updated_at), 3),
+            "last_screened_at": updated_at,
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            conn = self._connection()
+            screenings = conn.execute("SELECT COUNT(*) FROM screenings").fetchone()[0]
+            annotators = conn.execute("SELECT COUNT(*) FROM reputation").fetchone()[0]
+        return {**self.counters, "screenings": screenings, "annotators": annotators}
+
+    # --- Internals ---
+
+    def _decay(self, elapsed: float) -> float:
+        if self.half_life_seconds <= 0:
+            return 1.0
+        return 0.5 ** (max(elapsed, 0.0) / self.half_life_seconds)
+
+    def _connection(self) -> sqlite3.Connection:
+        # A connection must not be used across fork; each process (job workers included) opens its own
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS screenings (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    project_id TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    signature TEXT NOT NULL,
+                    score REAL NOT NULL,
+                    status TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS screenings_by_user ON screenings (user_id, created_at);
+                CREATE TABLE IF NOT EXISTS reputation (
+                    user_id TEXT PRIMARY KEY,
+                    screenings INTEGER NOT NULL,
+                    passes INTEGER NOT NULL,
+                    mean_score REAL NOT NULL,
+                    decayed_sum REAL NOT NULL,
+                    decayed_weight REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                """
+            )
+            self._pid = os.getpid()
+        return self._conn
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
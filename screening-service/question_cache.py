@@ -0,0 +1,291 @@
+# screening-service/question_cache.py
+
+"""
+Question-set cache for /generate-questions.
+
+Two lookup layers sit in front of the GPT-4 call:
+1. Exact key on (projectId, instruction, numQuestions).
+2. A local MinHash/LSH similarity index over the instruction text, so a
+   near-identical instruction (from the same or another project) reuses an
+   existing question set when its estimated Jaccard similarity is above the
+   configured threshold.
+
+Entries expire after a TTL and the least recently used entry is evicted once
+the cache is full. The cache can optionally be persisted to a JSON file.
+Writes happen on a background thread: puts only mark the cache dirty, and the
+whole cache is written (to a temporary file, then renamed over the old one) at
+most once per flush_interval, so a burst of puts costs a single write.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger("QuestionCache")
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize_instruction(instruction: str) -> str:
+    """Lowercase and collapse punctuation/whitespace so trivial edits map to the same text"""
+    return " ".join(_TOKEN_RE.findall(instruction.lower()))
+
+
+def _shingles(text: str, size: int = 2) -> Set[str]:
+    words = text.split()
+    if len(words) < size:
+        return {text} if text else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _hash_shingle(shingle: str) -> int:
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "big")
+
+
+class MinHasher:
+    """MinHash signatures over word-bigram shingles"""
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._perms = [
+            (rng.randint(1, _MERSENNE_PRIME - 1), rng.randint(0, _MERSENNE_PRIME - 1))
+            for _ in range(num_perm)
+        ]
+
+    def signature(self, normalized_text: str) -> Tuple[int, ...]:
+        hashes = [_hash_shingle(s) for s in _shingles(normalized_text)]
+        if not hashes:
+            return tuple([_MAX_HASH] * self.num_perm)
+        return tuple(
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self._perms
+        )
+
+    @staticmethod
+    def similarity(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+        """Estimated Jaccard similarity of the underlying shingle sets"""
+        matches = sum(1 for a, b in zip(sig_a, sig_b) if a == b)
+        return matches / len(sig_a)
+
+
+@dataclass
+class _Entry:
+    project_id: str
+    instruction: str
+    num_questions: int
+    questions: List[dict]
+    signature: Tuple[int, ...]
+    created_at: float
+
+
+class QuestionCache:
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 86400,
+        similarity_threshold: float = 0.8,
+        num_perm: int = 64,
+        bands: int = 16,
+        persist_path: Optional[str] = None,
+        flush_interval: float = 1.0,
+    ):
+        if num_perm % bands != 0:
+            raise ValueError("num_perm must be divisible by bands")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.persist_path = persist_path
+        self.flush_interval = flush_interval
+        self._hasher = MinHasher(num_perm)
+        self._bands = bands
+        self._rows = num_perm // bands
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], Set[str]] = {}
+        self.counters = {"exact_hits": 0, "similar_hits": 0, "misses": 0, "evictions": 0, "writes": 0}
+        # Guards _entries/_buckets against the writer thread's snapshot
+        self._lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._save_lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+        if persist_path:
+            self._load()
+
+    # --- Public API ---
+
+    def get(self, project_id: str, instruction: str, num_questions: int) -> Optional[List[dict]]:
+        """Return a cached question set for this request, or None on a miss"""
+        key = self._key(project_id, instruction, num_questions)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry):
+                self._entries.move_to_end(key)
+                self.counters["exact_hits"] += 1
+                return entry.questions
+            if entry is not None:
+                self._remove(key)
+
+            match = self._find_similar(normalize_instruction(instruction), num_questions)
+            if match is not None:
+                self._entries.move_to_end(match)
+                self.counters["similar_hits"] += 1
+                return self._entries[match].questions
+
+        self.counters["misses"] += 1
+        return None
+
+    def put(self, project_id: str, instruction: str, num_questions: int, questions: List[dict]) -> None:
+        key = self._key(project_id, instruction, num_questions)
+        entry = _Entry(
+            project_id=project_id,
+            instruction=instruction,
+            num_questions=num_questions,
+            questions=questions,
+            signature=self._hasher.signature(normalize_instruction(instruction)),
+            created_at=time.time(),
+        )
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._insert(key, entry)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.counters["evictions"] += 1
+        if self.persist_path:
+            self._schedule_save()
+
+    def flush(self) -> None:
+        """Write pending changes now (e.g. on shutdown) instead of waiting for the writer thread"""
+        if self.persist_path and self._dirty.is_set():
+            self._dirty.clear()
+            self._save()
+
+    def stats(self) -> dict:
+        lookups = self.counters["exact_hits"] + self.counters["similar_hits"] + self.counters["misses"]
+        hits = lookups - self.counters["misses"]
+        return {
+            **self.counters,
+            "entries": len(self._entries),
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+    # --- Internals ---
+
+    @staticmethod
+    def _key(project_id: str, instruction: str, num_questions: int) -> str:
+        raw = json.dumps([project_id, instruction.strip(), num_questions])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _expired(self, entry: _Entry) -> bool:
+        return self.ttl_seconds > 0 and time.time() - entry.created_at > self.ttl_seconds
+
+    def _band_keys(self, signature: Tuple[int, ...]):
+        for band in range(self._bands):
+            yield band, signature[band * self._rows:(band + 1) * self._rows]
+
+    def _insert(self, key: str, entry: _Entry) -> None:
+        self._entries[key] = entry
+        for band_key in self._band_keys(entry.signature):
+            self._buckets.setdefault(band_key, set()).add(key)
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for band_key in self._band_keys(entry.signature):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def _find_similar(self, normalized: str, num_questions: int) -> Optional[str]:
+        signature = self._hasher.signature(normalized)
+        candidates: Set[str] = set()
+        for band_key in self._band_keys(signature):
+            candidates |= self._buckets.get(band_key, set())
+
+        best_key, best_score = None, self.similarity_threshold
+        for key in candidates:
+            entry = self._entries.get(key)
+            if entry is None or entry.num_questions != num_questions:
+                continue
+            if self._expired(entry):
+                self._remove(key)
+                continue
+            score = MinHasher.similarity(signature, entry.signature)
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def _load(self) -> None:
+        if not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                records = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable question cache file {self.persist_path}: {e}")
+            return
+        for record in records:
+            entry = _Entry(
+                project_id=record["project_id"],
+                instruction=record["instruction"],
+                num_questions=record["num_questions"],
+                questions=record["questions"],
+                signature=self._hasher.signature(normalize_instruction(record["instruction"])),
+                created_at=record["created_at"],
+            )
+            if not self._expired(entry):
+                self._insert(self._key(entry.project_id, entry.instruction, entry.num_questions), entry)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _schedule_save(self) -> None:
+        self._dirty.set()
+        # Threads do not survive fork; a forked process starts its own writer
+        if self._writer is None or not self._writer.is_alive():
+            self._writer = threading.Thread(target=self._write_loop, name="question-cache-writer", daemon=True)
+            self._writer.start()
+
+    def _write_loop(self) -> None:
+        while True:
+            self._dirty.wait()
+            # Let a burst of puts accumulate into one write
+            time.sleep(self.flush_interval)
+            self._dirty.clear()
+            self._save()
+
+    def _save(self) -> None:
+        with self._lock:
+            records = [
+                {
+                    "project_id": e.project_id,
+                    "instruction": e.instruction,
+                    "num_questions": e.num_questions,
+                    "questions": e.questions,
+                    "created_at": e.created_at,
+                }
+                for e in self._entries.values()
+            ]
+        # Per-process temporary file, so processes sharing the path never write to the same one
+        tmp_path = f"{self.persist_path}.{os.getpid()}.tmp"
+        with self._save_lock:
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(records, f)
+                os.replace(tmp_path, self.persist_path)
+                self.counters["writes"] += 1
+            except OSError as e:
+                logger.warning(f"Failed to persist question cache to {self.persist_path}: {e}")
@@ -0,0 +1,212 @@
+# screening-service/question_pool.py
+
+"""
+Pre-generated question pools for /generate-questions.
+
+Each (projectId, instruction) pair gets a pool of factor x numQuestions
+validated questions, generated in the background when the project is created
+or first requested. /generate-questions then draws a random sample for each
+annotator from the pool instead of calling GPT-4, so two annotators rarely see
+the same test. An annotator who opens the test again gets the same sample.
+
+A question is retired after it has been served to max_exposures annotators,
+which limits how far a leaked test spreads. Once the active questions fall
+below the low-water mark, the pool is refilled. Pools live in a SQLite file
+(WAL mode), so they survive restarts and several service processes can share
+one file.
+"""
+
+import json
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from question_cache import normalize_instruction
+
+
+def pool_key(project_id: str, instruction: str) -> str:
+    return json.dumps([project_id, normalize_instruction(instruction)])
+
+
+class QuestionPool:
+    def __init__(self, path: str, factor: int = 4, low_water: float = 0.5, max_exposures: int = 25):
+        self.path = path
+        self.factor = factor
+        self.low_water = low_water
+        self.max_exposures = max_exposures
+        self.counters = {"hits": 0, "misses": 0, "reassigned": 0}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS pools (
+                key TEXT PRIMARY KEY,
+                project_id TEXT NOT NULL,
+                instruction TEXT NOT NULL,
+                target INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pool_questions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT NOT NULL,
+                normalized TEXT NOT NULL,
+                question TEXT NOT NULL,
+                exposures INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                UNIQUE (key, normalized)
+            );
+            CREATE TABLE IF NOT EXISTS pool_assignments (
+                key TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                question_ids TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (key, user_id)
+            );
+            """
+        )
+
+    # --- Public API ---
+
+    def ensure(self, project_id: str, instruction: str, num_questions: int) -> None:
+        """Create the pool if needed and grow its target to factor x num_questions"""
+        target = self.factor * num_questions
+        with self._transaction() as conn:
+            conn.execute(
+                """
+                INSERT INTO pools (key, project_id, instruction, target, created_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET target = MAX(target, excluded.target)
+                """,
+                (pool_key(project_id, instruction), project_id, instruction, target, time.time()),
+            )
+
+    def sample(self, project_id: str, instruction: str, num_questions: int, user_id: Optional[str] = None) -> Optional[List[dict]]:
+        """
+        Questions for one annotator, numbered 1..num_questions, or None if the pool
+        does not have enough active questions yet. The same user_id gets the same sample.
+        """
+        key = pool_key(project_id, instruction)
+        with self._transaction() as conn:
+            if user_id is not None:
+                assigned = self._assignment(conn, key, user_id)
+                if assigned is not None and len(assigned) == num_questions:
+                    self.counters["hits"] += 1
+                    return _numbered(assigned)
+
+            rows = conn.execute(
+                "SELECT id, question FROM pool_questions WHERE key = ? AND exposures < ? ORDER BY id",
+                (key, self._exposure_limit()),
+            ).fetchall()
+            if len(rows) < num_questions:
+                self.counters["misses"] += 1
+                return None
+
+            rng = random.Random(f"{key}:{user_id}") if user_id is not None else random.Random()
+            chosen = rng.sample(rows, num_questions)
+            conn.executemany("UPDATE pool_questions SET exposures = exposures + 1 WHERE id = ?", [(row[0],) for row in chosen])
+            if user_id is not None:
+                if conn.execute("SELECT 1 FROM pool_assignments WHERE key = ? AND user_id = ?", (key, user_id)).fetchone():
+                    self.counters["reassigned"] += 1
+                conn.execute(
+                    "INSERT OR REPLACE INTO pool_assignments (key, user_id, question_ids, created_at) VALUES (?, ?, ?, ?)",
+                    (key, user_id, json.dumps([row[0] for row in chosen]), time.time()),
+                )
+        self.counters["hits"] += 1
+        return _numbered([json.loads(row[1]) for row in chosen])
+
+    def missing(self, project_id: str, instruction: str) -> int:
+        """
+        How many questions a refill should generate: the gap to the target (see deficit) once
+        active questions are below the low-water mark, else 0. Decides whether a refill starts.
+        """
+        target, active = self._sizes(project_id, instruction)
+        return target - active if active < target * self.low_water or active == 0 else 0
+
+    def deficit(self, project_id: str, instruction: str) -> int:
+        """Gap between the pool's target and its active questions; a running refill fills until it is 0"""
+        target, active = self._sizes(project_id, instruction)
+        return max(target - active, 0)
+
+    def add(self, project_id: str, instruction: str, questions: List[dict]) -> int:
+        """Add generated questions, skipping ones the pool already has; returns how many were added"""
+        key = pool_key(project_id, instruction)
+        now = time.time()
+        with self._transaction() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO pool_questions (key, normalized, question, created_at) VALUES (?, ?, ?, ?)",
+                [(key, normalize_instruction(q["question"]), json.dumps(q), now) for q in questions],
+            )
+            return conn.total_changes - before
+
+    def existing_questions(self, project_id: str, instruction: str, limit: int = 30) -> List[str]:
+        """Most recent question texts of a pool, to keep new ones from repeating them"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT question FROM pool_questions WHERE key = ? ORDER BY id DESC LIMIT ?",
+                (pool_key(project_id, instruction), limit),
+            ).fetchall()
+        return [json.loads(row[0])["question"] for row in rows]
+
+    def all_questions(self, project_id: str, instruction: str) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT question FROM pool_questions WHERE key = ? ORDER BY id", (pool_key(project_id, instruction),)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def stats(self) -> dict:
+        with self._lock:
+            pools = self._conn.execute("SELECT COUNT(*) FROM pools").fetchone()[0]
+            questions, active = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(exposures < ?), 0) FROM pool_questions", (self._exposure_limit(),)
+            ).fetchone()
+        return {**self.counters, "pools": pools, "questions": questions, "active_questions": active}
+
+    # --- Internals ---
+
+    def _sizes(self, project_id: str, instruction: str) -> Tuple[int, int]:
+        """(target, active questions) of a pool; (0, 0) if it does not exist"""
+        key = pool_key(project_id, instruction)
+        with self._lock:
+            target_row = self._conn.execute("SELECT target FROM pools WHERE key = ?", (key,)).fetchone()
+            if target_row is None:
+                return 0, 0
+            active = self._conn.execute(
+                "SELECT COUNT(*) FROM pool_questions WHERE key = ? AND exposures < ?", (key, self._exposure_limit())
+            ).fetchone()[0]
+        return target_row[0], active
+
+    def _exposure_limit(self) -> int:
+        return self.max_exposures if self.max_exposures > 0 else 2 ** 62
+
+    def _assignment(self, conn: sqlite3.Connection, key: str, user_id: str) -> Optional[List[dict]]:
+        row = conn.execute("SELECT question_ids FROM pool_assignments WHERE key = ? AND user_id = ?", (key, user_id)).fetchone()
+        if row is None:
+            return None
+        ids = json.loads(row[0])
+        placeholders = ",".join("?" * len(ids))
+        found: Dict[int, str] = dict(conn.execute(
+            f"SELECT id, question FROM pool_questions WHERE id IN ({placeholders})", ids
+        ).fetchall())
+        if len(found) != len(ids):
+            return None
+        return [json.loads(found[i]) for i in ids]
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+def _numbered(questions: List[dict]) -> List[dict]:
+    return [{**q, "id": idx + 1} for idx, q in enumerate(questions)]
@@ -0,0 +1 @@
+"""Helpers shared by the Python services (screening-service and the uAgents in agents/)."""
@@ -0,0 +1,60 @@
+# shared/agent_rest.py
+
+"""
+Serve a uAgent's REST handlers from an ASGI app as well.
+
+uAgents REST endpoints only run inside Agent.run(), one process per agent.
+RestRoutes registers handlers with the agent as usual and also records them,
+so asgi_app() can mount the same handlers in a FastAPI app (deploy/app.py),
+where they run in every uvicorn worker process. Handlers get ctx=None there,
+so they must not rely on the agent context.
+"""
+
+import json
+from typing import Callable, List, Optional, Tuple
+
+
+class RestRoutes:
+    def __init__(self, agent):
+        self.agent = agent
+        # (method, endpoint, request model or None, handler)
+        self.routes: List[Tuple[str, str, Optional[type], Callable]] = []
+
+    def post(self, endpoint: str, request: type, response: type):
+        def decorator(func):
+            self.routes.append(("POST", endpoint, request, func))
+            return self.agent.on_rest_post(endpoint, request, response)(func)
+        return decorator
+
+    def get(self, endpoint: str, response: type):
+        def decorator(func):
+            self.routes.append(("GET", endpoint, None, func))
+            return self.agent.on_rest_get(endpoint, response)(func)
+        return decorator
+
+
+def asgi_app(routes: RestRoutes, title: str):
+    """FastAPI app with one route per recorded handler; request bodies are validated with the agent's models"""
+    # FastAPI is only needed for the ASGI deployment, not to run the agent itself
+    from fastapi import FastAPI, HTTPException, Request
+    from fastapi.responses import JSONResponse
+    from pydantic.v1 import ValidationError
+
+    app = FastAPI(title=title)
+
+    def endpoint_for(request_model: Optional[type], handler: Callable):
+        async def endpoint(request: Request):
+            if request_model is None:
+                response = await handler(None)
+            else:
+                try:
+                    body = request_model.parse_raw(await request.body())
+                except ValidationError as e:
+                    raise HTTPException(status_code=422, detail=json.loads(e.json()))
+                response = await handler(None, body)
+            return JSONResponse(json.loads(response.json()))
+        return endpoint
+
+    for method, endpoint, request_model, handler in routes.routes:
+        app.add_api_route(endpoint, endpoint_for(request_model, handler), methods=[method], name=handler.__name__)
+    return app
@@ -0,0 +1,517 @@
+# shared/jobqueue.py
+
+"""
+Durable job queue backed by a local SQLite file, drained by worker processes.
+
+Long-running calls (quality assessment of large outputs, screening grading)
+are submitted as jobs: the caller gets a job ID immediately and polls for the
+result, or gets it delivered to a webhook URL. Nothing is rejected during a
+burst (up to max_queued jobs); the workers drain the queue at the pace the
+upstream allows.
+
+- Deduplication: a job whose kind and payload hash match a queued, running or
+  recently succeeded job returns that job instead of creating a new one.
+- Crash recovery: a claimed job carries its worker ("host:pid") and a lease.
+  Jobs of workers that died (or of a previous run of the service) are
+  requeued, and so are jobs whose lease expired. A job is failed after
+  max_attempts claims, so a payload that crashes its worker does not loop
+  forever.
+- Handlers raise JobFailed for errors that retrying will not fix; any other
+  exception is retried with exponential backoff.
+
+Workers are started with the `spawn` method, not forked: a fork of a service
+that already runs an event loop, threads or pooled HTTP connections inherits
+them in an unusable state. Each worker imports the service module afresh, so
+handlers, `initializer` and `render` must be module-level functions (they are
+pickled by reference). Pass an `initializer` to size per-worker resources,
+e.g. the worker's share of an upstream concurrency limit.
+"""
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from queue import SimpleQueue
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .metrics import JOB_WORKER_RESTARTS, JOBS, JOBS_SUBMITTED
+from .result_cache import content_key
+
+logger = logging.getLogger("JobQueue")
+
+FINISHED = ("succeeded", "failed")
+
+
+class JobFailed(Exception):
+    """Raised by a handler for an error that retrying will not fix"""
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class JobQueue:
+    def __init__(
+        self,
+        path: str,
+        max_attempts: int = 3,
+        lease_seconds: float = 300.0,
+        result_ttl: float = 86400.0,
+        max_queued: int = 10_000,
+    ):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.result_ttl = result_ttl
+        self.max_queued = max_queued
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = None
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    content_key TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    callbacks TEXT NOT NULL DEFAULT '[]',
+                    webhook_status TEXT,
+                    owner TEXT,
+                    lease_expires_at REAL,
+                    available_at REAL NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    finished_at REAL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, available_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_content ON jobs (kind, content_key)")
+
+    @classmethod
+    def from_env(cls, path: str) -> "JobQueue":
+        return cls(
+            path,
+            max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+            lease_seconds=float(os.getenv("JOB_LEASE_SECONDS", "300")),
+            result_ttl=float(os.getenv("JOB_RESULT_TTL", "86400")),
+            max_queued=int(os.getenv("JOB_MAX_QUEUED", "10000")),
+        )
+
+    def __getstate__(self) -> dict:
+        # Pickled into spawned workers, which open their own connection
+        state = dict(self.__dict__)
+        state.update(_lock=None, _conn=None, _pid=None)
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    # --- Producer side ---
+
+    def submit(self, kind: str, payload: Any, callback_url: Optional[str] = None) -> Tuple[dict, bool]:
+        """
+        Enqueue a job; returns (job, deduplicated). An identical queued, running or
+        recently succeeded job is returned instead of creating a new one, and the
+        callback is added to it if it has not finished yet.
+        """
+        key = content_key(kind, payload)
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                """
+                SELECT * FROM jobs WHERE kind = ? AND content_key = ?
+                AND (status IN ('queued', 'running') OR (status = 'succeeded' AND finished_at > ?))
+                ORDER BY created_at DESC LIMIT 1
+                """,
+                (kind, key, now - self.result_ttl),
+            ).fetchone()
+            if row is not None:
+                job = self._decode(row)
+                if callback_url and job["status"] not in FINISHED and callback_url not in job["callbacks"]:
+                    job["callbacks"].append(callback_url)
+                    conn.execute("UPDATE jobs SET callbacks = ? WHERE id = ?", (json.dumps(job["callbacks"]), job["id"]))
+                JOBS_SUBMITTED.inc(1, kind, "deduplicated")
+                return job, True
+
+            queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            if queued >= self.max_queued:
+                raise QueueFullError(f"Job queue is full ({queued} queued jobs)")
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                """
+                INSERT INTO jobs (id, kind, content_key, payload, status, callbacks, available_at, created_at, updated_at)
+                VALUES (?, ?, ?, ?, 'queued', ?, ?, ?, ?)
+                """,
+                (job_id, kind, key, json.dumps(payload), json.dumps([callback_url] if callback_url else []), now, now, now),
+            )
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        JOBS_SUBMITTED.inc(1, kind, "new")
+        return self._decode(row), False
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._decode(row) if row is not None else None
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        """kind -> status -> number of jobs"""
+        with self._lock:
+            rows = self._connection().execute("SELECT kind, status, COUNT(*) FROM jobs GROUP BY kind, status").fetchall()
+        counts: Dict[str, Dict[str, int]] = {}
+        for kind, status, count in rows:
+            counts.setdefault(kind, {})[status] = count
+        return counts
+
+    # --- Worker side ---
+
+    def claim(self, owner: str, kinds: Iterable[str]) -> Optional[dict]:
+        """Take the oldest runnable job of the given kinds (queued, or running with an expired lease)"""
+        kinds = list(kinds)
+        placeholders = ",".join("?" * len(kinds))
+        while True:
+            now = time.time()
+            with self._transaction() as conn:
+                row = conn.execute(
+                    f"""
+                    SELECT * FROM jobs WHERE kind IN ({placeholders})
+                    AND ((status = 'queued' AND available_at <= ?) OR (status = 'running' AND lease_expires_at < ?))
+                    ORDER BY available_at LIMIT 1
+                    """,
+                    (*kinds, now, now),
+                ).fetchone()
+                if row is None:
+                    return None
+                job = self._decode(row)
+                if job["attempts"] >= self.max_attempts:
+                    # The lease of its last attempt expired
+                    self._finish(conn, job["id"], "failed", None, f"Gave up after {job['attempts']} attempts (worker died or lease expired)")
+                    continue
+                conn.execute(
+                    """
+                    UPDATE jobs SET status = 'running', owner = ?, lease_expires_at = ?, attempts = attempts + 1, updated_at = ?
+                    WHERE id = ?
+                    """,
+                    (owner, now + self.lease_seconds, now, job["id"]),
+                )
+            job.update(status="running", owner=owner, attempts=job["attempts"] + 1)
+            return job
+
+    def complete(self, job_id: str, owner: str, result: Any) -> Optional[dict]:
+        """Store the result; returns None if the job was meanwhile reclaimed by another worker"""
+        with self._transaction() as conn:
+            if not self._owns(conn, job_id, owner):
+                return None
+            self._finish(conn, job_id, "succeeded", result, None)
+            return self._decode(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def fail(self, job_id: str, owner: str, error: str, retry: bool = True) -> Optional[dict]:
+        """Requeue with backoff while attempts remain (if retry), otherwise mark the job failed"""
+        with self._transaction() as conn:
+            if not self._owns(conn, job_id, owner):
+                return None
+            attempts = conn.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+            if retry and attempts < self.max_attempts:
+                now = time.time()
+                conn.execute(
+                    """
+                    UPDATE jobs SET status = 'queued', error = ?, owner = NULL, lease_expires_at = NULL,
+                    available_at = ?, updated_at = ? WHERE id = ?
+                    """,
+                    (error, now + min(2 ** attempts, 60), now, job_id),
+                )
+            else:
+                self._finish(conn, job_id, "failed", None, error)
+            return self._decode(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def set_webhook_status(self, job_id: str, status: str) -> None:
+        with self._transaction() as conn:
+            conn.execute("UPDATE jobs SET webhook_status = ? WHERE id = ?", (status, job_id))
+
+    def requeue_dead(self, alive: Callable[[str], bool]) -> int:
+        """Requeue running jobs whose owner is no longer alive; returns how many"""
+        with self._transaction() as conn:
+            rows = conn.execute("SELECT id, owner FROM jobs WHERE status = 'running'").fetchall()
+            dead = [job_id for job_id, owner in rows if not alive(owner)]
+            now = time.time()
+            conn.executemany(
+                """
+                UPDATE jobs SET status = 'queued', owner = NULL, lease_expires_at = NULL, available_at = ?, updated_at = ?
+                WHERE id = ?
+                """,
+                [(now, now, job_id) for job_id in dead],
+            )
+        if dead:
+            logger.warning(f"Requeued {len(dead)} jobs of dead workers")
+        return len(dead)
+
+    def purge(self, older_than: float) -> int:
+        """Delete finished jobs older than `older_than` seconds"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND finished_at < ?", (time.time() - older_than,)
+            )
+            return cursor.rowcount
+
+    # --- Internals ---
+
+    def _connection(self) -> sqlite3.Connection:
+        # A connection must not be used across fork; each process opens its own
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._pid = os.getpid()
+        return self._conn
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    @staticmethod
+    def _owns(conn: sqlite3.Connection, job_id: str, owner: str) -> bool:
+        row = conn.execute("SELECT status, owner FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row is not None and row[0] == "running" and row[1] == owner
+
+    @staticmethod
+    def _finish(conn: sqlite3.Connection, job_id: str, status: str, result: Any, error: Optional[str]) -> None:
+        now = time.time()
+        conn.execute(
+            """
+            UPDATE jobs SET status = ?, result = ?, error = ?, lease_expires_at = NULL, updated_at = ?, finished_at = ?
+            WHERE id = ?
+            """,
+            (status, json.dumps(result) if result is not None else None, error, now, now, job_id),
+        )
+
+    @staticmethod
+    def _decode(row: tuple) -> dict:
+        (job_id, kind, key, payload, status, result, error, attempts, callbacks, webhook_status,
+         owner, lease_expires_at, available_at, created_at, updated_at, finished_at) = row
+        return {
+            "id": job_id,
+            "kind": kind,
+            "content_key": key,
+            "payload": json.loads(payload),
+            "status": status,
+            "result": json.loads(result) if result is not None else None,
+            "error": error,
+            "attempts": attempts,
+            "callbacks": json.loads(callbacks),
+            "webhook_status": webhook_status,
+            "owner": owner,
+            "created_at": created_at,
+            "updated_at": updated_at,
+            "finished_at": finished_at,
+        }
+
+
+# --- Workers ---
+
+def worker_id(pid: Optional[int] = None) -> str:
+    return f"{socket.gethostname()}:{pid or os.getpid()}"
+
+
+def _pid_alive(owner: str) -> bool:
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname():
+        # Another host's worker; its lease expiry covers it
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        return True
+    return True
+
+
+def deliver_webhooks(urls: List[str], body: dict, attempts: int = 3, timeout: float = 10.0) -> str:
+    """POST body to every URL, retrying with backoff; returns "delivered" or the last error"""
+    import httpx
+
+    failures = []
+    with httpx.Client(timeout=timeout) as http:
+        for url in urls:
+            for attempt in range(attempts):
+                try:
+                    http.post(url, json=body).raise_for_status()
+                    break
+                except httpx.HTTPError as e:
+                    if attempt == attempts - 1:
+                        failures.append(f"{url}: {e}")
+                    else:
+                        time.sleep(2 ** attempt)
+    return "delivered" if not failures else "failed: " + "; ".join(failures)
+
+
+class WorkerPool:
+    """
+    Spawn `processes` workers that drain `queue`. handlers maps job kind to a
+    function (or coroutine function) of the payload returning a JSON-serializable
+    result. render(job) builds the webhook body, normally the same document the
+    service's job status endpoint returns.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handlers: Dict[str, Callable],
+        processes: int = 2,
+        initializer: Optional[Callable[[], None]] = None,
+        render: Optional[Callable[[dict], dict]] = None,
+        poll_interval: float = 0.5,
+        shutdown_grace: float = 10.0,
+    ):
+        self.queue = queue
+        self.handlers = handlers
+        self.processes = processes
+        self.initializer = initializer
+        self.render = render
+        self.poll_interval = poll_interval
+        self.shutdown_grace = shutdown_grace
+        self._context = multiprocessing.get_context("spawn")
+        self._wake = self._context.Event()
+        self._stop = self._context.Event()
+        self._workers: List[multiprocessing.Process] = []
+        self._supervisor: Optional[threading.Thread] = None
+
+    def __getstate__(self) -> dict:
+        # Sent to each spawned worker; process handles and the supervisor stay in the service
+        state = dict(self.__dict__)
+        state.update(_context=None, _workers=[], _supervisor=None)
+        return state
+
+    def start(self) -> None:
+        if self.processes <= 0 or self._workers:
+            return
+        # Jobs left running by a previous run of the service
+        self.queue.requeue_dead(_pid_alive)
+        self._workers = [self._spawn() for _ in range(self.processes)]
+        self._supervisor = threading.Thread(target=self._supervise, name="job-supervisor", daemon=True)
+        self._supervisor.start()
+        logger.info(f"Started {self.processes} job workers on {self.queue.path}")
+
+    def notify(self) -> None:
+        """Wake idle workers after a submit"""
+        self._wake.set()
+
+    def stop(self) -> None:
+        """Let workers finish their current job, then terminate stragglers (their jobs are requeued on restart)"""
+        self._stop.set()
+        self._wake.set()
+        deadline = time.monotonic() + self.shutdown_grace
+        for process in self._workers:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.terminate()
+        self._workers = []
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.processes,
+            "alive": sum(1 for p in self._workers if p.is_alive()),
+            "jobs": self.queue.counts(),
+        }
+
+    def _spawn(self) -> multiprocessing.Process:
+        process = self._context.Process(target=self._run, name="job-worker", daemon=True)
+        process.start()
+        return process
+
+    def _supervise(self) -> None:
+        last_purge = 0.0
+        while not self._stop.wait(max(self.poll_interval * 4, 1.0)):
+            for index, process in enumerate(self._workers):
+                if process.is_alive() or self._stop.is_set():
+                    continue
+                logger.warning(f"Job worker {process.pid} exited with {process.exitcode}; restarting")
+                self.queue.requeue_dead(_pid_alive)
+                JOB_WORKER_RESTARTS.inc()
+                self._workers[index] = self._spawn()
+            for kind, statuses in self.queue.counts().items():
+                for status in ("queued", "running", "succeeded", "failed"):
+                    JOBS.set(statuses.get(status, 0), kind, status)
+            if time.monotonic() - last_purge > 3600:
+                self.queue.purge(max(self.queue.result_ttl, 86400.0))
+                last_purge = time.monotonic()
+
+    def _run(self) -> None:
+        # Ctrl-C goes to the service, which stops the workers
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        if self.initializer is not None:
+            self.initializer()
+        owner = worker_id()
+        parent = os.getppid()
+        loop = None
+        # Webhooks are sent by another thread: a slow or failing endpoint must not hold up the next job
+        webhooks: SimpleQueue = SimpleQueue()
+        sender = threading.Thread(target=self._send_webhooks, args=(webhooks,), name="job-webhooks", daemon=True)
+        sender.start()
+        # Exit with the service, even if it was killed without stopping the pool
+        while not self._stop.is_set() and os.getppid() == parent:
+            job = self.queue.claim(owner, self.handlers)
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            handler = self.handlers[job["kind"]]
+            started = time.perf_counter()
+            try:
+                if asyncio.iscoroutinefunction(handler):
+                    # One loop per worker so async clients keep their connection pools
+                    loop = loop or asyncio.new_event_loop()
+                    result = loop.run_until_complete(handler(job["payload"]))
+                else:
+                    result = handler(job["payload"])
+            except JobFailed as e:
+                finished = self.queue.fail(job["id"], owner, str(e), retry=False)
+            except Exception as e:
+                logger.error(f"Job {job['id']} ({job['kind']}) attempt {job['attempts']} failed: {e}")
+                finished = self.queue.fail(job["id"], owner, str(e))
+            else:
+                finished = self.queue.complete(job["id"], owner, result)
+            logger.info(f"Job {job['id']} ({job['kind']}) -> {finished and finished['status']} in {time.perf_counter() - started:.2f}s")
+            if finished is not None and finished["status"] in FINISHED and finished["callbacks"]:
+                body = self.render(finished) if self.render is not None else finished
+                webhooks.put((job["id"], finished["callbacks"], body))
+        # Send the webhooks still pending before exiting
+        webhooks.put(None)
+        sender.join()
+
+    def _send_webhooks(self, pending: SimpleQueue) -> None:
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            job_id, urls, body = item
+            try:
+                status = deliver_webhooks(urls, body)
+            except Exception as e:
+                logger.error(f"Webhooks of job {job_id} failed: {e}")
+                status = f"failed: {e}"
+            self.queue.set_webhook_status(job_id, status)
@@ -0,0 +1,253 @@
+# shared/jsonstream.py
+
+"""
+Incremental, schema-validated JSON parsing for LLM completions.
+
+ArrayItemExtractor is fed completion text chunk by chunk and returns each
+element of one target array as soon as that element is complete, so callers
+can forward results before the whole completion has arrived.
+
+SchemaStreamParser adds validation against the expected Pydantic model (v2
+models, or v1 models such as uagents.Model) while the text streams in. It
+raises StreamValidationError as soon as the output can no longer be valid:
+- too much prose before the JSON value starts, or the wrong root type
+- a top-level field whose value starts with the wrong JSON type
+- a completed array element that fails its item schema
+Callers close the upstream stream on that error instead of paying for the
+rest of a completion that would be thrown away.
+"""
+
+import json
+from typing import Any, Iterable, List, Optional, Tuple, Union, get_args, get_origin
+
+_WHITESPACE = " \t\r\n"
+
+
+class StreamValidationError(ValueError):
+    """The streamed output cannot (or did not) match the expected schema"""
+
+
+class _Frame:
+    __slots__ = ("kind", "path", "start", "key", "expect_key", "expect_value")
+
+    def __init__(self, kind: str, path: Tuple[str, ...], start: int):
+        self.kind = kind  # "obj" or "arr"
+        self.path = path
+        self.start = start
+        self.key: Optional[str] = None
+        self.expect_key = kind == "obj"
+        self.expect_value = False
+
+
+class ArrayItemExtractor:
+    """
+    Emit complete object/array elements of the array found at `path`.
+
+    `path` is the sequence of object keys leading to the array, e.g. () for a
+    top-level array or ("detailedResults",) for {"detailedResults": [...]}.
+    Text before the root value (such as a ```json fence) and after it is ignored.
+    """
+
+    def __init__(self, path: Tuple[str, ...] = ()):
+        self.path = tuple(path)
+        self.buffer = ""
+        self.done = False
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._root_span: Optional[Tuple[int, int]] = None
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Append a chunk and return the target-array elements completed by it"""
+        self.buffer += chunk
+        buf = self.buffer
+        stack = self._stack
+        items = []
+        i = self._pos
+        end = len(buf)
+        while i < end and not self.done:
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    top = stack[-1]
+                    if top.kind == "obj" and top.expect_key:
+                        top.key = json.loads(buf[self._string_start:i + 1])
+                i += 1
+                continue
+            if not stack:
+                if ch in "{[":
+                    self._on_root_start(ch)
+                    stack.append(_Frame("obj" if ch == "{" else "arr", (), i))
+                else:
+                    self._on_preamble(i)
+                i += 1
+                continue
+            top = stack[-1]
+            if top.expect_value and ch not in _WHITESPACE:
+                top.expect_value = False
+                self._on_value_start(top, ch)
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                path = top.path + ((top.key or "",) if top.kind == "obj" else ("*",))
+                stack.append(_Frame("obj" if ch == "{" else "arr", path, i))
+            elif ch in "}]":
+                frame = stack.pop()
+                if not stack:
+                    self._root_span = (frame.start, i + 1)
+                    self.done = True
+                elif stack[-1].kind == "arr" and stack[-1].path == self.path:
+                    items.append(self._on_item(json.loads(buf[frame.start:i + 1])))
+            elif ch == ":":
+                top.expect_key = False
+                top.expect_value = True
+            elif ch == "," and top.kind == "obj":
+                top.expect_key = True
+            i += 1
+        self._pos = i
+        return items
+
+    def result(self) -> Any:
+        """Parse the complete root value; raises ValueError if the stream ended early"""
+        if self._root_span is None:
+            raise StreamValidationError("Incomplete JSON in streamed response")
+        start, stop = self._root_span
+        return json.loads(self.buffer[start:stop])
+
+    # --- Hooks for subclasses ---
+
+    def _on_root_start(self, ch: str) -> None:
+        pass
+
+    def _on_preamble(self, index: int) -> None:
+        pass
+
+    def _on_value_start(self, frame: _Frame, ch: str) -> None:
+        pass
+
+    def _on_item(self, item: Any) -> Any:
+        return item
+
+
+def validate_model(schema, data: Any):
+    """Validate data against a Pydantic v2 model or a v1 model (uagents.Model)"""
+    try:
+        if hasattr(schema, "model_validate"):
+            return schema.model_validate(data)
+        return schema.parse_obj(data)
+    except (ValueError, TypeError) as e:
+        raise StreamValidationError(f"Output does not match {schema.__name__}: {e}") from e
+
+
+def _field_annotations(schema) -> dict:
+    if hasattr(schema, "model_fields"):
+        return {name: field.annotation for name, field in schema.model_fields.items()}
+    return {name: field.outer_type_ for name, field in schema.__fields__.items()}
+
+
+def _allowed_starts(annotation) -> Optional[str]:
+    """First characters a JSON value of this type can start with (None = anything)"""
+    origin = get_origin(annotation)
+    if origin is Union:
+        parts = [_allowed_starts(a) for a in get_args(annotation)]
+        return None if any(p is None for p in parts) else "".join(parts)
+    if annotation is type(None):
+        return "n"
+    if annotation is list or origin is list:
+        return "["
+    if annotation is dict or origin is dict or hasattr(annotation, "__fields__") or hasattr(annotation, "model_fields"):
+        return "{"
+    if annotation is str:
+        return '"'
+    # Numbers and booleans may arrive quoted; lax validation coerces them later
+    if annotation in (int, float):
+        return '-0123456789"'
+    if annotation is bool:
+        return 'tf"'
+    return None
+
+
+class SchemaStreamParser(ArrayItemExtractor):
+    """
+    Incrementally parse and validate a streamed completion.
+
+    schema:      model for the root object (optional for array roots)
+    item_schema: model every element of the array at `item_path` must satisfy;
+                 feed() returns the validated elements as they complete
+    root:        "object" or "array"
+    max_preamble: characters of non-JSON text tolerated before the root value
+    """
+
+    def __init__(
+        self,
+        schema=None,
+        item_schema=None,
+        item_path: Tuple[str, ...] = (),
+        root: str = "object",
+        max_preamble: int = 200,
+    ):
+        super().__init__(item_path)
+        self.schema = schema
+        self.item_schema = item_schema
+        self.root = root
+        self.max_preamble = max_preamble
+        self._field_starts = (
+            {name: _allowed_starts(a) for name, a in _field_annotations(schema).items()} if schema is not None else {}
+        )
+
+    def feed(self, chunk: str) -> List[Any]:
+        try:
+            return super().feed(chunk)
+        except json.JSONDecodeError as e:
+            raise StreamValidationError(f"Malformed JSON in response: {e}") from e
+
+    def finish(self) -> Any:
+        """Validate the complete output; returns the schema instance (or the parsed array)"""
+        try:
+            data = self.result()
+        except json.JSONDecodeError as e:
+            raise StreamValidationError(f"Malformed JSON in response: {e}") from e
+        return validate_model(self.schema, data) if self.schema is not None else data
+
+    def _on_root_start(self, ch: str) -> None:
+        expected = "{" if self.root == "object" else "["
+        if ch != expected:
+            raise StreamValidationError(f"Expected a JSON {self.root}, got '{ch}'")
+
+    def _on_preamble(self, index: int) -> None:
+        if index >= self.max_preamble:
+            raise StreamValidationError("No JSON value found at the start of the response")
+
+    def _on_value_start(self, frame: _Frame, ch: str) -> None:
+        if len(self._stack) != 1 or frame.key not in self._field_starts:
+            return
+        allowed = self._field_starts[frame.key]
+        if allowed is not None and ch not in allowed:
+            raise StreamValidationError(f"Field '{frame.key}' has the wrong JSON type (starts with '{ch}')")
+
+    def _on_item(self, item: Any) -> Any:
+        return validate_model(self.item_schema, item) if self.item_schema is not None else item
+
+
+def parse_completion(text: str, schema=None, item_schema=None, item_path: Tuple[str, ...] = (), root: str = "object"):
+    """Validate a complete (non-streamed) completion with the same rules as the streaming parser"""
+    parser = SchemaStreamParser(schema, item_schema, item_path, root)
+    parser.feed(text)
+    return parser.finish()
+
+
+def collect_validated(chunks: Iterable[str], parser: SchemaStreamParser):
+    """Feed text chunks to the parser, stopping at the first validation error; returns parser.finish()"""
+    for chunk in chunks:
+        parser.feed(chunk)
+        if parser.done:
+            break
+    return parser.finish()
@@ -0,0 +1,575 @@
+# shared/llm_gateway.py
+
+"""
+Shared gateway for upstream LLM calls (OpenAI and ASI:One, both OpenAI-compatible).
+
+Every chat completion goes through:
+1. A circuit breaker per model that fails fast while upstream is degraded.
+2. Request (RPM) and token (TPM) token buckets per model. Callers wait for
+   capacity instead of hitting 429s, so sustained overload turns into latency.
+3. Retries with exponential backoff and full jitter on 429, 5xx, timeouts and
+   connection errors, honouring Retry-After.
+4. A deadline covering all of the above: rate-limit waits, backoff sleeps and
+   per-attempt timeouts never exceed the time left.
+
+complete_validated() streams the completion through a SchemaStreamParser and
+closes the stream as soon as the output can no longer match the schema.
+
+Both the sync client (agents, called from worker threads) and the async client
+(screening-service) are supported. stats() reports queue depth (callers waiting
+for rate-limit capacity), in-flight calls and per-model counters; the same
+signals plus per-attempt latency and token usage are exported to shared.metrics.
+model_health() gives rolling p95 latency and error rate per model for routing.
+
+With a shared StateStore (SHARED_STATE_PATH), the RPM/TPM buckets live in it,
+so several worker processes together stay within one upstream limit; the async
+client updates them from a worker thread. Without
+one, from_env(processes=N) gives each of N processes an equal share of the
+limits instead. Circuit breakers and latency windows stay per process.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Optional
+
+from .jsonstream import StreamValidationError
+from .state import StateStore
+from .metrics import (
+    LLM_ERROR_RATE,
+    LLM_IN_FLIGHT,
+    LLM_INVALID_OUTPUTS,
+    LLM_P95_SECONDS,
+    LLM_QUEUE_DEPTH,
+    LLM_SECONDS,
+    LLM_TOKENS,
+    record_span,
+)
+
+logger = logging.getLogger("LLMGateway")
+
+# Rough token estimate (~4 characters per token) used to reserve TPM capacity before a call
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=None)
+def retryable_errors() -> tuple:
+    """openai errors worth retrying; imported on first use to keep `openai` off the startup path"""
+    import openai
+
+    return (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)
+
+
+class LLMUnavailableError(RuntimeError):
+    """Upstream cannot serve the call in time; callers should surface a 503, not a result"""
+
+
+class CircuitOpenError(LLMUnavailableError):
+    pass
+
+
+class DeadlineExceededError(LLMUnavailableError):
+    pass
+
+
+@dataclass
+class ModelLimits:
+    rpm: float
+    tpm: float
+
+
+DEFAULT_LIMITS = {
+    "gpt-4": ModelLimits(rpm=500, tpm=40_000),
+    "gpt-4o-mini": ModelLimits(rpm=500, tpm=200_000),
+    "asi1-mini": ModelLimits(rpm=600, tpm=200_000),
+}
+
+
+def limits_from_env(defaults: Optional[Dict[str, ModelLimits]] = None, share: float = 1.0) -> Dict[str, ModelLimits]:
+    """
+    Read per-model limits from LLM_RATE_LIMITS, e.g. "gpt-4=500:40000,asi1-mini=600:200000" (rpm:tpm).
+    `share` scales every limit, for a process that gets only part of the quota.
+    """
+    limits = dict(defaults or DEFAULT_LIMITS)
+    for spec in filter(None, (s.strip() for s in os.getenv("LLM_RATE_LIMITS", "").split(","))):
+        model, _, values = spec.partition("=")
+        rpm, _, tpm = values.partition(":")
+        limits[model.strip()] = ModelLimits(rpm=float(rpm), tpm=float(tpm))
+    return {model: ModelLimits(rpm=l.rpm * share, tpm=l.tpm * share) for model, l in limits.items()}
+
+
+class TokenBucket:
+    """
+    Token bucket that lets callers reserve capacity ahead of time.
+    reserve() debits immediately (the level may go negative) and returns how long
+    the caller must wait before its reservation is covered, which keeps waiters FIFO.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._level -= min(amount, self.capacity)
+            return 0.0 if self._level >= 0 else -self._level / self.rate
+
+    def adjust(self, amount: float) -> None:
+        """Return (positive) or take (negative) capacity after the actual cost is known"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._level = min(self.capacity, self._level + amount)
+
+
+class SharedTokenBucket:
+    """TokenBucket whose level lives in a StateStore, so every process on the host draws from one bucket"""
+
+    def __init__(self, store: StateStore, name: str, rate_per_minute: float, capacity: Optional[float] = None):
+        self.store = store
+        self.name = name
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+
+    def _change(self, amount: float) -> float:
+        """Refill, add `amount` (negative to take capacity) and return the new level"""
+        def apply(current: Optional[dict]) -> dict:
+            now = time.time()
+            level = self.capacity
+            if current is not None:
+                level = min(self.capacity, current["level"] + (now - current["updated"]) * self.rate)
+            return {"level": min(self.capacity, level + amount), "updated": now}
+
+        return self.store.update("token-buckets", self.name, apply)["level"]
+
+    def reserve(self, amount: float) -> float:
+        level = self._change(-min(amount, self.capacity))
+        return 0.0 if level >= 0 else -level / self.rate
+
+    def adjust(self, amount: float) -> None:
+        """Return (positive) or take (negative) capacity after the actual cost is known"""
+        self._change(amount)
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, fails fast for `cooldown` seconds, then lets one probe through"""
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self.state == "closed":
+                return
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = "half-open"
+            if self.state == "half-open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            raise CircuitOpenError("Upstream LLM is degraded; failing fast until it recovers")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self.state == "half-open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning(f"Circuit opened after {self._failures} consecutive failures")
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class LatencyWindow:
+    """Rolling window of recent attempts (latency, success) for p95 and error-rate estimates"""
+
+    def __init__(self, window_seconds: float = 300.0, max_samples: int = 256):
+        self.window_seconds = window_seconds
+        self._samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool) -> None:
+        with self._lock:
+            self._samples.append((time.monotonic(), latency, ok))
+
+    def snapshot(self) -> dict:
+        """{"samples", "p95" (seconds, successful attempts only), "error_rate"} over the window"""
+        cutoff = time.monotonic() - self.window_seconds
+        with self._lock:
+            while self._samples and self._samples[0][0] < cutoff:
+                self._samples.popleft()
+            samples = list(self._samples)
+        latencies = sorted(latency for _, latency, ok in samples if ok)
+        failures = sum(1 for _, _, ok in samples if not ok)
+        return {
+            "samples": len(samples),
+            "p95": latencies[max(0, -(-len(latencies) * 95 // 100) - 1)] if latencies else None,
+            "error_rate": failures / len(samples) if samples else 0.0,
+        }
+
+
+class _ModelState:
+    def __init__(self, model: str, limits: ModelLimits, breaker: CircuitBreaker, window_seconds: float, store: Optional[StateStore] = None):
+        self.model = model
+        self.window = LatencyWindow(window_seconds)
+        if store is not None:
+            self.requests = SharedTokenBucket(store, f"{model}:rpm", limits.rpm)
+            self.tokens = SharedTokenBucket(store, f"{model}:tpm", limits.tpm)
+        else:
+            self.requests = TokenBucket(limits.rpm)
+            self.tokens = TokenBucket(limits.tpm)
+        self.breaker = breaker
+        self.counters = {"calls": 0, "retries": 0, "failures": 0, "rejected": 0, "invalid_outputs": 0, "tokens": 0}
+
+
+class LLMGateway:
+    def __init__(
+        self,
+        client,
+        limits: Optional[Dict[str, ModelLimits]] = None,
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 20.0,
+        attempt_timeout: float = 60.0,
+        deadline: float = 120.0,
+        failure_threshold: int = 5,
+        cooldown: float = 30.0,
+        latency_window: float = 300.0,
+        state: Optional[StateStore] = None,
+    ):
+        self.client = client
+        self.limits = limits if limits is not None else limits_from_env()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self._failure_threshold = failure_threshold
+        self._cooldown = cooldown
+        self._latency_window = latency_window
+        # Shared rate-limit buckets across processes; None keeps them in this process
+        self._state_store = state
+        self._models: Dict[str, _ModelState] = {}
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._in_flight = 0
+
+    @classmethod
+    def from_env(cls, client, processes: int = 1, **overrides) -> "LLMGateway":
+        """
+        Build a gateway configured from LLM_* environment variables; keyword arguments take precedence.
+        `processes` is how many processes (e.g. a service and its job workers) draw on the same quota;
+        without SHARED_STATE_PATH each of them gets 1/processes of LLM_RATE_LIMITS.
+        """
+        shared = bool(os.getenv("SHARED_STATE_PATH"))
+        settings = {
+            "limits": limits_from_env(share=1.0 if shared else 1.0 / max(processes, 1)),
+            "max_retries": int(os.getenv("LLM_MAX_RETRIES", "4")),
+            "attempt_timeout": float(os.getenv("LLM_ATTEMPT_TIMEOUT", "60")),
+            "deadline": float(os.getenv("LLM_DEADLINE", "120")),
+            "failure_threshold": int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+            "cooldown": float(os.getenv("LLM_BREAKER_COOLDOWN", "30")),
+            "latency_window": float(os.getenv("LLM_LATENCY_WINDOW", "300")),
+            "state": StateStore(os.environ["SHARED_STATE_PATH"]) if shared else None,
+        }
+        settings.update(overrides)
+        return cls(client, **settings)
+
+    # --- Public API ---
+
+    def complete(self, deadline: Optional[float] = None, **kwargs):
+        """
+        Synchronous chat completion through the gateway (for worker threads).
+        `deadline` is an absolute time.monotonic() value; defaults to now + the gateway deadline.
+        """
+        deadline = deadline or time.monotonic() + self.deadline
+        state = self._state(kwargs["model"])
+        for attempt in range(self.max_retries + 1):
+            estimate = self._admit(state, kwargs, deadline)
+            try:
+                delay = self._reserve(state, estimate)
+            except BaseException:
+                state.breaker.release_probe()
+                raise
+            try:
+                self._wait(delay, deadline, time.sleep)
+            except BaseException:
+                # Given up (deadline) or interrupted before the call: the reservation goes back
+                state.breaker.release_probe()
+                self._release(state, estimate)
+                raise
+            self._track(+1)
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                response = self.client.chat.completions.create(timeout=self._attempt_timeout(deadline), **kwargs)
+            except retryable_errors() as e:
+                outcome = "retryable_error"
+                error = e
+            except BaseException:
+                self._on_error(state, estimate)
+                raise
+            else:
+                outcome = "success"
+                return self._on_success(state, response, estimate)
+            finally:
+                self._track(-1)
+                self._observe_attempt(kwargs["model"], outcome, started)
+            self._wait(self._on_retryable(state, error, attempt, deadline, estimate), deadline, time.sleep)
+        raise AssertionError("unreachable")
+
+    async def acomplete(self, deadline: Optional[float] = None, **kwargs):
+        """Async chat completion through the gateway; with stream=True, retries cover opening the stream"""
+        deadline = deadline or time.monotonic() + self.deadline
+        state = self._state(kwargs["model"])
+        for attempt in range(self.max_retries + 1):
+            estimate = self._admit(state, kwargs, deadline)
+            try:
+                delay = await self._offload(self._reserve, state, estimate)
+            except BaseException:
+                state.breaker.release_probe()
+                raise
+            try:
+                await self._await(delay, deadline)
+            except BaseException:
+                # Given up (deadline) or cancelled before the call: the reservation goes back
+                state.breaker.release_probe()
+                await self._offload(self._release, state, estimate)
+                raise
+            self._track(+1)
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                response = await self.client.chat.completions.create(timeout=self._attempt_timeout(deadline), **kwargs)
+            except retryable_errors() as e:
+                outcome = "retryable_error"
+                error = e
+            except BaseException:
+                await self._offload(self._on_error, state, estimate)
+                raise
+            else:
+                outcome = "success"
+                return await self._offload(self._on_success, state, response, estimate)
+            finally:
+                self._track(-1)
+                self._observe_attempt(kwargs["model"], outcome, started)
+            await self._await(await self._offload(self._on_retryable, state, error, attempt, deadline, estimate), deadline)
+        raise AssertionError("unreachable")
+
+    def complete_validated(self, parser_factory, parse_retries: int = 1, deadline: Optional[float] = None, **kwargs):
+        """
+        Stream a completion into parser_factory() and return parser.finish().
+        The stream is closed as soon as the parser raises StreamValidationError and
+        the call is retried (up to parse_retries times) instead of reading the rest.
+        """
+        deadline = deadline or time.monotonic() + self.deadline
+        for attempt in range(parse_retries + 1):
+            parser = parser_factory()
+            parse_seconds = stream_seconds = 0.0
+            stream = self.complete(deadline=deadline, stream=True, **kwargs)
+            try:
+                started = time.perf_counter()
+                for chunk in stream:
+                    received = time.perf_counter()
+                    stream_seconds += received - started
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        parser.feed(chunk.choices[0].delta.content)
+                    started = time.perf_counter()
+                    parse_seconds += started - received
+                    if parser.done:
+                        break
+                return parser.finish()
+            except StreamValidationError as e:
+                self.record_invalid_output(kwargs["model"])
+                if attempt >= parse_retries:
+                    raise
+                logger.warning(f"Discarding invalid LLM output after {len(parser.buffer)} chars: {e}")
+            finally:
+                stream.close()
+                record_span("stream", stream_seconds)
+                record_span("parse", parse_seconds)
+        raise AssertionError("unreachable")
+
+    def record_invalid_output(self, model: str) -> None:
+        """Count a completion that was discarded because it failed schema validation"""
+        self._state(model).counters["invalid_outputs"] += 1
+        LLM_INVALID_OUTPUTS.inc(1, model)
+
+    def model_health(self, model: str) -> dict:
+        """Rolling p95 latency (seconds), error rate, sample count and circuit state of one model"""
+        state = self._state(model)
+        health = {**state.window.snapshot(), "circuit": state.breaker.state}
+        if health["p95"] is not None:
+            LLM_P95_SECONDS.set(health["p95"], model)
+        LLM_ERROR_RATE.set(health["error_rate"], model)
+        return health
+
+    def queue_depth(self) -> int:
+        """Callers currently waiting for rate-limit capacity or a retry backoff"""
+        return self._waiting
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._waiting,
+            "in_flight": self._in_flight,
+            "models": {
+                model: {**state.counters, **state.window.snapshot(), "circuit": state.breaker.state}
+                for model, state in self._models.items()
+            },
+        }
+
+    # --- Internals ---
+
+    def _state(self, model: str) -> _ModelState:
+        with self._lock:
+            state = self._models.get(model)
+            if state is None:
+                limits = self.limits.get(model) or ModelLimits(rpm=60, tpm=40_000)
+                state = _ModelState(
+                    model, limits, CircuitBreaker(self._failure_threshold, self._cooldown), self._latency_window, self._state_store
+                )
+                self._models[model] = state
+            return state
+
+    def _admit(self, state: _ModelState, kwargs: dict, deadline: float) -> int:
+        if time.monotonic() >= deadline:
+            raise DeadlineExceededError("Deadline exceeded before the LLM call could start")
+        try:
+            state.breaker.before_call()
+        except CircuitOpenError:
+            state.counters["rejected"] += 1
+            raise
+        prompt_chars = sum(len(str(m.get("content", ""))) for m in kwargs.get("messages", []))
+        return prompt_chars // CHARS_PER_TOKEN + kwargs.get("max_tokens", 1024)
+
+    def _reserve(self, state: _ModelState, estimate: int) -> float:
+        return max(state.requests.reserve(1), state.tokens.reserve(estimate))
+
+    def _release(self, state: _ModelState, estimate: int) -> None:
+        """Return a reservation whose call never started, so abandoned waits do not leave the buckets in debt"""
+        state.requests.adjust(1)
+        state.tokens.adjust(estimate)
+
+    async def _offload(self, fn, *args):
+        # Shared buckets are SQLite transactions (BEGIN IMMEDIATE can wait on other processes); keep them off the event loop
+        if self._state_store is None:
+            return fn(*args)
+        return await asyncio.to_thread(fn, *args)
+
+    def _attempt_timeout(self, deadline: float) -> float:
+        return max(0.1, min(self.attempt_timeout, deadline - time.monotonic()))
+
+    def _on_retryable(self, state: _ModelState, error: Exception, attempt: int, deadline: float, estimate: int) -> float:
+        state.breaker.record_failure()
+        state.counters["failures"] += 1
+        state.tokens.adjust(estimate)
+        if attempt >= self.max_retries:
+            raise error
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        if time.monotonic() + delay >= deadline:
+            raise DeadlineExceededError(f"Deadline exceeded while retrying upstream error: {error}") from error
+        state.counters["retries"] += 1
+        logger.warning(f"Retrying LLM call in {delay:.2f}s after {type(error).__name__} (attempt {attempt + 1})")
+        return delay
+
+    def _on_error(self, state: _ModelState, estimate: int) -> None:
+        # Non-retryable errors (4xx, cancellation) say nothing about upstream health
+        state.breaker.release_probe()
+        state.counters["failures"] += 1
+        state.tokens.adjust(estimate)
+
+    def _on_success(self, state: _ModelState, response, estimate: int):
+        state.breaker.record_success()
+        state.counters["calls"] += 1
+        usage = getattr(response, "usage", None)
+        if usage is not None and getattr(usage, "total_tokens", None):
+            state.counters["tokens"] += usage.total_tokens
+            state.tokens.adjust(estimate - usage.total_tokens)
+            LLM_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, state.model, "prompt")
+            LLM_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, state.model, "completion")
+        return response
+
+    def _observe_attempt(self, model: str, outcome: str, started: float) -> None:
+        elapsed = time.perf_counter() - started
+        LLM_SECONDS.observe(elapsed, model, outcome)
+        record_span("upstream", elapsed)
+        # Client errors and cancellations say nothing about upstream latency or health
+        if outcome != "error":
+            self._state(model).window.record(elapsed, outcome == "success")
+
+    def _check_wait(self, delay: float, deadline: float) -> None:
+        if delay > 0 and time.monotonic() + delay >= deadline:
+            raise DeadlineExceededError("Deadline exceeded waiting for LLM rate-limit capacity")
+
+    def _wait(self, delay: float, deadline: float, sleep) -> None:
+        self._check_wait(delay, deadline)
+        if delay > 0:
+            self._track_waiting(+1)
+            started = time.perf_counter()
+            try:
+                sleep(delay)
+            finally:
+                self._track_waiting(-1)
+                record_span("llm_wait", time.perf_counter() - started)
+
+    async def _await(self, delay: float, deadline: float) -> None:
+        self._check_wait(delay, deadline)
+        if delay > 0:
+            self._track_waiting(+1)
+            started = time.perf_counter()
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                self._track_waiting(-1)
+                record_span("llm_wait", time.perf_counter() - started)
+
+    def _track(self, delta: int) -> None:
+        with self._lock:
+            self._in_flight += delta
+            LLM_IN_FLIGHT.set(self._in_flight)
+
+    def _track_waiting(self, delta: int) -> None:
+        with self._lock:
+            self._waiting += delta
+            LLM_QUEUE_DEPTH.set(self._waiting)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
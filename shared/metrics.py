@@ -0,0 +1,344 @@
+# shared/metrics.py
+
+"""
+Dependency-free Prometheus metrics and per-request phase tracing.
+
+Metrics live in one process-wide REGISTRY and are rendered in the Prometheus
+text exposition format. Recording is a dict lookup and an addition under a
+per-metric lock, so instrumenting hot paths costs microseconds.
+
+span("upstream") and record_span() time request phases. Every phase feeds the
+phase_duration_seconds histogram; when a trace is active for the current
+request (see start_trace), the phase is also added to that trace so one slow
+request can be broken down into queueing, rate-limit waits, upstream latency
+and parsing.
+"""
+
+import contextvars
+import functools
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("Metrics")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; LLM calls sit in the upper buckets, parsing and local grading in the lower ones
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Prompt sizes in tokens
+TOKEN_BUCKETS = (0, 50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000)
+
+# Attach a trace to every request (otherwise only to requests sending an X-Trace header)
+TRACE_REQUESTS = os.getenv("TRACE_REQUESTS", "0") == "1"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _labels(self, values: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{n}="{_escape(v)}"' for n, v in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{self._labels(k)} {_format_value(v)}" for k, v in values]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, *labels: str) -> None:
+        self.inc(-amount, *labels)
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, *labels: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = [(k, list(counts), total) for k, (counts, total) in self._values.items()]
+        lines = []
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                bucket_labels = self._labels(labels, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{self._labels(labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, documentation: str, labelnames: Sequence[str], **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "Request latency by endpoint (until response headers for streams)",
+    ("endpoint", "method", "status"),
+)
+REQUESTS_IN_FLIGHT = REGISTRY.gauge("http_requests_in_flight", "Requests currently being handled", ("endpoint",))
+LLM_SECONDS = REGISTRY.histogram(
+    "llm_request_duration_seconds", "Upstream LLM call latency per attempt (time to first byte for streams)",
+    ("model", "outcome"),
+)
+LLM_TOKENS = REGISTRY.counter("llm_tokens_total", "Tokens reported by upstream usage", ("model", "kind"))
+LLM_INVALID_OUTPUTS = REGISTRY.counter("llm_invalid_outputs_total", "Completions discarded for failing schema validation", ("model",))
+LLM_QUEUE_DEPTH = REGISTRY.gauge("llm_queue_depth", "Callers waiting for rate-limit capacity or a retry backoff")
+LLM_IN_FLIGHT = REGISTRY.gauge("llm_in_flight", "Upstream LLM calls in flight")
+LLM_P95_SECONDS = REGISTRY.gauge("llm_model_p95_seconds", "Rolling p95 upstream latency per model", ("model",))
+LLM_ERROR_RATE = REGISTRY.gauge("llm_model_error_rate", "Rolling share of failed upstream attempts per model", ("model",))
+LLM_ROUTE_DECISIONS = REGISTRY.counter(
+    "llm_route_decisions_total", "Model chosen per call type and why", ("call_type", "model", "reason")
+)
+UPSTREAM_HEALTHY = REGISTRY.gauge("upstream_healthy", "1 if the last background upstream probe succeeded")
+UPSTREAM_PROBE_SECONDS = REGISTRY.histogram("upstream_probe_duration_seconds", "Background upstream probe latency")
+EXECUTOR_QUEUE_SECONDS = REGISTRY.histogram(
+    "executor_queue_wait_seconds", "Time work waited for a worker thread", ("pool",)
+)
+PHASE_SECONDS = REGISTRY.histogram("phase_duration_seconds", "Time spent per request phase", ("phase",))
+JOBS_SUBMITTED = REGISTRY.counter("jobs_submitted_total", "Jobs submitted, new or deduplicated", ("kind", "outcome"))
+JOBS = REGISTRY.gauge("jobs", "Jobs in the durable queue by status", ("kind", "status"))
+JOB_WORKER_RESTARTS = REGISTRY.counter("job_worker_restarts_total", "Job worker processes restarted after dying")
+SCREENING_SESSIONS = REGISTRY.counter(
+    "screening_sessions_total", "Adaptive screening sessions by outcome and whether they ended early", ("status", "ended")
+)
+SCREENING_SESSION_QUESTIONS_SKIPPED = REGISTRY.counter(
+    "screening_session_questions_skipped_total", "Questions left unasked because the session outcome was already settled"
+)
+QUALIFICATION_LOOKUPS = REGISTRY.counter(
+    "qualification_lookups_total", "Qualification fast-path lookups by outcome (hit: the annotator skipped the test)", ("outcome",)
+)
+QUALIFICATION_RECORDS = REGISTRY.counter(
+    "qualification_records_total",
+    "Graded screenings by whether they were kept for qualifications (unserved: client-supplied questions)",
+    ("outcome",),
+)
+PROMPT_TOKENS = REGISTRY.histogram(
+    "llm_prompt_tokens", "Locally counted input tokens per LLM prompt", ("call_type",), buckets=TOKEN_BUCKETS
+)
+PROMPT_TOKENS_SAVED = REGISTRY.histogram(
+    "llm_prompt_tokens_saved",
+    "Input tokens saved per LLM prompt by compact serialization and field caps, against the naive prompt",
+    ("call_type",),
+    buckets=TOKEN_BUCKETS,
+)
+PROMPT_FIELDS_TRUNCATED = REGISTRY.counter(
+    "llm_prompt_fields_truncated_total", "Prompt fields cut to fit a field cap or the input budget", ("call_type", "field")
+)
+STARTUP_READY_SECONDS = REGISTRY.gauge("startup_ready_seconds", "Seconds from process start until all warm-up steps finished")
+
+
+# --- Tracing ---
+
+class Trace:
+    __slots__ = ("spans",)
+
+    def __init__(self):
+        self.spans: List[Tuple[str, float]] = []
+
+    def server_timing(self) -> str:
+        """Phases as a Server-Timing header value (durations in milliseconds)"""
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.spans)
+
+    def summary(self) -> str:
+        return " ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in self.spans)
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+
+
+def start_trace() -> Tuple[Trace, contextvars.Token]:
+    trace = Trace()
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token: contextvars.Token) -> None:
+    _current_trace.reset(token)
+
+
+def record_span(phase: str, seconds: float) -> None:
+    PHASE_SECONDS.observe(seconds, phase)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.spans.append((phase, seconds))
+
+
+@contextmanager
+def span(phase: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(phase, time.perf_counter() - start)
+
+
+def queued(pool: str, fn, *args):
+    """
+    Wrap fn(*args) for an executor so the time it waits for a worker thread is
+    recorded; the caller's trace context is carried into the worker.
+    """
+    submitted = time.perf_counter()
+    context = contextvars.copy_context()
+
+    def run():
+        wait = time.perf_counter() - submitted
+        EXECUTOR_QUEUE_SECONDS.observe(wait, pool)
+        record_span("queue", wait)
+        return fn(*args)
+
+    return lambda: context.run(run)
+
+
+# --- uAgents integration ---
+
+def observe_handler(endpoint: str, method: str = "POST", trace_logger: Optional[logging.Logger] = None):
+    """
+    Decorator for uAgents REST handlers: latency histogram, in-flight gauge and,
+    with TRACE_REQUESTS=1, a per-request phase breakdown logged to trace_logger.
+    The status label is the response model's status field ("success"/"error").
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            REQUESTS_IN_FLIGHT.inc(1, endpoint)
+            trace, token = start_trace() if TRACE_REQUESTS else (None, None)
+            start = time.perf_counter()
+            status = "exception"
+            try:
+                result = await func(*args, **kwargs)
+                status = str(getattr(result, "status", "ok"))
+                return result
+            finally:
+                elapsed = time.perf_counter() - start
+                REQUEST_SECONDS.observe(elapsed, endpoint, method, status)
+                REQUESTS_IN_FLIGHT.dec(1, endpoint)
+                if token is not None:
+                    end_trace(token)
+                    (trace_logger or logger).info(f"trace {method} {endpoint} {elapsed * 1000:.1f}ms: {trace.summary()}")
+        return wrapper
+    return decorator
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> Optional[ThreadingHTTPServer]:
+    """
+    Serve GET /metrics on a background thread. uAgents REST endpoints can only
+    return JSON, so the agents expose the text format on this side port.
+    """
+    if not port:
+        return None
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = REGISTRY.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"Prometheus metrics at http://{host}:{port}/metrics")
+    return server
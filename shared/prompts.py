@@ -0,0 +1,285 @@
+# shared/prompts.py
+
+"""
+Token-budgeted prompt building with local token counting.
+
+A prompt is assembled from sections in the order they are added. Static
+sections (task description, criteria, response format) go first and are never
+cut, so every prompt of a call type starts with the same bytes and upstream
+prefix caching can reuse them; per-project content (instructions, rubric)
+comes next and per-request content (answers, outputs) last.
+
+Structured payloads are serialized as compact JSON (no indentation, null
+fields dropped, non-ASCII text unescaped). A variable field can have its own
+token cap, e.g. one annotator answer. If the prompt still does not fit the
+model's input budget, the largest fields are cut further, down to their
+minimum size. The budget is the context window (LLM_CONTEXT_WINDOWS) minus
+the system prompt and max_tokens. A cut field keeps its beginning and end
+around an "[... N tokens omitted ...]" marker. If the prompt cannot fit even
+then, PromptTooLargeError is raised before any upstream call is made.
+
+Tokens are counted with tiktoken when it is installed and its encoding can be
+loaded. Otherwise they are estimated from a pre-tokenizer that approximates
+cl100k_base and leans towards over-counting. Every build reports its token
+count and the tokens saved against the naive prompt (indented JSON, nothing
+cut) in the llm_prompt_tokens / llm_prompt_tokens_saved histograms.
+"""
+
+import functools
+import json
+import logging
+import math
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from .metrics import PROMPT_FIELDS_TRUNCATED, PROMPT_TOKENS, PROMPT_TOKENS_SAVED
+
+logger = logging.getLogger("Prompts")
+
+# Context window per model (tokens); override or add models with LLM_CONTEXT_WINDOWS
+DEFAULT_CONTEXT_WINDOWS = {"gpt-4": 8192, "gpt-4o-mini": 128000, "asi1-mini": 32000}
+UNKNOWN_MODEL_CONTEXT_WINDOW = 8192
+
+# Chat framing per message (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Approximates cl100k_base pre-tokenization: contractions, letter runs with their leading
+# space, digit groups of up to three, punctuation runs, underscores, whitespace
+_PIECE_RE = re.compile(r"'(?:s|t|re|ve|m|ll|d)| ?[^\W\d_]+|\d{1,3}| ?[^\s\w]+|_+|\s+", re.IGNORECASE)
+
+
+class PromptTooLargeError(ValueError):
+    """The prompt does not fit the model's input budget even with every field cut to its minimum"""
+
+
+def load_context_windows(defaults: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    """Read per-model context windows from LLM_CONTEXT_WINDOWS, e.g. "gpt-4=8192,asi1-mini=32000" """
+    windows = dict(defaults or DEFAULT_CONTEXT_WINDOWS)
+    for spec in filter(None, (s.strip() for s in os.getenv("LLM_CONTEXT_WINDOWS", "").split(","))):
+        model, _, tokens = spec.partition("=")
+        windows[model.strip()] = int(tokens)
+    return windows
+
+
+CONTEXT_WINDOWS = load_context_windows()
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model: str):
+    """tiktoken encoding for the model, or None (not installed, or its BPE file cannot be loaded)"""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken encoding for {model} unavailable, estimating tokens instead: {e}")
+        return None
+
+
+def _chars_per_token(piece: str) -> int:
+    if piece[-1].isalpha():
+        return 8 if piece.isascii() else 1
+    if piece[-1].isdigit():
+        return 3
+    if piece.isspace():
+        return 8
+    return 3
+
+
+def _approximate_tokens(text: str) -> List[str]:
+    tokens = []
+    for match in _PIECE_RE.finditer(text):
+        piece = match.group()
+        step = _chars_per_token(piece)
+        tokens.extend(piece[i:i + step] for i in range(0, len(piece), step))
+    return tokens
+
+
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return sum(
+        math.ceil(len(piece) / _chars_per_token(piece))
+        for piece in (match.group() for match in _PIECE_RE.finditer(text))
+    )
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str = "gpt-4") -> Tuple[str, int]:
+    """Cut text to about max_tokens (marker included), keeping its start and end; returns (text, tokens omitted)"""
+    encoding = _encoding(model)
+    tokens = encoding.encode(text, disallowed_special=()) if encoding is not None else _approximate_tokens(text)
+    if len(tokens) <= max_tokens:
+        return text, 0
+    keep = max(max_tokens - 12, 0)
+    head, tail = keep - keep // 3, keep // 3
+    omitted = len(tokens) - head - tail
+    if encoding is not None:
+        start, end = encoding.decode(tokens[:head]), encoding.decode(tokens[len(tokens) - tail:])
+    else:
+        start, end = "".join(tokens[:head]), "".join(tokens[len(tokens) - tail:])
+    return f"{start.rstrip()} [... {omitted} tokens omitted ...] {end.lstrip()}", omitted
+
+
+def _drop_none(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _drop_none(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [_drop_none(v) for v in value]
+    return value
+
+
+def compact_json(value: Any) -> str:
+    return json.dumps(_drop_none(value), separators=(",", ":"), ensure_ascii=False)
+
+
+@dataclass
+class _Field:
+    name: str
+    text: str
+    tokens: int
+    cap: int
+    min_tokens: int
+    rendered: str = ""
+    rendered_cap: int = -1
+    omitted: int = 0
+
+    def render(self, model: str) -> str:
+        if self.cap != self.rendered_cap:
+            self.rendered, self.omitted = truncate_tokens(self.text, self.cap, model) if self.cap < self.tokens else (self.text, 0)
+            self.rendered_cap = self.cap
+        return self.rendered
+
+
+@dataclass
+class BuiltPrompt:
+    text: str
+    tokens: int
+    budget: int
+    saved_tokens: int  # against the naive prompt: indented JSON, no field cut
+    truncated: Dict[str, int] = field(default_factory=dict)  # field name -> fields cut
+
+
+class PromptBuilder:
+    """
+    Sections are rendered in the order they are added, separated by blank lines.
+    `static` text is never cut; `text` and `json` sections hold the fields that may be.
+    """
+
+    def __init__(self, call_type: str, model: str, max_output_tokens: int, system: str = ""):
+        self.call_type = call_type
+        self.model = model
+        window = CONTEXT_WINDOWS.get(model, UNKNOWN_MODEL_CONTEXT_WINDOW)
+        self.budget = window - max_output_tokens - count_tokens(system, model) - 2 * MESSAGE_OVERHEAD_TOKENS
+        self._sections: List[Tuple[str, Any]] = []
+        self._fields: List[_Field] = []
+
+    def static(self, text: str) -> "PromptBuilder":
+        self._sections.append(("static", text))
+        return self
+
+    def text(self, heading: str, value: str, name: str, max_tokens: Optional[int] = None, min_tokens: int = 64) -> "PromptBuilder":
+        self._sections.append(("text", (heading, self._field(name, value, max_tokens, min_tokens))))
+        return self
+
+    def json(self, heading: str, value: Any, truncate: Optional[Dict[str, Optional[int]]] = None, min_tokens: int = 32) -> "PromptBuilder":
+        """
+        A JSON payload of dicts and lists. String values under the keys in `truncate`, at any depth,
+        may be cut, each to at most its cap (None: only as far as the budget requires).
+        """
+        truncate = truncate or {}
+
+        def fields_of(item):
+            if isinstance(item, list):
+                return [fields_of(v) for v in item]
+            if not isinstance(item, dict):
+                return item
+            return {
+                key: self._field(key, v, truncate[key], min_tokens) if key in truncate and isinstance(v, str) else fields_of(v)
+                for key, v in item.items()
+            }
+
+        self._sections.append(("json", (heading, fields_of(value))))
+        return self
+
+    def build(self) -> BuiltPrompt:
+        naive = count_tokens(self._render(naive=True), self.model)
+        for _ in range(4):
+            text = self._render()
+            tokens = count_tokens(text, self.model)
+            if tokens <= self.budget:
+                break
+            if not self._shrink(tokens - self.budget):
+                break
+        if tokens > self.budget:
+            raise PromptTooLargeError(
+                f"{self.call_type} prompt needs {tokens} tokens, over the {self.budget}-token input budget of {self.model}"
+            )
+
+        truncated: Dict[str, int] = {}
+        for f in self._fields:
+            if f.omitted:
+                truncated[f.name] = truncated.get(f.name, 0) + 1
+        saved = max(naive - tokens, 0)
+        PROMPT_TOKENS.observe(tokens, self.call_type)
+        PROMPT_TOKENS_SAVED.observe(saved, self.call_type)
+        for name, count in truncated.items():
+            PROMPT_FIELDS_TRUNCATED.inc(count, self.call_type, name)
+        if truncated:
+            logger.info(f"{self.call_type} prompt cut to {tokens} tokens ({saved} saved); fields cut: {truncated}")
+        return BuiltPrompt(text, tokens, self.budget, saved, truncated)
+
+    # --- Internals ---
+
+    def _field(self, name: str, value: str, max_tokens: Optional[int], min_tokens: int) -> _Field:
+        tokens = count_tokens(value, self.model)
+        cap = tokens if max_tokens is None else min(tokens, max(max_tokens, min_tokens))
+        f = _Field(name, value, tokens, cap, min(min_tokens, tokens))
+        self._fields.append(f)
+        return f
+
+    def _render(self, naive: bool = False) -> str:
+        def value_of(v):
+            if isinstance(v, _Field):
+                return v.text if naive else v.render(self.model)
+            if isinstance(v, dict):
+                return {k: value_of(x) for k, x in v.items()}
+            if isinstance(v, list):
+                return [value_of(x) for x in v]
+            return v
+
+        parts = []
+        for kind, content in self._sections:
+            if kind == "static":
+                parts.append(content)
+            elif kind == "text":
+                heading, f = content
+                parts.append(f"{heading}\n{value_of(f)}")
+            else:
+                heading, payload = content
+                payload = value_of(payload)
+                parts.append(f"{heading}\n{json.dumps(payload, indent=2) if naive else compact_json(payload)}")
+        return "\n\n".join(parts)
+
+    def _shrink(self, overshoot: int) -> bool:
+        """Lower the largest caps to a common level so that they give up `overshoot` tokens"""
+        reducible = sum(f.cap - f.min_tokens for f in self._fields)
+        if reducible < overshoot:
+            return False
+        low, high = 0, max(f.cap for f in self._fields)
+        while low < high:
+            level = (low + high + 1) // 2
+            if sum(max(0, f.cap - max(level, f.min_tokens)) for f in self._fields) >= overshoot:
+                low = level
+            else:
+                high = level - 1
+        for f in self._fields:
+            f.cap = min(f.cap, max(low, f.min_tokens))
+        return True
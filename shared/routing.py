@@ -0,0 +1,226 @@
+# shared/routing.py
+
+"""
+Latency-aware model routing and background upstream health probing.
+
+Router maps each call type (e.g. "generate-questions", "grading") to an
+ordered list of candidate models. pick() returns the first candidate that is
+healthy (circuit not open, error rate acceptable) and whose rolling p95
+latency is within the route's budget. If none is within budget it returns the
+fastest healthy one, and if none is healthy, the primary. Estimates come
+from LLMGateway.model_health(). A model that stops getting traffic has no
+samples once the latency window passes and is tried again. Every decision is
+counted in llm_route_decisions_total.
+
+HealthProber checks upstream on a timer (an asyncio task or a daemon thread)
+and caches the result, so health endpoints answer without an upstream
+round-trip. It can also send a tiny completion to routed models that have no
+recent samples, so fallback decisions do not go stale.
+
+Routes are configured with LLM_ROUTES, e.g.
+    "generate-questions=gpt-4,gpt-4o-mini@8;grading=gpt-4"
+where "@8" sets that route's p95 budget in seconds (default LLM_ROUTE_MAX_P95).
+"""
+
+import asyncio
+import inspect
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from .metrics import LLM_ROUTE_DECISIONS, UPSTREAM_HEALTHY, UPSTREAM_PROBE_SECONDS
+
+logger = logging.getLogger("Routing")
+
+
+@dataclass
+class Route:
+    models: List[str]
+    max_p95: float
+
+
+def routes_from_env(defaults: Dict[str, List[str]], max_p95: float) -> Dict[str, Route]:
+    routes = {call_type: Route(list(models), max_p95) for call_type, models in defaults.items()}
+    for spec in filter(None, (s.strip() for s in os.getenv("LLM_ROUTES", "").split(";"))):
+        call_type, _, rest = spec.partition("=")
+        models, _, budget = rest.partition("@")
+        routes[call_type.strip()] = Route(
+            [m.strip() for m in models.split(",") if m.strip()],
+            float(budget) if budget else max_p95,
+        )
+    return routes
+
+
+class Router:
+    def __init__(self, gateway, routes: Dict[str, Route], max_error_rate: float = 0.5, min_samples: int = 5):
+        self.gateway = gateway
+        self.routes = routes
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self._last: Dict[str, str] = {}
+
+    @classmethod
+    def from_env(cls, gateway, defaults: Dict[str, List[str]]) -> "Router":
+        """Build a router from per-service default routes, overridable with LLM_ROUTE* variables"""
+        return cls(
+            gateway,
+            routes_from_env(defaults, float(os.getenv("LLM_ROUTE_MAX_P95", "30"))),
+            max_error_rate=float(os.getenv("LLM_ROUTE_MAX_ERROR_RATE", "0.5")),
+        )
+
+    def pick(self, call_type: str) -> str:
+        route = self.routes[call_type]
+        primary = route.models[0]
+        health = {model: self.gateway.model_health(model) for model in route.models}
+        healthy = [model for model in route.models if self._is_healthy(health[model])]
+
+        if not healthy:
+            model, reason = primary, "no_healthy_model"
+        else:
+            within_budget = [m for m in healthy if health[m]["p95"] is None or health[m]["p95"] <= route.max_p95]
+            if within_budget:
+                model = within_budget[0]
+                reason = "primary" if model == primary else ("fallback_unhealthy" if primary not in healthy else "fallback_slow")
+            else:
+                model, reason = min(healthy, key=lambda m: health[m]["p95"]), "fastest"
+
+        LLM_ROUTE_DECISIONS.inc(1, call_type, model, reason)
+        if self._last.get(call_type) != model:
+            if call_type in self._last:
+                logger.warning(f"Routing {call_type} to {model} ({reason}): {health}")
+            self._last[call_type] = model
+        return model
+
+    def stale_models(self) -> List[str]:
+        """Routed models without any recent latency sample"""
+        models = dict.fromkeys(m for route in self.routes.values() for m in route.models)
+        return [m for m in models if self.gateway.model_health(m)["samples"] == 0]
+
+    def stats(self) -> dict:
+        return {
+            call_type: {
+                "models": route.models,
+                "max_p95": route.max_p95,
+                "current": self._last.get(call_type, route.models[0]),
+            }
+            for call_type, route in self.routes.items()
+        }
+
+    def _is_healthy(self, health: dict) -> bool:
+        if health["circuit"] == "open":
+            return False
+        return health["samples"] < self.min_samples or health["error_rate"] <= self.max_error_rate
+
+
+class HealthProber:
+    """
+    Run `check` every `interval` seconds and cache the outcome. `check` may be a
+    plain or an async callable. With a router and `refresh`, refresh(model) is
+    called for every routed model without recent samples (e.g. a 1-token completion).
+    """
+
+    def __init__(self, check: Callable, interval: float = 15.0, router: Optional[Router] = None, refresh: Optional[Callable] = None):
+        self.check = check
+        self.interval = interval
+        self.router = router
+        self.refresh = refresh
+        self.state = {"status": "starting", "latency_ms": None, "error": None, "checked_at": None, "consecutive_failures": 0}
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_env(cls, check: Callable, router: Optional[Router] = None, refresh: Optional[Callable] = None) -> "HealthProber":
+        """LLM_PROBE_INTERVAL sets the period; LLM_PROBE_MODELS=1 enables refresh completions"""
+        return cls(
+            check,
+            interval=float(os.getenv("LLM_PROBE_INTERVAL", "15")),
+            router=router,
+            refresh=refresh if os.getenv("LLM_PROBE_MODELS", "0") == "1" else None,
+        )
+
+    def snapshot(self) -> dict:
+        checked_at = self.state["checked_at"]
+        return {**self.state, "age_seconds": round(time.time() - checked_at, 1) if checked_at else None}
+
+    @property
+    def healthy(self) -> bool:
+        return self.state["status"] != "unhealthy"
+
+    # --- asyncio (FastAPI) ---
+
+    def start(self) -> None:
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run_async())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def probe_once(self) -> None:
+        started = time.perf_counter()
+        try:
+            result = self.check()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            self._record(started, e)
+        else:
+            self._record(started, None)
+        for model in self._stale_models():
+            try:
+                result = self.refresh(model)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.warning(f"Refresh probe for {model} failed: {e}")
+
+    async def _run_async(self) -> None:
+        while True:
+            await self.probe_once()
+            await asyncio.sleep(self.interval)
+
+    # --- Thread (uAgents) ---
+
+    def start_thread(self) -> None:
+        if self.interval <= 0:
+            return
+
+        def run():
+            while not self._stop.is_set():
+                asyncio.run(self.probe_once())
+                self._stop.wait(self.interval)
+
+        threading.Thread(target=run, name="upstream-prober", daemon=True).start()
+
+    def stop_thread(self) -> None:
+        self._stop.set()
+
+    # --- Internals ---
+
+    def _stale_models(self) -> List[str]:
+        if self.router is None or self.refresh is None:
+            return []
+        return self.router.stale_models()
+
+    def _record(self, started: float, error: Optional[Exception]) -> None:
+        elapsed = time.perf_counter() - started
+        UPSTREAM_PROBE_SECONDS.observe(elapsed)
+        UPSTREAM_HEALTHY.set(0 if error else 1)
+        failures = self.state["consecutive_failures"] + 1 if error else 0
+        if error and failures == 1:
+            logger.warning(f"Upstream health probe failed: {error}")
+        self.state = {
+            "status": "unhealthy" if error else "healthy",
+            "latency_ms": round(elapsed * 1000, 1),
+            "error": str(error) if error else None,
+            "checked_at": time.time(),
+            "consecutive_failures": failures,
+        }
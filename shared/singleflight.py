@@ -0,0 +1,66 @@
+# shared/singleflight.py
+
+"""
+Single-flight coalescing for upstream LLM calls.
+
+Concurrent callers that ask for the same key share one in-flight call: the
+first caller starts it, later callers await the same future. The result, or
+the exception, is delivered to every waiter. A waiter that is cancelled only
+stops waiting; the shared call is cancelled once no waiters are left.
+"""
+
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable, Dict
+
+
+def prompt_key(*parts: Any) -> str:
+    """Hash prompt parts after collapsing whitespace, so formatting noise maps to one key"""
+    normalized = "\x1f".join(" ".join(str(p).split()) for p in parts)
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self._waiters: Dict[str, int] = {}
+        self.counters = {"calls": 0, "coalesced": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn() once per key among concurrent callers and return its result to all of them"""
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._calls[key] = future
+            self._waiters[key] = 0
+            future.add_done_callback(lambda f, k=key: self._forget(k, f))
+            self.counters["calls"] += 1
+        else:
+            self.counters["coalesced"] += 1
+
+        self._waiters[key] += 1
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # Only abandon the shared call when the caller itself was cancelled and
+            # nobody else is waiting; if the call was cancelled, just propagate.
+            if not future.done() and self._waiters.get(key) == 1:
+                future.cancel()
+            raise
+        finally:
+            if self._calls.get(key) is future:
+                self._waiters[key] -= 1
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> dict:
+        return {**self.counters, "in_flight": self.in_flight()}
+
+    def _forget(self, key: str, future: asyncio.Future) -> None:
+        if self._calls.get(key) is future:
+            del self._calls[key]
+            del self._waiters[key]
+        # Mark the exception as retrieved when every waiter was cancelled before it arrived
+        if not future.cancelled():
+            future.exception()
@@ -0,0 +1,154 @@
+# shared/startup.py
+
+"""
+Fast cold start: lazily built upstream clients, background warm-up and a
+readiness state that is separate from liveness.
+
+With LAZY_STARTUP=1 the services do not import `openai` (or build their
+clients) at import time; LazyClient builds the client on first use. After the
+server is listening, warm_up() builds it off the event loop and opens a first
+upstream connection, so the first real request does not pay for either.
+Without LAZY_STARTUP the clients are built at import, as before.
+
+READINESS is process-wide (like metrics.REGISTRY): every service in the
+process adds its warm-up steps, and the process is ready once all of them
+have finished, a failed best-effort step (e.g. upstream unreachable) included.
+Liveness only means the process answers.
+"""
+
+import asyncio
+import inspect
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+from .metrics import STARTUP_READY_SECONDS
+
+logger = logging.getLogger("Startup")
+
+LAZY_STARTUP = os.getenv("LAZY_STARTUP", "0") == "1"
+
+
+def process_started_at() -> float:
+    """Wall-clock start of this process (Linux, 10ms resolution), else the import of this module"""
+    try:
+        with open("/proc/self/stat", "r") as f:
+            # Field 22, after the parenthesised command name: start time in clock ticks since boot
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime", "r") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - (uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return _IMPORTED_AT
+
+
+_IMPORTED_AT = time.time()
+
+
+class LazyClient:
+    """Proxy that builds the wrapped client with `factory` on first attribute access"""
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def built(self) -> bool:
+        return self._client is not None
+
+    def resolve(self) -> Any:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.resolve(), name)
+
+
+class Readiness:
+    def __init__(self):
+        self.started_at = process_started_at()
+        self.ready_at: Optional[float] = None
+        self._steps: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, best_effort: bool = False) -> None:
+        with self._lock:
+            self._steps[name] = {"status": "pending", "best_effort": best_effort, "error": None, "seconds": None}
+            self.ready_at = None
+
+    def finish(self, name: str, error: Optional[BaseException] = None, seconds: Optional[float] = None) -> None:
+        with self._lock:
+            self._steps[name].update(status="failed" if error else "ok", error=str(error) if error else None, seconds=seconds)
+            if self.ready_at is None and self._all_done():
+                self.ready_at = time.time()
+                STARTUP_READY_SECONDS.set(self.ready_at - self.started_at)
+                logger.info(f"Ready {self.ready_at - self.started_at:.2f}s after process start")
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_at is not None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            steps = {name: dict(step) for name, step in self._steps.items()}
+        return {
+            "ready": self.ready,
+            "uptime_seconds": round(time.time() - self.started_at, 3),
+            "ready_after_seconds": round(self.ready_at - self.started_at, 3) if self.ready_at else None,
+            "steps": steps,
+        }
+
+    def _all_done(self) -> bool:
+        return all(
+            step["status"] == "ok" or (step["best_effort"] and step["status"] == "failed")
+            for step in self._steps.values()
+        )
+
+
+READINESS = Readiness()
+
+
+def probe_step(prober) -> Callable:
+    """Warm-up step running the HealthProber's first probe, which opens a pooled upstream connection"""
+    async def probe():
+        await prober.probe_once()
+        if not prober.healthy:
+            raise RuntimeError(prober.state["error"])
+    return probe
+
+
+async def warm_up(steps: Sequence[Tuple[str, Callable]], readiness: Readiness = READINESS) -> bool:
+    """
+    Run warm-up steps in order: plain callables in a thread (off the event loop), coroutine
+    functions on it. Stops at the first failed step that is not best-effort; returns success.
+    """
+    for name, step in steps:
+        started = time.perf_counter()
+        try:
+            if inspect.iscoroutinefunction(step):
+                await step()
+            else:
+                await asyncio.to_thread(step)
+        except Exception as e:
+            readiness.finish(name, e, round(time.perf_counter() - started, 3))
+            logger.warning(f"Warm-up step {name} failed: {e}")
+            if not readiness.snapshot()["steps"][name]["best_effort"]:
+                return False
+        else:
+            readiness.finish(name, seconds=round(time.perf_counter() - started, 3))
+    return True
+
+
+def start_warm_up_thread(steps: Sequence[Tuple[str, Callable]], then: Optional[Callable[[], None]] = None) -> None:
+    """warm_up() on a daemon thread (uAgents); `then` runs after it succeeded, e.g. to start the prober"""
+    def run():
+        if asyncio.run(warm_up(steps)) and then is not None:
+            then()
+
+    threading.Thread(target=run, name="warm-up", daemon=True).start()
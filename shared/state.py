@@ -0,0 +1,152 @@
+# shared/state.py
+
+"""
+Cross-process state on one host, in a SQLite file in WAL mode.
+
+When a service runs as several worker processes (see deploy/serve.py), state
+that must be consistent across them lives here instead of in module globals:
+LLM rate-limit buckets, answer keys, adaptive screening sessions and leases
+that keep background work (question pool fills) from running in every worker
+at once. Values are JSON documents grouped by namespace, with an optional TTL.
+
+update() is an atomic read-modify-write (BEGIN IMMEDIATE), so concurrent
+writers in different processes never lose each other's changes. Each process
+opens its own connection, including processes forked after the store was
+created.
+
+Set SHARED_STATE_PATH to share a file. Without it the store is an in-memory
+database private to the process, which keeps single-process deployments free
+of disk I/O.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Optional
+
+MEMORY = ":memory:"
+
+
+class StateStore:
+    def __init__(self, path: str = MEMORY):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> "StateStore":
+        return cls(os.getenv("SHARED_STATE_PATH") or MEMORY)
+
+    @property
+    def shared(self) -> bool:
+        return self.path != MEMORY
+
+    # --- Public API ---
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        with self._lock:
+            return self._read(self._connection(), namespace, key)
+
+    def put(self, namespace: str, key: str, value: Any, ttl: float = 0) -> None:
+        with self._transaction() as conn:
+            self._write(conn, namespace, key, value, ttl)
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def update(self, namespace: str, key: str, fn: Callable[[Optional[Any]], Any], ttl: Optional[float] = 0) -> Any:
+        """
+        Atomically replace the value with fn(current value or None) and return the new value.
+        An exception raised by fn aborts the update and propagates. ttl=None keeps the current expiry.
+        """
+        with self._transaction() as conn:
+            new_value = fn(self._read(conn, namespace, key))
+            if ttl is None:
+                conn.execute("UPDATE state SET value = ? WHERE namespace = ? AND key = ?", (json.dumps(new_value), namespace, key))
+            else:
+                self._write(conn, namespace, key, new_value, ttl)
+        return new_value
+
+    def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        """Take (or renew) the lease `name` for `owner` unless another owner holds an unexpired one"""
+        with self._transaction() as conn:
+            holder = self._read(conn, "leases", name)
+            if holder is not None and holder != owner:
+                return False
+            self._write(conn, "leases", name, owner, ttl)
+            return True
+
+    def release(self, name: str, owner: str) -> None:
+        with self._transaction() as conn:
+            if self._read(conn, "leases", name) == owner:
+                conn.execute("DELETE FROM state WHERE namespace = 'leases' AND key = ?", (name,))
+
+    def purge(self) -> int:
+        """Delete expired entries; returns how many"""
+        with self._transaction() as conn:
+            return conn.execute(
+                "DELETE FROM state WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+            ).rowcount
+
+    def count(self, namespace: str) -> int:
+        with self._lock:
+            return self._connection().execute(
+                "SELECT COUNT(*) FROM state WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, time.time()),
+            ).fetchone()[0]
+
+    # --- Internals ---
+
+    def _connection(self) -> sqlite3.Connection:
+        # A connection must not be used across fork; each process opens its own
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+            if self.shared:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS state (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    expires_at REAL,
+                    PRIMARY KEY (namespace, key)
+                )
+                """
+            )
+            self._pid = os.getpid()
+        return self._conn
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    @staticmethod
+    def _read(conn: sqlite3.Connection, namespace: str, key: str) -> Optional[Any]:
+        row = conn.execute(
+            "SELECT value, expires_at FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return json.loads(row[0])
+
+    @staticmethod
+    def _write(conn: sqlite3.Connection, namespace: str, key: str, value: Any, ttl: float) -> None:
+        conn.execute(
+            "INSERT OR REPLACE INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, json.dumps(value), time.time() + ttl if ttl > 0 else None),
+        )
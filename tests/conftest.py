@@ -0,0 +1,11 @@
+# tests/conftest.py
+
+"""Put the repo root (for `shared`) and the service directories on sys.path, as the services do at startup."""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "agents"), os.path.join(ROOT, "screening-service")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
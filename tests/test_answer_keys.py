@@ -0,0 +1,73 @@
+# tests/test_answer_keys.py
+
+import json
+from types import SimpleNamespace
+
+from answer_keys import AnswerKeyStore, match_option
+
+
+def question(id, text, type="multiple-choice", options=("red", "green", "blue")):
+    return SimpleNamespace(id=id, question=text, type=type, options=list(options))
+
+
+GENERATED = [
+    {"question": "Which color is the sky?", "type": "multiple-choice", "options": ["red", "green", "blue"], "correctAnswer": "C"},
+    {"question": "Explain your labeling choice.", "type": "short-answer"},
+]
+
+
+def test_match_option_accepts_text_letters_and_numbers():
+    options = ["Positive", "Negative", "Neutral"]
+    assert [match_option(a, options) for a in ("negative.", "b)", "Option C", "1", "4", "maybe")] == [1, 1, 2, 0, None, None]
+
+
+def test_multiple_choice_is_graded_locally():
+    store = AnswerKeyStore()
+    store.record("p1", GENERATED)
+    questions = [question(1, "which color is the SKY?"), question(2, "Explain your labeling choice.", "short-answer")]
+    answers = [SimpleNamespace(questionId=1, answer="blue"), SimpleNamespace(questionId=2, answer="because")]
+    local, remaining = store.grade_locally("p1", questions, answers)
+    assert local[1]["score"] == 100
+    assert [q.id for q in remaining] == [2]
+    # Keys are per project
+    assert store.lookup("p2", "Which color is the sky?") is None
+
+
+def test_served_requires_every_question_to_come_from_the_service():
+    store = AnswerKeyStore()
+    store.record("p1", GENERATED)
+    assert store.served("p1", ["Which color is the sky?", "explain your labeling choice"])
+    assert not store.served("p1", ["Which color is the sky?", "What is 1+1?"])
+    assert not store.served("p2", ["Which color is the sky?"])
+    assert not store.served("p1", [])
+
+
+def test_keys_for_carries_provenance_to_another_store():
+    store = AnswerKeyStore()
+    store.record("p1", GENERATED)
+    keys = store.keys_for("p1", [question(1, "Which color is the sky?"), question(2, "Explain your labeling choice.", "short-answer")])
+    worker = AnswerKeyStore()
+    worker.restore("p1", keys)
+    assert worker.lookup("p1", "Which color is the sky?") == 2
+    assert worker.lookup("p1", "Explain your labeling choice.") is None
+    assert worker.served("p1", ["Which color is the sky?", "Explain your labeling choice."])
+
+
+def test_least_recently_used_projects_are_evicted():
+    store = AnswerKeyStore(max_projects=2)
+    for project in ("p1", "p2"):
+        store.record(project, GENERATED)
+    store.lookup("p1", "Which color is the sky?")
+    store.record("p3", GENERATED)
+    assert store.lookup("p2", "Which color is the sky?") is None
+    assert store.lookup("p1", "Which color is the sky?") == 2
+
+
+def test_keys_are_written_in_the_background_and_flushed(tmp_path):
+    path = tmp_path / "keys.json"
+    store = AnswerKeyStore(persist_path=str(path), flush_interval=60)
+    store.record("p1", GENERATED)
+    assert not path.exists()
+    store.flush()
+    assert json.loads(path.read_text())["p1"]["which color is the sky?"] == 2
+    assert AnswerKeyStore(persist_path=str(path)).lookup("p1", "Which color is the sky?") == 2
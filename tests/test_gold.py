@@ -0,0 +1,99 @@
+# tests/test_gold.py
+
+import itertools
+
+import numpy as np
+import pytest
+
+from gold import compare_to_gold, linear_sum_assignment, match, overlapping_pairs
+
+
+def brute_force_assignment_cost(cost: np.ndarray) -> float:
+    n, m = cost.shape
+    if n <= m:
+        return min(cost[range(n), list(cols)].sum() for cols in itertools.permutations(range(m), n))
+    return min(cost[list(rows), range(m)].sum() for rows in itertools.permutations(range(n), m))
+
+
+def random_boxes(rng: np.random.Generator, n: int, extent: float, max_size: float) -> np.ndarray:
+    corners = rng.random((n, 2)) * extent
+    return np.hstack([corners, corners + rng.random((n, 2)) * max_size])
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_linear_sum_assignment_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    for _ in range(10):
+        n, m = map(int, rng.integers(1, 6, 2))
+        cost = rng.random((n, m)) * 10
+        rows, cols = linear_sum_assignment(cost)
+        assert len(rows) == len(cols) == min(n, m)
+        assert len(set(rows.tolist())) == len(rows) and len(set(cols.tolist())) == len(cols)
+        assert list(rows) == sorted(rows)
+        assert cost[rows, cols].sum() == pytest.approx(brute_force_assignment_cost(cost))
+
+
+def test_linear_sum_assignment_handles_ties_and_negative_costs():
+    cost = -np.ones((3, 3))
+    rows, cols = linear_sum_assignment(cost)
+    assert sorted(cols.tolist()) == [0, 1, 2]
+    assert cost[rows, cols].sum() == -3
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_overlapping_pairs_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    a = random_boxes(rng, 30, 100, 30)
+    b = random_boxes(rng, 40, 100, 30)
+    rows, cols = overlapping_pairs(a, b)
+    expected = {
+        (i, j) for i in range(len(a)) for j in range(len(b))
+        if a[i, 0] <= b[j, 2] and b[j, 0] <= a[i, 2] and a[i, 1] <= b[j, 3] and b[j, 1] <= a[i, 3]
+    }
+    assert set(zip(rows.tolist(), cols.tolist())) == expected
+    assert len(rows) == len(expected)
+
+
+def test_overlapping_pairs_edge_cases():
+    empty = np.zeros((0, 4))
+    box = np.array([[0.0, 0.0, 1.0, 1.0]])
+    assert all(len(x) == 0 for x in overlapping_pairs(empty, box))
+    assert all(len(x) == 0 for x in overlapping_pairs(box, empty))
+    # Touching edges count as intersecting; degenerate (zero-size) boxes are still found
+    touching = np.array([[1.0, 0.0, 2.0, 1.0], [5.0, 5.0, 5.0, 5.0]])
+    rows, cols = overlapping_pairs(np.array([[0.0, 0.0, 1.0, 1.0], [4.0, 4.0, 6.0, 6.0]]), touching)
+    assert set(zip(rows.tolist(), cols.tolist())) == {(0, 0), (1, 1)}
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_match_is_a_maximum_weight_matching(seed):
+    rng = np.random.default_rng(seed)
+    for _ in range(10):
+        n, m = map(int, rng.integers(1, 5, 2))
+        weight = rng.random((n, m))
+        rows, cols = np.nonzero(rng.random((n, m)) < 0.5)
+        chosen = match(rows, cols, weight[rows, cols])
+        assert len(set(rows[chosen].tolist())) == len(chosen) == len(set(cols[chosen].tolist()))
+        edges = list(zip(rows.tolist(), cols.tolist()))
+        best = 0.0
+        for k in range(1, min(n, m) + 1):
+            for subset in itertools.combinations(edges, k):
+                if len({r for r, _ in subset}) == k and len({c for _, c in subset}) == k:
+                    best = max(best, sum(weight[e] for e in subset))
+        assert weight[rows[chosen], cols[chosen]].sum() == pytest.approx(best)
+
+
+def test_compare_to_gold_counts_matches_by_label():
+    report = compare_to_gold(
+        [("car", [0, 0, 10, 10], None), ("bus", [20, 20, 30, 30], None)],
+        [("car", [0, 0, 10, 10], None), ("car", [20, 20, 30, 30], None), ("car", [50, 50, 60, 60], None)],
+    )
+    assert report.true_positives == 1
+    assert report.num_submitted == 2 and report.num_gold == 3
+
+
+def test_compare_to_gold_polygon_against_box():
+    square = [[0, 0], [10, 0], [10, 10], [0, 10]]
+    report = compare_to_gold([("car", [0, 0, 10, 10], None)], [("car", None, square)])
+    assert report.true_positives == 1
+    assert report.mean_iou == pytest.approx(1.0, abs=0.05)
@@ -0,0 +1,70 @@
+# tests/test_jobqueue.py
+
+import pickle
+
+import pytest
+
+from shared.jobqueue import JobQueue, QueueFullError
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.sqlite3"), max_attempts=2, max_queued=3)
+
+
+def test_identical_submissions_share_a_job(queue):
+    job, deduplicated = queue.submit("assess", {"x": 1}, "http://hook/a")
+    again, deduplicated_again = queue.submit("assess", {"x": 1}, "http://hook/b")
+    other, _ = queue.submit("assess", {"x": 2})
+    assert not deduplicated and deduplicated_again
+    assert again["id"] == job["id"] != other["id"]
+    assert queue.get(job["id"])["callbacks"] == ["http://hook/a", "http://hook/b"]
+
+
+def test_claim_complete(queue):
+    job, _ = queue.submit("assess", {"x": 1})
+    claimed = queue.claim("host:1", ["assess"])
+    assert claimed["id"] == job["id"] and claimed["attempts"] == 1
+    assert queue.claim("host:2", ["assess"]) is None
+    # Only the owner can finish it
+    assert queue.complete(job["id"], "host:2", {"ok": True}) is None
+    finished = queue.complete(job["id"], "host:1", {"ok": True})
+    assert (finished["status"], finished["result"]) == ("succeeded", {"ok": True})
+    assert queue.counts() == {"assess": {"succeeded": 1}}
+
+
+def test_failures_are_retried_until_attempts_run_out(queue):
+    job, _ = queue.submit("assess", {"x": 1})
+    queue.claim("host:1", ["assess"])
+    retried = queue.fail(job["id"], "host:1", "upstream 503")
+    assert retried["status"] == "queued" and retried["error"] == "upstream 503"
+    # Requeued with backoff
+    assert queue.claim("host:1", ["assess"]) is None
+
+
+def test_unretryable_failure_finishes_the_job(queue):
+    job, _ = queue.submit("assess", {"x": 1})
+    queue.claim("host:1", ["assess"])
+    failed = queue.fail(job["id"], "host:1", "malformed output", retry=False)
+    assert failed["status"] == "failed" and failed["error"] == "malformed output"
+
+
+def test_jobs_of_dead_workers_are_requeued(queue):
+    job, _ = queue.submit("assess", {"x": 1})
+    queue.claim("host:1", ["assess"])
+    assert queue.requeue_dead(lambda owner: owner != "host:1") == 1
+    claimed = queue.claim("host:2", ["assess"])
+    assert claimed["id"] == job["id"] and claimed["attempts"] == 2
+
+
+def test_queue_rejects_submissions_when_full(queue):
+    for i in range(3):
+        queue.submit("assess", {"x": i})
+    with pytest.raises(QueueFullError):
+        queue.submit("assess", {"x": 3})
+
+
+def test_queue_pickles_without_its_connection(queue):
+    job, _ = queue.submit("assess", {"x": 1})
+    copy = pickle.loads(pickle.dumps(queue))
+    assert copy.get(job["id"])["status"] == "queued"
@@ -0,0 +1,195 @@
+# tests/test_llm_gateway.py
+
+import asyncio
+import time
+
+import pytest
+
+from shared.llm_gateway import (
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceededError,
+    LLMGateway,
+    ModelLimits,
+    SharedTokenBucket,
+    TokenBucket,
+)
+from shared.state import StateStore
+
+
+@pytest.fixture(params=["local", "shared"])
+def store(request, tmp_path):
+    return StateStore(str(tmp_path / "state.sqlite3")) if request.param == "shared" else None
+
+
+def make_bucket(store, rate_per_minute):
+    if store is None:
+        return TokenBucket(rate_per_minute)
+    return SharedTokenBucket(store, "test", rate_per_minute)
+
+
+class FailingClient:
+    """Client whose every call fails with a non-retryable error"""
+
+    def __init__(self):
+        self.calls = 0
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        self.calls += 1
+        raise ValueError("bad request")
+
+
+class AsyncFailingClient(FailingClient):
+    async def create(self, **kwargs):
+        return super().create(**kwargs)
+
+
+class AsyncSlowClient(FailingClient):
+    async def create(self, **kwargs):
+        self.calls += 1
+        return None
+
+
+# --- Token buckets ---
+
+def test_bucket_reserve_waits_once_empty(store):
+    bucket = make_bucket(store, 60)
+    assert bucket.reserve(60) == 0.0
+    assert bucket.reserve(1) == pytest.approx(1.0, abs=0.1)
+    # Waiters queue up behind each other
+    assert bucket.reserve(1) == pytest.approx(2.0, abs=0.1)
+
+
+def test_bucket_adjust_returns_capacity(store):
+    bucket = make_bucket(store, 60)
+    bucket.reserve(60)
+    bucket.adjust(60)
+    assert bucket.reserve(1) == 0.0
+    # Never above capacity
+    bucket.adjust(1000)
+    assert bucket.reserve(60) == 0.0
+    assert bucket.reserve(1) > 0
+
+
+def test_bucket_reservation_is_capped_at_capacity(store):
+    bucket = make_bucket(store, 60)
+    assert bucket.reserve(1000) == 0.0
+    assert bucket.reserve(1) == pytest.approx(1.0, abs=0.1)
+
+
+def test_shared_bucket_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    first = SharedTokenBucket(StateStore(path), "rpm", 60)
+    second = SharedTokenBucket(StateStore(path), "rpm", 60)
+    first.reserve(60)
+    assert second.reserve(1) == pytest.approx(1.0, abs=0.1)
+
+
+# --- Circuit breaker ---
+
+def test_breaker_opens_after_consecutive_failures_and_probes_after_cooldown():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=0.05)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.06)
+    breaker.before_call()
+    assert breaker.state == "half-open"
+    # Only one probe at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+
+def test_breaker_reopens_when_probe_fails_and_released_probe_frees_slot():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.release_probe()
+    breaker.before_call()
+    assert breaker.state == "half-open"
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+# --- Gateway reservations ---
+
+def gateway(client, store, rpm=1_000_000, tpm=1_000_000):
+    return LLMGateway(client, limits={"m": ModelLimits(rpm=rpm, tpm=tpm)}, state=store, failure_threshold=1000)
+
+
+def test_failed_calls_refund_their_token_estimate(store):
+    client = FailingClient()
+    llm = gateway(client, store, tpm=5000)
+    for _ in range(50):
+        with pytest.raises(ValueError):
+            llm.complete(deadline=time.monotonic() + 5, model="m", messages=[{"content": "x"}], max_tokens=1000)
+    assert client.calls == 50
+    assert llm._state("m").tokens.reserve(1) == 0.0
+
+
+def test_failed_async_calls_refund_their_token_estimate(store):
+    client = AsyncFailingClient()
+    llm = gateway(client, store, tpm=5000)
+
+    async def run():
+        for _ in range(50):
+            with pytest.raises(ValueError):
+                await llm.acomplete(deadline=time.monotonic() + 5, model="m", messages=[{"content": "x"}], max_tokens=1000)
+
+    asyncio.run(run())
+    assert client.calls == 50
+    assert llm._state("m").tokens.reserve(1) == 0.0
+
+
+def test_abandoned_waits_refund_their_reservation(store):
+    client = FailingClient()
+    llm = gateway(client, store, rpm=60)
+    llm._state("m").requests.reserve(60)
+    for _ in range(20):
+        with pytest.raises(DeadlineExceededError):
+            llm.complete(deadline=time.monotonic() + 0.2, model="m", messages=[{"content": "x"}], max_tokens=1)
+    assert client.calls == 0
+    # Without the refunds the bucket would be 20 requests (20 seconds) in debt
+    assert llm._state("m").requests.reserve(1) == pytest.approx(1.0, abs=0.2)
+
+
+def test_cancelled_wait_refunds_its_reservation(store):
+    client = AsyncSlowClient()
+    llm = gateway(client, store, rpm=60)
+    llm._state("m").requests.reserve(60)
+
+    async def run():
+        task = asyncio.create_task(llm.acomplete(model="m", messages=[{"content": "x"}], max_tokens=1))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert client.calls == 0
+    assert llm._state("m").requests.reserve(1) == pytest.approx(1.0, abs=0.2)
+    assert llm.queue_depth() == 0
@@ -0,0 +1,46 @@
+# tests/test_qualifications.py
+
+import pytest
+
+from qualifications import QualificationStore
+
+INSTRUCTION = "Annotate medical review text with sentiment labels: positive, negative or neutral."
+
+
+@pytest.fixture
+def store(tmp_path):
+    return QualificationStore(str(tmp_path / "qualifications.sqlite3"), validity_seconds=100, half_life_seconds=10)
+
+
+def test_pass_qualifies_for_same_and_similar_instructions(store):
+    store.record("u1", "p1", INSTRUCTION, 90, "passed", now=1000)
+    same = store.lookup("u1", "p1", INSTRUCTION, now=1010)
+    assert same["same_project"] and same["similarity"] == 1.0 and same["expires_at"] == 1100
+    similar = store.lookup("u1", "p2", "annotate medical review text with sentiment labels positive negative or neutral", now=1010)
+    assert similar is not None and not similar["same_project"]
+    assert store.lookup("u1", "p3", "Draw bounding boxes around cars", now=1010) is None
+    assert store.lookup("u2", "p1", INSTRUCTION, now=1010) is None
+
+
+def test_qualification_expires_and_later_failure_overrides(store):
+    store.record("u1", "p1", INSTRUCTION, 90, "passed", now=1000)
+    assert store.lookup("u1", "p1", INSTRUCTION, now=1101) is None
+    store.record("u1", "p1", INSTRUCTION, 40, "failed", now=1050)
+    assert store.lookup("u1", "p1", INSTRUCTION, now=1060) is None
+
+
+def test_reputation_decays_older_scores(store):
+    store.record("u1", "p1", INSTRUCTION, 100, "passed", now=0)
+    store.record("u1", "p2", INSTRUCTION, 50, "failed", now=10)
+    reputation = store.reputation("u1", now=10)
+    assert (reputation["screenings"], reputation["passes"], reputation["mean_score"]) == (2, 1, 75.0)
+    # The older score counts half after one half-life
+    assert reputation["decayed_score"] == pytest.approx((100 * 0.5 + 50) / 1.5, abs=0.01)
+    assert store.reputation("nobody") is None
+
+
+def test_min_reputation_gates_qualification(tmp_path):
+    store = QualificationStore(str(tmp_path / "q.sqlite3"), validity_seconds=100, min_reputation=80)
+    store.record("u1", "p1", INSTRUCTION, 50, "failed", now=0)
+    store.record("u1", "p2", INSTRUCTION + " Be careful.", 75, "passed", now=1)
+    assert store.lookup("u1", "p3", INSTRUCTION + " Be careful.", now=2) is None
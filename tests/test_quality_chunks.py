@@ -0,0 +1,121 @@
+# tests/test_quality_chunks.py
+
+import asyncio
+import importlib
+import json
+
+import pytest
+
+from chunking import Chunk, ChunkAssessment, reduce_assessments, sample_chunks, split_output
+from shared.result_cache import ResultCache
+
+
+@pytest.fixture(scope="module")
+def quality():
+    # Settings are read at import: no job workers and no default cache file next to the agent
+    with pytest.MonkeyPatch.context() as env:
+        env.setenv("QUALITY_CACHE_PATH", "")
+        env.setenv("QUALITY_JOB_WORKERS", "0")
+        env.setenv("QUALITY_METRICS_PORT", "0")
+        env.setenv("OPENAI_API_KEY", "test")
+        env.setenv("ASI_API_KEY", "test")
+        # The agent looks up the current event loop at import; asyncio.run() in earlier tests leaves none
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        yield importlib.import_module("quality")
+
+
+@pytest.fixture
+def assess(quality, monkeypatch, tmp_path):
+    """Chunked assessment with a fake LLM call; returns (run, calls, failing parts)"""
+    calls = []
+    failing = set()
+    models = {}
+
+    def fake(instructions, output, rubric, gateway, part=None):
+        calls.append(part)
+        if part in failing:
+            raise RuntimeError("upstream 503")
+        return {"quality_feedback": "ok", "quality_score": 80, "model": models.get(part, quality.ASSESSMENT_MODEL)}
+
+    monkeypatch.setattr(quality, "assess_output_sync", fake)
+    monkeypatch.setattr(quality, "QUALITY_CHUNK_CHARS", 100)
+    monkeypatch.setattr(quality, "QUALITY_CHUNK_SAMPLE", 0)
+    monkeypatch.setattr(quality, "result_cache", ResultCache(str(tmp_path / "cache.sqlite3")))
+    request = quality.TaskAssessmentRequest(task_instructions="Label lines", completed_output="\n".join(["line of output text"] * 30))
+
+    def run():
+        return asyncio.run(quality.run_assessment(request))
+
+    return run, calls, failing, models
+
+
+def test_complete_chunked_result_is_cached(assess):
+    run, calls, _, _ = assess
+    first = run()
+    chunks = len(calls)
+    assert first.status == "success" and chunks > 1
+    assert run().quality_score == first.quality_score
+    assert len(calls) == chunks
+
+
+def test_partial_chunked_result_is_not_cached(assess):
+    run, calls, failing, _ = assess
+    failing.add("part 2 of 6 (5 records or lines)")
+    partial = run()
+    assert partial.status == "success"
+    assert "1 could not be assessed" in partial.quality_feedback
+    chunks = len(calls)
+
+    # Once the upstream recovers, the output is assessed again (in full) and that result is cached
+    failing.clear()
+    full = run()
+    assert "could not be assessed" not in full.quality_feedback
+    assert len(calls) == 2 * chunks
+    run()
+    assert len(calls) == 2 * chunks
+
+
+def test_chunked_result_from_a_fallback_model_is_not_cached(assess):
+    run, calls, _, models = assess
+    models["part 1 of 6 (5 records or lines)"] = "fallback-model"
+    run()
+    chunks = len(calls)
+    run()
+    assert len(calls) == 2 * chunks
+
+
+def test_every_chunk_failing_is_an_error(assess):
+    run, calls, failing, _ = assess
+    failing.update(f"part {i} of 6 (5 records or lines)" for i in range(1, 7))
+    assert run().status == "error"
+
+
+# --- chunking helpers ---
+
+def test_split_output_keeps_records_whole():
+    records = [{"id": i, "text": "x" * 20} for i in range(10)]
+    chunks = split_output(json.dumps(records), 100)
+    assert [json.loads(line) for chunk in chunks for line in chunk.text.split("\n")] == records
+    assert all(len(chunk.text) <= 100 for chunk in chunks)
+    assert [chunk.index for chunk in chunks] == list(range(len(chunks)))
+
+
+def test_sample_chunks_is_stratified_and_deterministic():
+    chunks = [Chunk(i, f"chunk {i}", 1) for i in range(20)]
+    sample = sample_chunks(chunks, 4, "output")
+    assert [c.index // 5 for c in sample] == [0, 1, 2, 3]
+    assert sample == sample_chunks(chunks, 4, "output")
+    assert sample_chunks(chunks, 0, "output") == chunks
+
+
+def test_reduce_assessments_weights_by_size_and_skips_failures():
+    assessments = [
+        ChunkAssessment(Chunk(0, "a" * 30, 1), 100, "good"),
+        ChunkAssessment(Chunk(1, "a" * 10, 1), 60, "weak"),
+        ChunkAssessment(Chunk(2, "a" * 50, 1), error="timeout"),
+    ]
+    reduced = reduce_assessments(assessments, 3)
+    assert reduced["quality_score"] == 90
+    assert "1 could not be assessed" in reduced["quality_feedback"]
+    with pytest.raises(ValueError):
+        reduce_assessments([assessments[2]], 3)
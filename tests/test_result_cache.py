@@ -0,0 +1,47 @@
+# tests/test_result_cache.py
+
+import time
+
+from shared.result_cache import ResultCache, content_key
+
+
+def test_content_key_is_stable_and_order_sensitive():
+    assert content_key("a", {"x": 1, "y": 2}) == content_key("a", {"y": 2, "x": 1})
+    assert content_key("a", "b") != content_key("b", "a")
+
+
+def test_get_put_and_stats(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.sqlite3"))
+    assert cache.get("k") is None
+    cache.put("k", {"quality_score": 80})
+    assert cache.get("k") == {"quality_score": 80}
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    cache.put("a", 1)
+    time.sleep(0.01)
+    cache.put("b", 2)
+    time.sleep(0.01)
+    cache.get("a")
+    time.sleep(0.01)
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=0.05)
+    cache.put("k", 1)
+    time.sleep(0.1)
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_entries_survive_reopening(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    ResultCache(path).put("k", [1, 2])
+    assert ResultCache(path).get("k") == [1, 2]